@@ -0,0 +1,302 @@
+"""
+Benchmarks for excel2py, using synthetic workbooks so that Excel isn't needed
+
+For each scenario this generates a workbook, generates Python from it and
+measures:
+ - generation_seconds: ExcelToPy.generate()
+ - parse_formulae_per_second: parsing and translating the distinct formulae
+ - runtime_import_seconds: importing excel2py.runtime in a fresh interpreter
+ - import_seconds: importing the generated module, once the runtime is imported
+ - calculate_seconds: construct the class and calculate() once (median)
+ - batch_rows_per_second: calculate() over many sets of inputs
+
+Results are compared with a stored baseline. The exit status is 1 if any
+measure is worse than the baseline by more than the threshold. Timings
+depend on the machine, so the baseline isn't in the repository: make one
+with --save-baseline on the machine which runs the comparison, e.g. a CI
+job which runs the benchmarks on the main branch first and keeps the file.
+
+--cells, --ranges and the other size options change the scenarios' sizes.
+Results for changed sizes are stored and compared under their own names,
+e.g. 'small[cells=5000]'.
+
+Usage, from the repository root:
+    python -m benchmarks.run_benchmarks [scenario ...] [--save-baseline] [--threshold 0.2]
+        [--cells N] [--depth N] [--table-rows N] [--table-columns N] [--ranges N] [--range-rows N]
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from excel2py.config import config
+from excel2py.excel_to_py import ExcelToPy
+from excel2py.expression_parser import expression_parser
+from excel2py.pythonify import Pythonify
+from benchmarks.synthetic_workbook import synthetic_workbook
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+SCENARIOS = {
+    'small': dict(cells=200, depth=5, table_rows=20, table_columns=3),
+    'deep': dict(cells=1000, depth=100, table_rows=20, table_columns=3),
+    'wide': dict(cells=5000, depth=10, table_rows=500, table_columns=6),
+    'ranges': dict(cells=200, depth=5, table_rows=20, table_columns=3, ranges=10, range_rows=1000),
+}
+
+# synthetic_workbook() settings which can be changed from the command line
+SIZES = ('cells', 'depth', 'table_rows', 'table_columns', 'ranges', 'range_rows')
+
+# Measures where bigger is better. For the rest, smaller is better.
+HIGHER_IS_BETTER = {'parse_formulae_per_second', 'batch_rows_per_second'}
+
+
+class SyntheticExcelToPy(ExcelToPy):
+    """
+    ExcelToPy reading a synthetic workbook instead of one open in Excel.
+    """
+    def __init__(self, config, book):
+        self.book = book
+        super().__init__(config)
+
+    def _connect_to_excel(self):
+        return None, self.book
+
+
+def synthetic_config(directory, settings):
+    """
+    :param directory: where to write the generated module
+    :param settings: inputs, outputs and input_types from synthetic_workbook()
+    :return: config for ExcelToPy
+    """
+    cfg = config(__doc__, [os.path.join(directory, 'synthetic.xlsx')])
+    cfg.input_sheets = {'Inputs'}
+    cfg.output_sheets = {'Results'}
+    cfg.inputs = settings['inputs']
+    cfg.outputs = settings['outputs']
+    cfg.input_types = settings['input_types']
+    cfg.imports = ''
+    cfg.globals = set()
+    return cfg
+
+
+def generate(directory, book, settings):
+    """
+    :return: (config, ExcelToPy, seconds to generate)
+    """
+    cfg = synthetic_config(directory, settings)
+    app = SyntheticExcelToPy(cfg, book)
+    start = time.perf_counter()
+    app.generate()
+    return cfg, app, time.perf_counter() - start
+
+
+def parse_throughput(app, book):
+    """
+    :return: formulae parsed and translated per second
+    """
+    parser = expression_parser()
+    pythonify = Pythonify(set(), dict(app.pythonify.aliases), dict(app.pythonify.types))
+    formulae = sorted(app.formulae)
+    start = time.perf_counter()
+    for formula in formulae:
+        pythonify.sheet = 'Calc'
+        parser.parse(formula, semantics=pythonify)
+    return len(formulae) / (time.perf_counter() - start)
+
+
+def import_seconds(cfg, repeats=3):
+    """
+    Import the generated module in a fresh interpreter, without cached bytecode.
+
+    The runtime package is imported first so that only the generated module is timed.
+    :return: the fastest time, in seconds
+    """
+    directory, file_name = os.path.split(cfg.output)
+    module = os.path.splitext(file_name)[0]
+    return _fresh_import_seconds("import excel2py.runtime\n", f"import {module}\n", directory, repeats)
+
+
+def runtime_import_seconds(repeats=3):
+    """
+    Import excel2py.runtime in a fresh interpreter: what a short-lived worker pays to run any model
+
+    :return: the fastest time, in seconds
+    """
+    return _fresh_import_seconds("", "import excel2py.runtime\n", None, repeats)
+
+
+def _fresh_import_seconds(setup, statement, directory, repeats):
+    """
+    :param setup: code to run before timing
+    :param statement: the import to time
+    :param directory: added to the path, or None
+    :return: the fastest time, in seconds
+    """
+    code = (
+        "import sys, time\n"
+        "sys.dont_write_bytecode = True\n"
+        f"{setup}"
+        "start = time.perf_counter()\n"
+        f"{statement}"
+        "print(time.perf_counter() - start)\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [directory, root])))
+    times = []
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True)
+        times.append(float(result.stdout))
+    return min(times)
+
+
+def load_class(cfg):
+    directory, file_name = os.path.split(cfg.output)
+    module_name = os.path.splitext(file_name)[0]
+    sys.modules.pop(module_name, None)  # a module of the same name from another scenario
+    sys.path.insert(0, directory)
+    try:
+        module = importlib.import_module(module_name)
+    finally:
+        sys.path.remove(directory)
+    return getattr(module, cfg.gen_class_name)
+
+
+def calculate_seconds(calc_class, inputs, repeats=20):
+    """
+    :return: median time to construct and calculate()
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        calc_class(**inputs).calculate()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def batch_rows_per_second(calc_class, inputs, rows=500):
+    """
+    :return: rows calculated per second, each row with different inputs
+    """
+    batch = [
+        {name: value + row / rows for name, value in inputs.items()}
+        for row in range(rows)
+    ]
+    start = time.perf_counter()
+    for row in batch:
+        calc_class(**row).calculate()
+    return rows / (time.perf_counter() - start)
+
+
+def run_scenario(name, settings):
+    """
+    :return: dict of measure -> value
+    """
+    book, workbook_config = synthetic_workbook(**settings)
+    with tempfile.TemporaryDirectory() as directory:
+        cfg, app, generation = generate(directory, book, workbook_config)
+        calc_class = load_class(cfg)
+        inputs = {
+            var: book.Sheets['Inputs'].Range(address.split('!')[1]).Value2
+            for address, var in cfg.inputs.items()
+        }
+        results = {
+            'generation_seconds': generation,
+            'parse_formulae_per_second': parse_throughput(app, book),
+            'runtime_import_seconds': runtime_import_seconds(),
+            'import_seconds': import_seconds(cfg),
+            'calculate_seconds': calculate_seconds(calc_class, inputs),
+            'batch_rows_per_second': batch_rows_per_second(calc_class, inputs),
+        }
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """
+    :param results: scenario -> measure -> value
+    :param baseline: the same, from a previous run
+    :param threshold: fraction by which a measure may be worse, e.g. 0.2
+    :return: list of (scenario, measure, baseline value, new value)
+    """
+    worse = []
+    for scenario, measures in results.items():
+        for measure, value in measures.items():
+            try:
+                base = baseline[scenario][measure]
+            except KeyError:
+                continue
+            if measure in HIGHER_IS_BETTER:
+                regressed = value < base * (1 - threshold)
+            else:
+                regressed = value > base * (1 + threshold)
+            if regressed:
+                worse.append((scenario, measure, base, value))
+    return worse
+
+
+def sized(scenario, sizes):
+    """
+    :param scenario: name in SCENARIOS
+    :param sizes: dict of setting -> value, overriding the scenario's
+    :return: (name for the results, synthetic_workbook() settings)
+    """
+    settings = dict(SCENARIOS[scenario])
+    changed = {size: value for size, value in sizes.items() if settings.get(size) != value}
+    settings.update(changed)
+    if changed:
+        scenario += '[' + ','.join(f"{size}={value}" for size, value in sorted(changed.items())) + ']'
+    return scenario, settings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark excel2py with synthetic workbooks")
+    parser.add_argument("scenarios", nargs='*', default=sorted(SCENARIOS),
+                        help=f"Scenarios to run (default: all of {', '.join(sorted(SCENARIOS))})")
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action='store_true',
+                        help="Store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Fraction by which a measure may be worse than the baseline (default: 0.2)")
+    for size in SIZES:
+        parser.add_argument("--" + size.replace('_', '-'), type=int, metavar="N",
+                            help=f"Use {size.replace('_', ' ')} N in every scenario run")
+    args = parser.parse_args(argv)
+    sizes = {size: getattr(args, size) for size in SIZES if getattr(args, size) is not None}
+
+    results = {}
+    for scenario in args.scenarios:
+        scenario, settings = sized(scenario, sizes)
+        results[scenario] = run_scenario(scenario, settings)
+        for measure, value in sorted(results[scenario].items()):
+            print(f"{scenario:10} {measure:28} {value:14.6f}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        return 0
+
+    missing = sorted(results.keys() - baseline.keys())
+    if missing:
+        print(f"No baseline in {args.baseline} for {', '.join(missing)}: make one with --save-baseline")
+    worse = regressions(results, baseline, args.threshold)
+    for scenario, measure, base, value in worse:
+        print(f"REGRESSION {scenario} {measure}: {base:.6f} -> {value:.6f}")
+    return 1 if worse else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
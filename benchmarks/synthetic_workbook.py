@@ -0,0 +1,291 @@
+"""
+Synthetic workbooks for benchmarking without Excel
+
+Workbook, Worksheet, Range and Name mimic the parts of Excel's COM object
+model which ExcelToPy uses. synthetic_workbook() builds a calculation of a
+chosen size and shape. A workbook can be saved to and loaded from a JSON
+snapshot so that benchmarks are repeatable.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import json
+import random
+import re
+
+ADDRESS = re.compile(r'\$?([A-Z]+)\$?([0-9]+)')
+
+
+def column_letters(column):
+    """1 -> 'A', 27 -> 'AA'"""
+    letters = ''
+    while column:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def column_number(letters):
+    """'A' -> 1, 'AA' -> 27"""
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+
+def parse_address(address):
+    """
+    :param address: e.g. 'A1', '$A$1' or '$A$1:$C$3'
+    :return: (top row, left column, bottom row, right column)
+    """
+    corners = [ADDRESS.fullmatch(corner) for corner in address.split(':')]
+    assert all(corners), address
+    rows = [int(corner.group(2)) for corner in corners]
+    columns = [column_number(corner.group(1)) for corner in corners]
+    return min(rows), min(columns), max(rows), max(columns)
+
+
+def absolute_address(top, left, bottom=None, right=None):
+    """(1, 1, 3, 3) -> '$A$1:$C$3'"""
+    address = f"${column_letters(left)}${top}"
+    if bottom is not None and (bottom, right) != (top, left):
+        address += f":${column_letters(right)}${bottom}"
+    return address
+
+
+class Cell:
+    def __init__(self, value=None, formula=None, number_format='General'):
+        self.value = value
+        self.formula = formula
+        self.number_format = number_format
+
+
+class Range:
+    """
+    A rectangle of cells, as Excel's Range
+    """
+    def __init__(self, sheet, top, left, bottom, right):
+        self.Worksheet = sheet
+        self._bounds = top, left, bottom, right
+        self.Address = absolute_address(top, left, bottom, right)
+
+    def _cells(self):
+        top, left, bottom, right = self._bounds
+        return [
+            [self.Worksheet.cells.get((row, column), Cell()) for column in range(left, right + 1)]
+            for row in range(top, bottom + 1)
+        ]
+
+    def _single(self):
+        top, left, bottom, right = self._bounds
+        return (top, left) == (bottom, right)
+
+    def _collect(self, attribute):
+        values = tuple(tuple(attribute(cell) for cell in row) for row in self._cells())
+        return values[0][0] if self._single() else values
+
+    @property
+    def Value2(self):
+        return self._collect(lambda cell: cell.value)
+
+    @property
+    def Formula(self):
+        return self._collect(lambda cell: cell.formula if cell.formula is not None else _text(cell.value))
+
+    @property
+    def HasFormula(self):
+        """True, False or, like Excel, None if mixed"""
+        kinds = {cell.formula is not None for row in self._cells() for cell in row}
+        if len(kinds) == 1:
+            return kinds.pop()
+        return None
+
+    @property
+    def NumberFormat(self):
+        formats = {cell.number_format for row in self._cells() for cell in row}
+        if len(formats) == 1:
+            return formats.pop()
+        return None
+
+
+def _text(value):
+    return '' if value is None else str(value)
+
+
+class Worksheet:
+    def __init__(self, name):
+        self.Name = name
+        self.cells = {}  # (row, column) -> Cell
+
+    def Range(self, address):
+        return Range(self, *parse_address(address))
+
+    def set(self, address, value=None, formula=None, number_format='General'):
+        top, left, _, _ = parse_address(address)
+        self.cells[(top, left)] = Cell(value, formula, number_format)
+
+
+class Name:
+    def __init__(self, book, name, refers_to):
+        self.Name = name
+        self.RefersTo = refers_to
+        self._book = book
+
+    @property
+    def RefersToRange(self):
+        sheet, address = self.RefersTo[1:].split('!')
+        return self._book.Sheets[sheet.strip("'")].Range(address)
+
+
+class Workbook:
+    """
+    The parts of an Excel Workbook used by ExcelToPy
+    """
+    def __init__(self, name='synthetic.xlsx'):
+        self.Name = name
+        self.Sheets = {}
+        self.Names = []
+
+    def sheet(self, name):
+        """Get or add a worksheet"""
+        return self.Sheets.setdefault(name, Worksheet(name))
+
+    def add_name(self, name, sheet, address):
+        self.Names.append(Name(self, name, f"={sheet}!{address}"))
+
+    def snapshot(self):
+        """
+        :return: JSON text from which load_snapshot() recreates the workbook
+        """
+        return json.dumps({
+            'name': self.Name,
+            'sheets': {
+                sheet.Name: [
+                    [row, column, cell.value, cell.formula, cell.number_format]
+                    for (row, column), cell in sorted(sheet.cells.items())
+                ]
+                for sheet in self.Sheets.values()
+            },
+            'names': [[name.Name, name.RefersTo] for name in self.Names],
+        })
+
+
+def load_snapshot(text):
+    """
+    :param text: JSON from Workbook.snapshot()
+    :return: Workbook
+    """
+    data = json.loads(text)
+    book = Workbook(data['name'])
+    for sheet_name, cells in data['sheets'].items():
+        sheet = book.sheet(sheet_name)
+        for row, column, value, formula, number_format in cells:
+            sheet.cells[(row, column)] = Cell(value, formula, number_format)
+    for name, refers_to in data['names']:
+        book.Names.append(Name(book, name, refers_to))
+    return book
+
+
+# Formula templates for calculated cells: a and b are cells from the layer above.
+TEMPLATES = (
+    "{a}+{b}*2",
+    "MAX({a},{b})",
+    "ROUND({a}*1.05,2)",
+    "IF({a}>{b},{a}-{b},{b}-{a})",
+    "SUM({a},{b},{k})",
+    "VLOOKUP({a},{table},{column})",
+)
+
+
+def synthetic_workbook(cells=1000, depth=10, inputs=4, constants=4,
+                       tables=2, table_rows=50, table_columns=3, outputs=10, seed=0,
+                       ranges=0, range_rows=100):
+    """
+    Build a workbook with layers of calculations
+
+    Sheets are Inputs (named inputs and constants), Tables (unnamed lookup
+    tables), Calc (named formulae in 'depth' layers, each using two cells from
+    the layer before) and Results (named outputs using the last layer).
+    With ranges, Results also holds named columns of copies of one formula,
+    which are outputs too.
+
+    :param cells: number of calculated cells on the Calc sheet
+    :param depth: number of layers, i.e. the length of dependency chains
+    :param inputs: number of inputs, named in_0, in_1...
+    :param constants: number of named constants k_0, k_1...
+    :param tables: number of lookup tables
+    :param table_rows: rows in each lookup table
+    :param table_columns: columns in each lookup table
+    :param outputs: number of outputs, named out_0, out_1...
+    :param seed: for the random choice of formulae
+    :param ranges: number of named ranges of formulae, rng_0, rng_1...
+    :param range_rows: rows in each of them
+    :return: (Workbook, dict of settings for the config)
+    """
+    rand = random.Random(seed)
+    book = Workbook()
+    input_sheet = book.sheet('Inputs')
+    table_sheet = book.sheet('Tables')
+    calc_sheet = book.sheet('Calc')
+    result_sheet = book.sheet('Results')
+
+    config = {'inputs': {}, 'outputs': {}, 'input_types': {}}
+    for i in range(inputs):
+        address = absolute_address(i + 1, 2)
+        input_sheet.set(address, float(i + 1))
+        book.add_name(f"in_{i}", 'Inputs', address)
+        config['inputs'][f"Inputs!{address}"] = f"in_{i}"
+        config['input_types'][f"in_{i}"] = 'float'
+    for i in range(constants):
+        address = absolute_address(i + 1, 4)
+        input_sheet.set(address, 1 + i / 10)
+        book.add_name(f"k_{i}", 'Inputs', address)
+
+    table_refs = []
+    for t in range(tables):
+        left = t * (table_columns + 1) + 1
+        for row in range(1, table_rows + 1):
+            table_sheet.set(absolute_address(row, left), float(row - 1))
+            for column in range(left + 1, left + table_columns):
+                table_sheet.set(absolute_address(row, column), rand.uniform(0, 10))
+        table_refs.append("Tables!" + absolute_address(1, left, table_rows, left + table_columns - 1))
+
+    depth = max(1, min(depth, cells))
+    previous = [f"in_{i}" for i in range(inputs)]
+    per_layer = [cells // depth + (1 if layer < cells % depth else 0) for layer in range(depth)]
+    for layer, count in enumerate(per_layer):
+        current = []
+        for i in range(count):
+            template = rand.choice(TEMPLATES)
+            formula = "=" + template.format(
+                a=rand.choice(previous),
+                b=rand.choice(previous),
+                k=f"k_{rand.randrange(constants)}" if constants else 1,
+                table=rand.choice(table_refs) if table_refs else None,
+                column=rand.randint(2, table_columns) if table_columns > 1 else 1,
+            )
+            if 'VLOOKUP' in formula and not table_refs:
+                formula = f"={previous[0]}+1"
+            name = f"c_{layer}_{i}"
+            address = absolute_address(i + 1, layer + 1)
+            calc_sheet.set(address, None, formula)
+            book.add_name(name, 'Calc', address)
+            current.append(name)
+        previous = current
+
+    for i in range(outputs):
+        address = absolute_address(i + 1, 2)
+        result_sheet.set(address, None, f"={previous[i % len(previous)]}+{previous[-1 - i % len(previous)]}")
+        book.add_name(f"out_{i}", 'Results', address)
+        config['outputs'][f"Results!{address}"] = f"out_{i}"
+
+    # Column D numbers the rows of the ranges, in columns E onwards
+    for row in range(1, range_rows + 1 if ranges else 1):
+        result_sheet.set(absolute_address(row, 4), float(row))
+    for i in range(ranges):
+        factor = f"in_{i % inputs}" if inputs else 1
+        for row in range(1, range_rows + 1):
+            result_sheet.set(absolute_address(row, i + 5), None, f"=$D{row}*{factor}")
+        address = absolute_address(1, i + 5, range_rows, i + 5)
+        book.add_name(f"rng_{i}", 'Results', address)
+        config['outputs'][f"Results!{address}"] = f"rng_{i}"
+    return book, config
@@ -3,6 +3,22 @@ Abstract base class for excel2py's generated code.
 
 By Michael Grazebrook of Joined Up Finance Ltd
 """
+from collections import namedtuple
+from operator import attrgetter
+
+from excel2py.dependency_graph import evaluation_order
+from excel2py.memoise import function_cache
+
+# What calculate(outputs) needs to do for a given list of outputs
+# waves: for calculate_async(), see evaluation_waves()
+EvaluationPlan = namedtuple('EvaluationPlan', 'cells result_type get_outputs waves')
+
+# How solve_circular() went for a group of cells
+# cells: the names of the cells
+# iterations: the number of times each formula was evaluated
+# change: the largest change in a value in the last iteration
+# converged: False if it stopped at max_iterations instead
+CircularStats = namedtuple('CircularStats', 'cells iterations change converged')
 
 
 class BaseProformaCalc:
@@ -11,6 +27,39 @@ class BaseProformaCalc:
     """
     inputs = set()
 
+    # Generated: the names of the outputs, in the order calculate() returns them
+    outputs = ()
+
+    # Generated: for each cell, the names its formula uses
+    cell_uses = {}
+
+    # Generated: for each cell, its address in the workbook, e.g. "Sheet1!$A$1"
+    cell_addresses = {}
+
+    # Generated: cells which call toolkit functions, e.g. database look-ups
+    io_cells = frozenset()
+
+    # Generated: groups of cells whose formulae use each other, see solve_circular().
+    # Each cell in a group has a _formula_<name> method as well as its property.
+    circular = ()
+
+    # Generated: Excel's iterative calculation settings, for circular
+    max_iterations = 100
+    max_change = 0.001
+    accelerate_circular = False
+
+    # Generated: cells whose values are shared by all instances with the same
+    # values of the inputs they depend on, e.g. {'annuity': ('age', 'sex')}.
+    # Each has a bounded cache, reported by memoise.cache_stats().
+    shared_cells = {}
+    shared_cache_size = 1024
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'shared_cells' in cls.__dict__:
+            for name, inputs in cls.shared_cells.items():
+                setattr(cls, name, _shared_property(cls, name, inputs))
+
     def check_inputs(self, **args):
         keys = set(args.keys())
         missing = self.inputs - keys
@@ -25,3 +74,196 @@ class BaseProformaCalc:
         self.__dict__.update(args)
         # TODO: Return just the outputs, though this class has all outputs as attributes anyway
 
+    @classmethod
+    def evaluation_plan(cls, outputs=None):
+        """
+        The cells to evaluate for a subset of the outputs, and how to return them
+
+        Plans are built once per class and list of outputs.
+        :param outputs: sequence of output names, or None for all of them
+        :return: EvaluationPlan
+        """
+        outputs = tuple(cls.outputs if outputs is None else outputs)
+        plans = cls.__dict__.get('_evaluation_plans')
+        if plans is None:
+            plans = {}
+            setattr(cls, '_evaluation_plans', plans)  # per class, not inherited
+        try:
+            return plans[outputs]
+        except KeyError:
+            pass
+
+        unknown = set(outputs) - set(cls.outputs)
+        if unknown:
+            raise TypeError(f"calculate() got {len(unknown)} unknown outputs {','.join(sorted(unknown))}")
+        uses = cls.cell_uses
+        if cls.shared_cells:
+            # A shared cell may come from its cache: it evaluates what it uses only if not
+            uses = {name: () if name in cls.shared_cells else used for name, used in uses.items()}
+        cells = tuple(evaluation_order(uses, outputs))
+        plan = EvaluationPlan(
+            cells=cells,
+            result_type=namedtuple('CalcResult', outputs),
+            get_outputs=attrgetter(*outputs) if outputs else lambda self: (),
+            waves=evaluation_waves(cells, cls.cell_uses, cls.io_cells),
+        )
+        plans[outputs] = plan
+        return plan
+
+    def evaluate(self, outputs=None):
+        """
+        Evaluate just the cells the outputs need, dependencies first.
+
+        :param outputs: sequence of output names, or None for all of them
+        :return: CalcResult namedtuple of the outputs
+        """
+        plan = self.evaluation_plan(outputs)
+        for cell in plan.cells:
+            getattr(self, cell)
+        return self._result(plan)
+
+    async def calculate_async(self, outputs=None, executor=None):
+        """
+        As calculate(), but toolkit calls which don't depend on each other run concurrently.
+
+        Cells which call toolkit functions (io_cells) run in the executor's
+        threads, a wave at a time. Other cells run on the event loop.
+        :param outputs: sequence of output names, or None for all of them
+        :param executor: concurrent.futures.Executor, or None for the loop's default
+        :return: CalcResult namedtuple of the outputs
+        """
+        import asyncio  # here, as it takes longer to import than the rest of the runtime
+
+        plan = self.evaluation_plan(outputs)
+        loop = asyncio.get_running_loop()
+        for inline, io in plan.waves:
+            for cell in inline:
+                getattr(self, cell)
+            if io:
+                await asyncio.gather(*[
+                    loop.run_in_executor(executor, getattr, self, cell)
+                    for cell in io
+                ])
+        return self._result(plan)
+
+    def solve_circular(self, names):
+        """
+        Calculate a group of cells which use each other, as Excel's iterative calculation
+
+        Starting from 0, each cell's formula is evaluated in turn using the
+        latest values of the others, until no value changes by more than
+        max_change or max_iterations is reached. If accelerate_circular, every
+        third iteration extrapolates each value from its last three (Aitken's
+        method, a secant step on the iteration).
+
+        The outcome is in self.circular_stats, a dict of names -> CircularStats.
+        If a formula raises an exception, the cells are left uncalculated.
+        :param names: tuple of the names of the cells, one of circular
+        """
+        formulae = [getattr(self, '_formula_' + name) for name in names]
+        values = [0] * len(names)
+        self._set_cells(names, values)
+        history = []
+        change = None
+        iterations = 0
+        try:
+            for iterations in range(1, self.max_iterations + 1):
+                change = 0.0
+                for i, formula in enumerate(formulae):
+                    value = formula()
+                    change = max(change, _change(values[i], value))
+                    values[i] = value
+                    setattr(self, '_' + names[i], value)
+                if change <= self.max_change:
+                    break
+                if self.accelerate_circular:
+                    history.append(list(values))
+                    if len(history) == 3:
+                        values = [_aitken(*steps) for steps in zip(*history)]
+                        self._set_cells(names, values)
+                        history = []
+        except BaseException:  # including batching.Deferred, to be tried again
+            self._set_cells(names, [None] * len(names))
+            raise
+        self.__dict__.setdefault('circular_stats', {})[names] = CircularStats(
+            names, iterations, change, change is not None and change <= self.max_change)
+
+    def _set_cells(self, names, values):
+        for name, value in zip(names, values):
+            setattr(self, '_' + name, value)
+
+    def _result(self, plan):
+        values = plan.get_outputs(self)
+        if len(plan.result_type._fields) == 1:
+            values = (values,)  # attrgetter doesn't return a tuple for one name
+        return plan.result_type(*values)
+
+
+def evaluation_waves(cells, uses, io_cells):
+    """
+    Group cells so that toolkit calls in the same wave don't depend on each other
+
+    A cell's wave is the number of io cells on the longest chain of cells it uses.
+    Within a wave, other cells only use io cells from earlier waves, so they
+    can be evaluated first, then the wave's io cells all at once.
+    :param cells: names in evaluation order, dependencies first
+    :param uses: dict of name -> names its formula uses
+    :param io_cells: names of the cells which call toolkit functions
+    :return: tuple of (tuple of other cells in evaluation order, tuple of io cells) per wave
+    """
+    if not io_cells:
+        return ((cells, ()),)
+    wave = {}
+    for cell in cells:
+        wave[cell] = max(
+            (wave[use] + (use in io_cells) for use in uses.get(cell, ()) if use in wave),
+            default=0)
+    waves = [([], []) for _ in range(max(wave.values(), default=0) + 1)]
+    for cell in cells:
+        waves[wave[cell]][cell in io_cells].append(cell)
+    return tuple((tuple(inline), tuple(io)) for inline, io in waves)
+
+
+def _change(old, new):
+    try:
+        return abs(new - old)
+    except TypeError:
+        return 0.0 if new == old else float('inf')
+
+
+def _aitken(x0, x1, x2):
+    """
+    :return: the limit extrapolated from three successive values, or the last if it can't be
+    """
+    try:
+        denominator = x2 - 2 * x1 + x0
+        if denominator:
+            return x2 - (x2 - x1) ** 2 / denominator
+    except TypeError:
+        pass
+    return x2
+
+
+def _shared_property(cls, name, inputs):
+    """
+    Wrap a cell's property so its value is shared between instances
+
+    The cache is keyed by the instance's class, so that subclasses
+    overriding cells don't share values with their base class, and the
+    values of the inputs.
+    """
+    original = cls.__dict__[name]
+    private = '_' + name
+    cache = function_cache(f"{cls.__module__}.{cls.__qualname__}.{name}", cls.shared_cache_size)
+
+    def shared(self):
+        value = getattr(self, private)
+        if value is None:
+            key = (type(self),) + tuple(getattr(self, input_name) for input_name in inputs)
+            value = cache.call(lambda *_: original.__get__(self, type(self)), key)
+            setattr(self, private, value)
+        return value
+
+    shared.__name__ = name
+    shared.cache = cache
+    return property(shared)
@@ -0,0 +1,189 @@
+"""
+Batch toolkit calls across the rows of a batch calculation
+
+Calculating a model for many rows one at a time makes one toolkit call
+(e.g. a database look-up) per cell per row. calculate_batch() instead
+evaluates all the rows together, a wave of the evaluation plan at a time
+(see BaseProformaCalc.evaluation_waves). A BatchedFunction called during
+the batch records its arguments and defers the cell; once every row has
+been tried, each function is called once with all the arguments recorded,
+and the deferred cells are evaluated again with the results.
+
+A cell which raises an exception in one row doesn't stop the batch: it
+takes the Excel error equivalent to the exception (see excel_errors), which
+propagates to the cells using it in that row only. Batch.masks shows which
+rows' outputs are errors.
+
+A BatchedFunction wraps a bulk function taking a list of argument tuples
+and returning a list of results in the same order. Outside a batch it
+makes a bulk call of one. Arguments which are Excel errors aren't passed
+to it: the call returns the error. Import it through the generator's imports and
+list its name in the globals, as for any toolkit function.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+from contextvars import ContextVar
+
+from excel2py.excel_errors import ExcelError, error_from_exception, first_error
+
+# The Batch collecting calls, if any
+_current = ContextVar('excel2py_batch', default=None)
+
+
+class Deferred(BaseException):
+    """
+    Raised by a BatchedFunction whose result isn't known yet.
+
+    A BaseException, so that formulae which catch errors don't catch it.
+    """
+
+
+class BatchedFunction:
+    """
+    A toolkit function whose calls can be made in bulk
+    """
+    def __init__(self, bulk, name=None):
+        """
+        :param bulk: function of a list of argument tuples, returning a list of results
+        :param name: for messages. Defaults to the bulk function's name.
+        """
+        self.bulk = bulk
+        self.__name__ = name or bulk.__name__
+        self.__qualname__ = name or getattr(bulk, '__qualname__', self.__name__)
+        self.__module__ = getattr(bulk, '__module__', None)
+
+    def __call__(self, *args):
+        error = first_error(args)
+        if error is not None:
+            return error  # as an Excel function would, without a call
+        batch = _current.get()
+        if batch is None:
+            return self.bulk([args])[0]
+        return batch.result(self, args)
+
+    def __repr__(self):
+        return f"BatchedFunction({self.__name__})"
+
+
+def batched(bulk):
+    """
+    Decorator making a BatchedFunction of a bulk function
+    """
+    return BatchedFunction(bulk)
+
+
+class Batch:
+    """
+    Calls collected during a batch calculation, and their results
+
+    calls: number of calls made by cells, including repeats
+    round_trips: number of calls to the bulk functions
+    masks: output name -> list with, for each row, True if its value is an Excel error
+    exceptions: (row, cell name) -> the exception which made the cell an Excel error
+    """
+    def __init__(self):
+        self.results = {}  # BatchedFunction -> args -> result
+        self.pending = {}  # BatchedFunction -> dict of args not yet called, in order
+        self.calls = 0
+        self.round_trips = 0
+        self.masks = {}
+        self.exceptions = {}
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+
+    def result(self, function, args):
+        """
+        :return: the result of a call, if known
+        :raise Deferred: if not, recording the call
+        """
+        self.calls += 1
+        try:
+            return self.results[function][args]
+        except KeyError:
+            self.pending.setdefault(function, {})[args] = None
+            raise Deferred(function.__name__) from None
+
+    def dispatch(self):
+        """
+        Make one bulk call for each function with calls pending
+        """
+        for function, calls in self.pending.items():
+            args = list(calls)
+            results = function.bulk(args)
+            if len(results) != len(args):
+                raise ValueError(f"{function.__name__} returned {len(results)} results for {len(args)} calls")
+            self.results.setdefault(function, {}).update(zip(args, results))
+            self.round_trips += 1
+        self.pending = {}
+
+
+def calculate_batch(calc_class, rows, outputs=None, batch=None):
+    """
+    Calculate a model for many rows of inputs, batching toolkit calls across rows
+
+    :param calc_class: generated class, or a sub-class
+    :param rows: iterable of dicts of inputs
+    :param outputs: sequence of output names, or None for all of them
+    :param batch: Batch, e.g. to see its statistics and error masks afterwards.
+            Results found by a previous batch are reused.
+    :return: list of CalcResult namedtuple, one per row
+    """
+    calcs = [calc_class(**row) for row in rows]
+    plan = calc_class.evaluation_plan(outputs)
+    with batch or Batch() as batch:
+        batch.masks, batch.exceptions = {}, {}  # for this batch's rows
+        for inline, io in plan.waves:
+            pending = [(row, cell) for row in range(len(calcs)) for cell in inline + io]
+            while pending:
+                deferred = []
+                for row, cell in pending:
+                    try:
+                        getattr(calcs[row], cell)
+                    except Deferred:
+                        deferred.append((row, cell))
+                    except Exception as e:
+                        # Only this row's cell is an error: the rest of the batch carries on
+                        batch.exceptions[row, cell] = e
+                        setattr(calcs[row], '_' + cell, error_from_exception(e))
+                if deferred and not batch.pending:
+                    raise RuntimeError("Cells were deferred without a call to make")
+                batch.dispatch()
+                pending = deferred
+        results = [calc._result(plan) for calc in calcs]
+        for i, name in enumerate(plan.result_type._fields):
+            batch.masks[name] = [isinstance(result[i], ExcelError) for result in results]
+        return results
+
+
+def sqlite_lookup(connection, table, key_column, value_column, default=None, chunk_size=500):
+    """
+    A BatchedFunction looking up one value per key in a SQLite table
+
+    Each bulk call is one "IN (...)" query per chunk_size keys.
+    :param connection: sqlite3.Connection
+    :param table: table name
+    :param key_column: column to match the function's argument against
+    :param value_column: column to return
+    :param default: result for keys not in the table
+    :param chunk_size: keys per query, within SQLite's limit on parameters
+    :return: BatchedFunction of one argument
+    """
+    def bulk(calls):
+        keys = [args[0] for args in calls]
+        found = {}
+        for start in range(0, len(keys), chunk_size):
+            chunk = list(dict.fromkeys(keys[start:start + chunk_size]))
+            query = (
+                f'SELECT "{key_column}", "{value_column}" FROM "{table}" '
+                f'WHERE "{key_column}" IN ({", ".join("?" * len(chunk))})'
+            )
+            found.update(connection.execute(query, chunk))
+        return [found.get(key, default) for key in keys]
+
+    return BatchedFunction(bulk, f"{table}.{value_column}")
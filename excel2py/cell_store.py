@@ -0,0 +1,84 @@
+"""
+Generated text for each cell, kept in a temporary file once it gets large
+
+The generator can't write a cell's code until every name has been
+processed: pruning needs the whole dependency graph. For a workbook of
+hundreds of thousands of cells, holding all that text in memory, then
+joining it into one string to write, costs several times the size of the
+generated module. A CellStore keeps the first spill_size characters in
+memory and appends the rest to a temporary file, and write_to() copies the
+cells to the output file one at a time, in the order they were stored.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+from collections.abc import MutableMapping
+import tempfile
+
+# Characters of text a store keeps in memory before it uses a temporary file
+SPILL_SIZE = 4 * 2**20
+
+
+class CellStore(MutableMapping):
+    """
+    An ordered mapping of cell name -> text
+    """
+    def __init__(self, spill_size=None):
+        """
+        :param spill_size: characters to keep in memory, default SPILL_SIZE.
+                Text beyond this is kept in a temporary file.
+        """
+        self.spill_size = SPILL_SIZE if spill_size is None else spill_size
+        self._in_memory = 0
+        self._cells = {}  # name -> text, or (offset, length) in the temporary file
+        self._file = None
+
+    def __setitem__(self, name, text):
+        if name in self._cells:
+            del self[name]  # a replaced cell moves to the end, as it's written last
+        if self._in_memory + len(text) <= self.spill_size:
+            self._cells[name] = text
+            self._in_memory += len(text)
+            return
+        if self._file is None:
+            self._file = tempfile.TemporaryFile()
+        data = text.encode('utf-8')
+        self._file.seek(0, 2)
+        self._cells[name] = (self._file.tell(), len(data))
+        self._file.write(data)
+
+    def __getitem__(self, name):
+        text = self._cells[name]
+        if isinstance(text, tuple):
+            offset, length = text
+            self._file.seek(offset)
+            return self._file.read(length).decode('utf-8')
+        return text
+
+    def __delitem__(self, name):
+        text = self._cells.pop(name)
+        if isinstance(text, str):
+            self._in_memory -= len(text)
+
+    def __iter__(self):
+        return iter(self._cells)
+
+    def __len__(self):
+        return len(self._cells)
+
+    @property
+    def spilled(self):
+        """
+        :return: the number of cells kept in the temporary file
+        """
+        return sum(1 for text in self._cells.values() if isinstance(text, tuple))
+
+    def write_to(self, f, keep=None):
+        """
+        Copy the text of the cells to a file, in order
+
+        :param f: text file
+        :param keep: If given, the set of cell names to write
+        """
+        for name in self._cells:
+            if keep is None or name in keep:
+                f.write(self[name])
@@ -18,11 +18,12 @@ TOOLKIT_FUNCTIONS = {
 }
 
 
-def config(description):
+def config(description, argv=None):
     """
     Take values from the command line and/or config
 
     :param description for command line help:
+    :param argv: Command line arguments to use instead of sys.argv[1:]
     :return: Provides an object with these attributes:
         - spreadsheet, name of the file open in Excel
         - config: TODO: parsed contents of the config file
@@ -30,13 +31,26 @@ def config(description):
         - output: path to the main output file
         - gen_class_name: Name of the class containing generated code
         - class_name: Name of the stub class subclassing gen_class_name
+        - profile: None, or where to write generation statistics ('-' for stderr)
+        - processes: number of processes translating formulae
+        - cache: None, or the file caching translations between runs
+        - split_sheets: write a module per sheet, loaded lazily
+        - model: None, or the file for a serialized model of the calculation
+        - max_iterations, max_change: None, or settings for circular references
+          overriding the workbook's
+        - accelerate: extrapolate iterations solving circular references
+        - shared_cells: names of cells whose values instances share
+        - sidecar_cells: numeric tables of at least this many cells are written to
+          .npy files beside the generated module. 0 means none are.
+        - compile_report: compile the module with and without the cells no output
+          uses, to report the effect of leaving them out
     """
-    args = _parse_args(description)
+    args = _parse_args(description, argv)
     _parse_config(args)
     return args
 
 
-def _parse_args(description):
+def _parse_args(description, argv=None):
     parser = argparse.ArgumentParser(description=description)
     parser.add_argument("spreadsheet",
                         help="Excel file name (including extension)")
@@ -53,8 +67,42 @@ def _parse_args(description):
         help=(
             "Name of the main output file.\n"
             "The default is based on the prefix and spreadsheet path"))
+    parser.add_argument(
+        "--profile", metavar="JSON_FILE",
+        help="Write phase timings and counts as JSON to JSON_FILE; '-' means stderr")
+    parser.add_argument(
+        "--processes", type=int, default=1, metavar="N",
+        help="Translate formulae across N processes; 0 means one per CPU (default: 1)")
+    parser.add_argument(
+        "--cache", metavar="CACHE_FILE",
+        help="Reuse translations of unchanged formulae from CACHE_FILE, and update it")
+    parser.add_argument(
+        "--split-sheets", action='store_true',
+        help="Write each sheet's cells to a separate module, imported when first used")
+    parser.add_argument(
+        "--model", metavar="MODEL_FILE",
+        help="Also write the calculation as a serialized model, run by excel2py.interpreter")
+    parser.add_argument(
+        "--max-iterations", type=int, metavar="N",
+        help="Iterations solving circular references (default: the workbook's setting)")
+    parser.add_argument(
+        "--max-change", type=float, metavar="X",
+        help="Change in values at which circular references are solved (default: the workbook's setting)")
+    parser.add_argument(
+        "--accelerate", action='store_true',
+        help="Extrapolate iterations solving circular references, so fewer are needed")
+    parser.add_argument(
+        "--share", action='append', metavar="NAME",
+        help="Share the cell NAME between calculations with the same values of the inputs it uses")
+    parser.add_argument(
+        "--sidecar-cells", type=int, default=1000, metavar="N",
+        help=("Write numeric constant tables of N or more cells to .npy files, "
+              "memory-mapped when first used; 0 writes them all in the module (default: 1000)"))
+    parser.add_argument(
+        "--compile-report", action='store_true',
+        help="Report the size and compile time of the module with and without the cells no output uses")
 
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
 def _parse_config(args):
@@ -89,6 +137,14 @@ def _outputs(args):
         'Results!C5': 'first_output',
         'Resluts!C6': 'second_output',
     }
+    # Only cells the outputs depend on are generated. Cells which no output uses
+    # but which subclasses override or read must be listed here.
+    args.prune_unreachable = True
+    args.keep = {
+    }
+    # Cells whose values are shared by calculations with the same values of
+    # the inputs they depend on, e.g. annuity factors which depend on age and sex.
+    args.shared_cells = set(args.share or ())
 
 
 def _inputs(args):
@@ -100,6 +156,11 @@ def _inputs(args):
         'Inputs!D6': 'first_input',
         'Inputs!D7': 'second_input',
     }
+    # Declared types of inputs, by variable name: 'float', 'int', 'date', 'str' or 'bool'.
+    # Code using an input of known type can avoid the generic Excel functions.
+    # e.g. {'first_input': 'float'}
+    args.input_types = {
+    }
 
 
 def _file_and_class_names(args):
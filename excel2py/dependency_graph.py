@@ -0,0 +1,180 @@
+"""
+The dependency structure of the generated calculation
+
+Each generated cell (a property or a constant) is a node. A formula's node
+has an edge to every name its formula uses. Names are the Python names used
+in the generated code, e.g. 'first_output' or 'SheetA1'.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+
+
+class DependencyGraph:
+    """
+    Which cells use which.
+    """
+    def __init__(self):
+        # name -> set of names used by its formula. Constants use nothing.
+        self.uses = {}
+
+    def add(self, name, uses=()):
+        """
+        Record a cell and the names it uses
+
+        :param name: Python name of the cell
+        :param uses: iterable of Python names its formula refers to
+        """
+        self.uses.setdefault(name, set()).update(uses)
+
+    def __contains__(self, name):
+        return name in self.uses
+
+    def __len__(self):
+        return len(self.uses)
+
+    def reachable(self, roots):
+        """
+        Every cell the roots depend on, directly or indirectly, including the roots.
+
+        :param roots: iterable of names, e.g. the outputs
+        :return: set of names
+        """
+        seen = set()
+        stack = list(roots)
+        while stack:
+            name = stack.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            stack.extend(self.uses.get(name, ()))
+        return seen
+
+    def unreachable(self, roots):
+        """
+        :param roots: iterable of names, e.g. the outputs
+        :return: sorted list of cells no root depends on
+        """
+        keep = self.reachable(roots)
+        return sorted(name for name in self.uses if name not in keep)
+
+    def circular(self, names=None):
+        """
+        Groups of cells which use each other, directly or indirectly
+
+        :param names: If given, only cycles among these cells are found
+        :return: list of sets of names, each a strongly connected component
+                with more than one cell or a cell which uses itself
+        """
+        uses = self.uses if names is None else {
+            name: [use for use in uses if use in names]
+            for name, uses in self.uses.items() if name in names
+        }
+        return [
+            component for component in strongly_connected(uses)
+            if len(component) > 1 or next(iter(component)) in uses.get(next(iter(component)), ())
+        ]
+
+    def inputs_used(self, inputs):
+        """
+        The inputs each cell depends on, directly or through other cells
+
+        :param inputs: the names of the inputs
+        :return: dict of name -> frozenset of the names of inputs
+        """
+        inputs = set(inputs)
+        used = {}
+        for component in strongly_connected(self.uses):  # dependencies first
+            found = set()
+            for name in component:
+                for use in self.uses.get(name, ()):
+                    if use in inputs:
+                        found.add(use)
+                    elif use not in component:
+                        found |= used.get(use, frozenset())
+            found = frozenset(found)
+            for name in component:
+                used[name] = found
+        return used
+
+    def evaluation_order(self, roots):
+        """
+        :param roots: iterable of names, e.g. the outputs
+        :return: list of the cells the roots depend on, dependencies first
+        """
+        return evaluation_order(self.uses, roots)
+
+
+def evaluation_order(uses, roots):
+    """
+    Cells in an order where each comes after the cells it uses
+
+    Cycles are tolerated: a cell already being visited is not revisited.
+    :param uses: dict of name -> iterable of names used by its formula
+    :param roots: iterable of names, e.g. the requested outputs
+    :return: list of names, dependencies first, including the roots
+    """
+    order = []
+    seen = set()
+    for root in roots:
+        if root in seen:
+            continue
+        seen.add(root)
+        stack = [(root, iter(uses.get(root, ())))]
+        while stack:
+            name, children = stack[-1]
+            for child in children:
+                if child not in seen:
+                    seen.add(child)
+                    stack.append((child, iter(uses.get(child, ()))))
+                    break
+            else:
+                stack.pop()
+                order.append(name)
+    return order
+
+
+def strongly_connected(uses):
+    """
+    Tarjan's algorithm, without recursion so that long chains of cells are fine
+
+    :param uses: dict of name -> iterable of names used by its formula
+    :return: list of sets of names, dependencies first
+    """
+    index = {}
+    low = {}
+    on_stack = set()
+    stack = []
+    components = []
+    for start in uses:
+        if start in index:
+            continue
+        index[start] = low[start] = len(index)
+        stack.append(start)
+        on_stack.add(start)
+        work = [(start, iter(uses.get(start, ())))]
+        while work:
+            name, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = low[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(uses.get(child, ()))))
+                    break
+                if child in on_stack:
+                    low[name] = min(low[name], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[name])
+                if low[name] == index[name]:
+                    component = set()
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.add(member)
+                        if member == name:
+                            break
+                    components.append(component)
+    return components
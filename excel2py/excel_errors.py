@@ -0,0 +1,128 @@
+"""
+Excel's error values, such as #N/A and #DIV/0!
+
+Each error is a singleton ExcelError. Like Excel's errors, they propagate:
+arithmetic or a comparison with an error returns the error, and the
+excel_functions return the first error among their arguments. So an error
+flows through the cells that use it without raising Python exceptions,
+and ISERROR, IFERROR and IFNA can test for it.
+
+The generator translates error literals in formulae, e.g. =IF(A1>0,A1,#N/A),
+to the names below. Where Python raises instead, e.g. dividing by zero,
+error_from_exception() gives Excel's equivalent; calculate_batch() uses it
+so that one bad row doesn't stop a batch.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+
+
+class ExcelError:
+    """
+    One of Excel's error values. There is one instance of each, so test with 'is'.
+    """
+    __slots__ = ('code', 'name')
+
+    _instances = {}  # code -> ExcelError
+
+    def __new__(cls, code, name=None):
+        """
+        :param code: Excel's text for the error, e.g. '#N/A'
+        :param name: the module variable holding it, e.g. 'ERROR_NA'. Only needed the first time.
+        """
+        try:
+            return cls._instances[code]
+        except KeyError:
+            pass
+        if name is None:
+            raise ValueError(f"{code!r} isn't an Excel error")
+        error = super().__new__(cls)
+        error.code = code
+        error.name = name
+        cls._instances[code] = error
+        return error
+
+    def __repr__(self):
+        return self.name
+
+    def __str__(self):
+        return self.code
+
+    def __reduce__(self):
+        return self.name  # unpickles as the module's singleton
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __hash__(self):
+        return id(self)
+
+    def __bool__(self):
+        # So that 'x in values' and the like don't mistake a propagated error for a match
+        return False
+
+    def _propagate(self, *_):
+        return self
+
+    __add__ = __radd__ = __sub__ = __rsub__ = _propagate
+    __mul__ = __rmul__ = __truediv__ = __rtruediv__ = _propagate
+    __floordiv__ = __rfloordiv__ = __mod__ = __rmod__ = __pow__ = __rpow__ = _propagate
+    __neg__ = __pos__ = __abs__ = __round__ = __floor__ = __ceil__ = _propagate
+    __eq__ = __ne__ = __lt__ = __le__ = __gt__ = __ge__ = _propagate
+
+
+ERROR_NULL = ExcelError('#NULL!', 'ERROR_NULL')
+ERROR_DIV0 = ExcelError('#DIV/0!', 'ERROR_DIV0')
+ERROR_VALUE = ExcelError('#VALUE!', 'ERROR_VALUE')
+ERROR_REF = ExcelError('#REF!', 'ERROR_REF')
+ERROR_NAME = ExcelError('#NAME?', 'ERROR_NAME')
+ERROR_NUM = ExcelError('#NUM!', 'ERROR_NUM')
+ERROR_NA = ExcelError('#N/A', 'ERROR_NA')
+
+# Error name -> ExcelError, for the generated code and the interpreter
+ERRORS = {error.name: error for error in ExcelError._instances.values()}
+
+# Python exceptions and the Excel errors they correspond to, most specific first
+_EXCEPTION_ERRORS = (
+    (ZeroDivisionError, ERROR_DIV0),
+    (OverflowError, ERROR_NUM),
+    (ValueError, ERROR_NUM),  # e.g. math domain error
+    (IndexError, ERROR_REF),
+    (LookupError, ERROR_NA),
+    (NameError, ERROR_NAME),
+)
+
+
+def is_error(value):
+    """
+    :return: True if value is an Excel error
+    """
+    return isinstance(value, ExcelError)
+
+
+def error_from_exception(exception):
+    """
+    :param exception: raised while calculating a cell
+    :return: the ExcelError Excel would show, #VALUE! if nothing closer
+    """
+    for exception_type, error in _EXCEPTION_ERRORS:
+        if isinstance(exception, exception_type):
+            return error
+    return ERROR_VALUE
+
+
+def first_error(values):
+    """
+    :param values: iterable, e.g. a function's arguments or a range
+    :return: the first Excel error in values, looking one level into tuples, or None
+    """
+    for value in values:
+        if isinstance(value, ExcelError):
+            return value
+        if isinstance(value, tuple):
+            for item in value:
+                if isinstance(item, ExcelError):
+                    return item
+    return None
@@ -1,6 +1,10 @@
 """
 Python implementation of Excel functions
 
+Excel errors (see excel_errors) propagate: a function given an error
+returns it. None is still treated as an error by ISERROR, IFERROR and IFNA,
+for toolkit functions which return None when they fail.
+
 By Michael Grazebrook of Joined Up Finance Ltd
 """
 import math
@@ -9,6 +13,10 @@ import numbers
 from collections.abc import Iterable
 from functools import reduce
 from excel2py.ex_datetime import ex_datetime, to_excel_number
+# The error values are here too, for the generated code's "import *"
+from excel2py.excel_errors import (
+    ERROR_DIV0, ERROR_NA, ERROR_NAME, ERROR_NULL, ERROR_NUM, ERROR_REF, ERROR_VALUE,
+    ExcelError, first_error)
 
 
 def _to_number(arg):
@@ -67,6 +75,9 @@ def _group_function(fn, *args):
     # Use a datetime context if all arguments are datetime
     if len(args) == 1 and isinstance(args[0], Iterable):
         args = args[0]
+    error = first_error(args)
+    if error is not None:
+        return error
     is_datetime = reduce(
         lambda truth, val: truth and isinstance(val, (datetime.datetime, str)),  # strings are ignored
         args, True)
@@ -78,30 +89,62 @@ def _group_function(fn, *args):
     return ret
 
 
+def DIVIDE(numerator, denominator):
+    """
+    Excel's '/' operator, which the generator emits unless the divisor is a non-zero number
+
+    :return: numerator / denominator, #DIV/0! if denominator is zero or empty, or an error operand
+    """
+    error = first_error((numerator, denominator))
+    if error is not None:
+        return error
+    if not denominator:
+        return ERROR_DIV0
+    return numerator / denominator
+
+
 def IF(test, ok, bad):
+    if isinstance(test, ExcelError):
+        return test
     if test:
         return ok
     return bad
 
 
 def ISBLANK(val):
+    if isinstance(val, ExcelError):
+        return False
     return val is None or val.strip() == ''
 
 
 def ISERROR(val):
     """
-    This is imperfect: Excel has many kinds of error:
     "Value refers to any error value (#N/A, #VALUE!, #REF!, #DIV/0!, #NUM!, #NAME?, or #NULL!)."
     :param val:
-    :return:
+    :return: True for an ExcelError or None
     """
-    return val is None
+    return val is None or isinstance(val, ExcelError)
+
+
+def ISERR(val):
+    """Any error except #N/A"""
+    return ISERROR(val) and val is not ERROR_NA
+
+
+def ISNA(val):
+    return val is None or val is ERROR_NA
+
+
+def NA():
+    return ERROR_NA
 
 
 def ROUND(value, digits):
+    if value is None or isinstance(value, ExcelError):
+        return value
+    if isinstance(digits, ExcelError):
+        return digits
     assert digits == int(digits)
-    if value is None:
-        return None
     return round(value, int(digits))
 
 
@@ -125,6 +168,9 @@ def ROUNDDOWN(val, decimal_places):
     """
     # Cute alternative:
     # return val // 10**-decimal_places / 10**decimal_places
+    error = first_error((val, decimal_places))
+    if error is not None:
+        return error
     multiplier = 10**decimal_places
     if val > 0:
         return math.floor(val * multiplier) / multiplier
@@ -132,13 +178,15 @@ def ROUNDDOWN(val, decimal_places):
 
 
 def IFNA(value, value_if_na):
-    if value is None:
+    if ISNA(value):
         return value_if_na
     return value
 
 
 def INT(val):
     """Round down to the nearest integer, e.g. -1.01 returns -2"""
+    if isinstance(val, ExcelError):
+        return val
     return math.floor(val)
 
 
@@ -191,16 +239,22 @@ def AND(*args):
 
 
 def VLOOKUP(value, table, column, range_lookup=True):
+    """
+    :return: #N/A if value isn't found
+    """
+    error = first_error((value, column, range_lookup))
+    if error is not None:
+        return error
     for i, row in enumerate(table):
         if value == row[0]:
             return row[column-1]
         if range_lookup and value < row[0]:
             if i:
                 return table[i-1][column-1]
-            return None
+            return ERROR_NA
     if range_lookup:
         return table[-1][column-1]
-    return None
+    return ERROR_NA
 
 #
 # dt = ex_datetime(2018, 7, 5)
@@ -10,15 +10,44 @@ names.
 
 By Michael Grazebrook of Joined Up Finance Ltd
 """
-import win32com.client as win32
+import json
+import os
 import re
 import sys
+from textwrap import indent
 from io import StringIO
 import difflib
 import datetime
+import time
 
+from excel2py.cell_store import CellStore
+from excel2py.dependency_graph import DependencyGraph
 from excel2py.expression_parser import expression_parser
+from excel2py.generation_stats import GenerationStats
+from excel2py.interpreter import model_data
 from excel2py.pythonify import Pythonify
+from excel2py.range_index import RangeIndex, column_letters, parse_reference
+from excel2py.sidecar import is_numeric_table, write_table
+from excel2py.translation import FormulaTranslator, Job, resolve_types
+from excel2py.translation_cache import TranslationCache
+from excel2py.type_inference import constant_type
+from excel2py.vectorise import (
+    PLACEHOLDER, block_expression, block_formula, recurrence_code, recurrence_formula, recurrence_job_formula)
+
+
+# Modules larger than this, in characters, aren't compiled to report the effect of pruning
+COMPILE_REPORT_SIZE = 2**25
+
+
+class _CharacterCounter:
+    """
+    A file which only counts the characters written to it
+    """
+    def __init__(self):
+        self.size = 0
+
+    def write(self, text):
+        self.size += len(text)
 
 
 class FileSection:
@@ -29,13 +58,20 @@ class FileSection:
         self.text = StringIO()
         self.text.write(f"\n    # {comment}\n\n")
         self.preamble()
+        # Text for each generated cell, by Python name, so unused cells can be left out.
+        # Large sections are kept in a temporary file rather than in memory.
+        self.cells = CellStore()
 
-    def result(self):
+    def write_to(self, f, keep=None):
         """
-        :return: the text for a section of the output file
+        Write the section to the output file
+
+        :param f: text file
+        :param keep: If given, the set of cell names to write. Other cells are dropped.
         """
-        self.postscript()
-        return self.text.getvalue()
+        f.write(self.text.getvalue())
+        self.cells.write_to(f, keep)
+        f.write(self.postscript(keep))
 
     def preamble(self):
         """
@@ -52,11 +88,21 @@ class FileSection:
         """
         pass
 
-    def postscript(self):
+    def write_cell(self, name, text):
+        """
+        Record the text generated for a cell
+        :param name: Python name of the cell
+        :param text: Python source
+        """
+        self.cells[name] = text
+
+    def postscript(self, keep):
         """
         Text to write after the per-cell section
+        :param keep: If given, the set of cell names being written
+        :return: str
         """
-        pass
+        return ''
 
 
 class BadSection(FileSection):
@@ -91,9 +137,16 @@ class CalculationSection(FileSection):
 
     This processes Names from the Inputs and Outputs sheets.
     """
-    def __init__(self, comment, inputs, outputs):
+    def __init__(self, comment, inputs, outputs, graph, addresses, io_cells, circular=(), iteration=None,
+                 shared_cells=None):
         self.inputs = inputs
         self.outputs = outputs
+        self.graph = graph
+        self.addresses = addresses
+        self.io_cells = io_cells
+        self.circular = circular
+        self.iteration = iteration or {}
+        self.shared_cells = {} if shared_cells is None else shared_cells
         super().__init__(comment)
 
     def preamble(self):
@@ -107,13 +160,13 @@ class CalculationSection(FileSection):
             self.text.write(f"        self.{var} = {var}\n")
         self.text.write("        self.private_construction()\n")
         self.text.write("\n")
-        self.text.write("    def calculate(self):\n")
-        output_names = wrap_text(repr(list(self.outputs.values())), 120, 12*' ')
-        self.text.write(f"        return namedtuple('CalcResult',\n")
-        self.text.write(f"{output_names})(\n")
+        self.text.write("    outputs = (\n")
         for value in self.outputs.values():
-            self.text.write(f"            {value}=self.{value},\n")
+            self.text.write(f"        {value!r},\n")
         self.text.write("    )\n\n")
+        self.text.write("    def calculate(self, outputs=None):\n")
+        self.text.write("        # Only the cells the requested outputs need are evaluated\n")
+        self.text.write("        return self.evaluate(outputs)\n\n")
 
     def do_name(self, name):
         """
@@ -124,14 +177,68 @@ class CalculationSection(FileSection):
         if name.Name in self.inputs.values():
             return True
 
+    def postscript(self, keep):
+        """
+        The dependency graph, from which calculate() plans what to evaluate,
+        and where each cell came from in the workbook.
+        """
+        text = StringIO()
+        text.write("    cell_uses = {\n")
+        for name, uses in sorted(self.graph.uses.items()):
+            if keep is None or name in keep:
+                cells = tuple(sorted(use for use in uses if use in self.graph))
+                text.write(f"        {name!r}: {cells!r},\n")
+        text.write("    }\n\n")
+        text.write("    cell_addresses = {\n")
+        for name, address in sorted(self.addresses.items()):
+            if keep is None or name in keep:
+                text.write(f"        {name!r}: {address!r},\n")
+        text.write("    }\n\n")
+        io_cells = sorted(name for name in self.io_cells if keep is None or name in keep)
+        if io_cells:
+            text.write("    # Cells calling toolkit functions, run concurrently by calculate_async()\n")
+            text.write("    io_cells = frozenset({\n")
+            for name in io_cells:
+                text.write(f"        {name!r},\n")
+            text.write("    })\n\n")
+        circular = [names for names in self.circular if keep is None or names[0] in keep]
+        if circular:
+            text.write("    # Cells whose formulae use each other, calculated by solve_circular()\n")
+            text.write("    circular = (\n")
+            for names in circular:
+                text.write(f"        {names!r},\n")
+            text.write("    )\n")
+            for setting, value in sorted(self.iteration.items()):
+                text.write(f"    {setting} = {value!r}\n")
+            text.write("\n")
+        shared = [(name, inputs) for name, inputs in sorted(self.shared_cells.items()) if keep is None or name in keep]
+        if shared:
+            text.write("    # Cells shared by instances with the same values of these inputs\n")
+            text.write("    shared_cells = {\n")
+            for name, inputs in shared:
+                text.write(f"        {name!r}: {inputs!r},\n")
+            text.write("    }\n\n")
+        return text.getvalue()
+
 
 class ConstantSection(FileSection):
     """
     Constants become class variables.
     prerequisite: Non-formula cell with a value
     """
-    def __init__(self, comment, valid_date_formats):
+    def __init__(self, comment, valid_date_formats, sidecar_cells=0, sidecar_base=None, model=False):
+        """
+        :param sidecar_cells: numeric tables of at least this many cells are written to
+                .npy files instead, see excel2py.sidecar. 0 means none are.
+        :param sidecar_base: the start of the .npy file names, e.g. gen_mycalc
+        :param model: True to keep each constant's expression, for the serialized model
+        """
         self.valid_date_formats = valid_date_formats
+        self.sidecar_cells = sidecar_cells
+        self.sidecar_base = sidecar_base
+        # name -> Python expression, for the serialized model. Only kept if one is written.
+        self.expressions = {} if model else None
+        self.sidecars = {}  # name -> (file name, table) for tables written to .npy files
         super().__init__(comment)
 
     def do_name(self, name):
@@ -148,9 +255,26 @@ class ConstantSection(FileSection):
         else:
             value = cells.Value2
 
-        self.text.write(f"    {name.Name} = {value}\n")
+        if self.expressions is not None:
+            self.expressions[name.Name] = str(value)
+        if (self.sidecar_cells and is_numeric_table(value)
+                and len(value) * len(value[0]) >= self.sidecar_cells):
+            filename = f"{self.sidecar_base}_{name.Name}.npy"
+            self.sidecars[name.Name] = filename, value
+            value = f"SidecarTable({filename!r})"
+        self.write_cell(name.Name, f"    {name.Name} = {value}\n")
         return True
 
+    def sidecar_files(self, keep=None):
+        """
+        :param keep: If given, the set of cell names to write
+        :return: dict of file name -> table, for the tables written to .npy files
+        """
+        return {
+            filename: table for name, (filename, table) in sorted(self.sidecars.items())
+            if keep is None or name in keep
+        }
+
 
 class PropertySection(FileSection):
     """
@@ -159,50 +283,225 @@ class PropertySection(FileSection):
     def __init__(self, comment, excel_to_py):
         super().__init__(comment)
         self.inputs = excel_to_py.config.inputs
+        self.output_sheets = excel_to_py.config.output_sheets
         self.excel_to_py = excel_to_py
-        self.names = []
+        self.order = []  # names of the cells accepted, in order
+        self.sheets = {}  # name -> sheet name
+        self.split_sheets = excel_to_py.config.split_sheets
+        self.sheet_cells = {}  # sheet module name -> CellStore of name -> function text
+        self.pending = []  # Job for each formula not yet translated
+        self.tuple_formulae = {}  # name -> value for ranges of formulae
+        self.blocks = {}  # name -> vectorise.Block for ranges of copies of one formula
+        self.recurrences = {}  # name -> vectorise.Recurrence for ranges whose rows use the row before
+        self.block_fallbacks = {}  # name -> value for blocks which can't be calculated as one
+        # name -> Python expression, for the serialized model. Only kept if one is written.
+        self.expressions = {} if excel_to_py.config.model else None
 
     def do_name(self, name):
+        """
+        Accept formulae. They're translated in bulk later, see write_cells().
+        """
         cells = name.RefersToRange
         if not cells.HasFormula:
             return None
+        if name.Name in self.sheets:
+            return True  # already accepted, e.g. a cell of a range calculated cell by cell
 
+        block = recurrence = None
         if is_tuple_formula(cells):
-            # TODO: Proper implementation of this
-            value = deduce_tuple_formula(cells)
+            has_formula = self.excel_to_py.has_formula
+            block = block_formula(cells.Worksheet.Name, cells.Address, cells.Formula, has_formula)
+            if block is None:
+                recurrence = recurrence_formula(cells.Worksheet.Name, cells.Address, cells.Formula, has_formula)
+        if block is not None or recurrence is not None:
+            if block is not None:
+                formula = block.formula[1:]  # skip the '='
+                self.blocks[name.Name] = block
+            else:
+                formula = recurrence_job_formula(recurrence)
+                self.recurrences[name.Name] = recurrence
+            self.excel_to_py.formulae.add(formula)
+            self.pending.append(Job(name.Name, formula, cells.Worksheet.Name, {}))
+            self.block_fallbacks[name.Name] = deduce_tuple_formula(cells)
+        elif is_tuple_formula(cells):
+            rows = self.cell_by_cell(cells)
+            self.tuple_formulae[name.Name] = '(' + ''.join(
+                '(' + ''.join(f"self.{cell}, " for cell in row) + '), ' for row in rows) + ')'
+            self.excel_to_py.graph.add(name.Name, (cell for row in rows for cell in row))
         else:
-            value = self.excel_to_py.reformulate(cells)
-
-        for input_ref in self.inputs:
-            # TODO: Works for the current case but would could fail. Alias list for parse?
-            # e.g. if Inputs!D1 and Inputs!D12 are both valid
-            if isinstance(value, str) and input_ref in value:
-                assert value, f"{value} {name.Name}"
-                value = value.replace(input_ref, self.inputs[input_ref])
-
-        self.names.append("_" + name.Name)
-
-        self.text.write(
-            "    @property\n"
-            f"    def {name.Name}(self):\n"
-            f"        if self._{name.Name} is not None:\n"
-            f"            return self._{name.Name}\n"
-            f"        self._{name.Name} = {value}\n"
-            f"        return self._{name.Name}\n\n"
-        )
+            assert cells.Formula.startswith('='), cells.Formula
+            formula = cells.Formula[1:]  # skip the '='
+            self.excel_to_py.formulae.add(formula)
+            self.pending.append(Job(name.Name, formula, cells.Worksheet.Name, {}))
+        self.order.append(name.Name)
+        self.sheets[name.Name] = cells.Worksheet.Name
+
+        # All formulae on an output sheet count as outputs
+        if cells.Worksheet.Name in self.output_sheets:
+            self.excel_to_py.roots.add(name.Name)
+        self.excel_to_py.addresses[name.Name] = cell_reference(cells)
         return True
 
-    def postscript(self):
+    def cell_by_cell(self, cells):
+        """
+        Accept each cell of a range of formulae which isn't a block, to calculate it as a property of its own
+
+        :param cells: Range of formulae
+        :return: list of rows of the cells' Python names, e.g. [['CalcC2'], ['CalcC3']]
+        """
+        sheet = cells.Worksheet
+        quoted = f"'{sheet.Name}'" if re.search(r'\W', sheet.Name) else sheet.Name
+        area = parse_reference(cells.Address, sheet.Name)
+        rows = []
+        for row in range(area.top, area.bottom + 1):
+            rows.append([])
+            for column in range(area.left, area.right + 1):
+                address = f"${column_letters(column)}${row}"
+                py_name = self.excel_to_py.pythonify.aliases.get(f"{quoted}!{address}")
+                if py_name is None:  # a named cell is accepted under its own name
+                    py_name = Pythonify.py_name(f"{quoted}!{address}")
+                    self.do_name(DuckTypeName(py_name, sheet.Range(address)))
+                rows[-1].append(py_name)
+        return rows
+
+    def take_pending(self):
+        """
+        :return: list of Job for formulae accepted since this was last called
+        """
+        pending, self.pending = self.pending, []
+        return pending
+
+    def write_cells(self, translations):
+        """
+        Write the properties, in the order their names were accepted
+
+        :param translations: dict of name -> Translation
+        """
+        code = {}
+        for name in self.order:
+            statements = ''
+            if name in self.tuple_formulae:
+                value = self.tuple_formulae[name]
+            else:
+                value = translations[name].text
+                if name in self.blocks:
+                    value = self.block_value(name, translations[name])
+                    if value is None:
+                        value = self.block_fallbacks[name]
+                elif name in self.recurrences:
+                    loop = self.recurrence_code(name, translations[name])
+                    statements, value = loop or ('', self.block_fallbacks[name])
+                references = {ref for ref in translations[name].references if not PLACEHOLDER.fullmatch(ref)}
+                self.excel_to_py.graph.add(name, references)
+                if isinstance(value, str) and self.excel_to_py.calls_toolkit(statements + value):
+                    self.excel_to_py.io_cells.add(name)
+
+            for input_ref in self.inputs:
+                # TODO: Works for the current case but would could fail. Alias list for parse?
+                # e.g. if Inputs!D1 and Inputs!D12 are both valid
+                if isinstance(value, str) and input_ref in value:
+                    assert value, f"{value} {name}"
+                    value = value.replace(input_ref, self.inputs[input_ref])
+
+            if self.expressions is not None:
+                self.expressions[name] = value if isinstance(value, str) else repr(value)
+            code[name] = statements, value
+
+        order = {name: i for i, name in enumerate(self.order)}
+        for component in self.excel_to_py.graph.circular(set(translations) & order.keys()):
+            self.excel_to_py.circular.append(tuple(sorted(component, key=order.get)))
+        group = {name: names for names in self.excel_to_py.circular for name in names}
+
+        for name in self.order:
+            statements, value = code[name]
+            if name in group:
+                # Calculated together with the cells it uses, which use it
+                self.write_cell(name, (
+                    "    @property\n"
+                    f"    def {name}(self):\n"
+                    f"        if self._{name} is None:\n"
+                    f"            self.solve_circular({group[name]!r})\n"
+                    f"        return self._{name}\n\n"
+                    f"    def _formula_{name}(self):\n"
+                    + indent(statements, '        ') +
+                    f"        return {str(value).rstrip()}\n\n"
+                ))
+                continue
+            body = (
+                f"def {name}(self):\n"
+                f"    if self._{name} is not None:\n"
+                f"        return self._{name}\n"
+                + indent(statements, '    ') +
+                f"    self._{name} = {value}\n"
+                f"    return self._{name}\n\n"
+            )
+            if self.split_sheets and name not in self.excel_to_py.config.shared_cells:
+                module = self.sheet_module(self.sheets[name])
+                if module not in self.sheet_cells:
+                    self.sheet_cells[module] = CellStore()
+                self.sheet_cells[module][name] = body
+                self.write_cell(name, f"    {name} = LazySheetProperty({module!r})\n")
+            else:
+                self.write_cell(name, "    @property\n" + indent(body, '    '))
+
+    def block_value(self, name, translation):
+        """
+        :param name: name of a block of copies of one formula
+        :param translation: Translation of the block's formula
+        :return: Python for all the block's values, or None if it can't be calculated as one
+        """
+        block = self.blocks[name]
+        names = {
+            ref.reference: translation.lookups.get(ref.reference) or Pythonify.py_name(ref.reference)
+            for ref in block.refs
+        }
+        return block_expression(block, translation.text, names)
+
+    def recurrence_code(self, name, translation):
+        """
+        :param name: name of a recurrence
+        :param translation: Translation of the recurrence's formulae
+        :return: (statements, value), or None if it can't be calculated in a loop
+        """
+        recurrence = self.recurrences[name]
+        names = {
+            ref.reference: translation.lookups.get(ref.reference) or Pythonify.py_name(ref.reference)
+            for ref in recurrence.refs
+        }
+        return recurrence_code(recurrence, translation.text, names)
+
+    def sheet_module(self, sheet):
+        """
+        :param sheet: Excel sheet name
+        :return: name of the module for the sheet's cells, e.g. gen_mycalc_sheet1
+        """
+        base = os.path.splitext(os.path.basename(self.excel_to_py.config.output))[0]
+        return base + '_' + re.sub(r'\W+', '_', sheet).lower()
+
+    def sheet_modules(self, keep=None):
+        """
+        :param keep: If given, the set of cell names to write
+        :return: dict of module name -> CellStore, for the modules with cells to write
+        """
+        return {
+            module: cells for module, cells in sorted(self.sheet_cells.items())
+            if keep is None or not keep.isdisjoint(cells)
+        }
+
+    def postscript(self, keep):
         """
         Initialise private variables to support calculating properties once only.
         """
-        self.text.write(
+        text = StringIO()
+        text.write(
             "\n\n"
             "    def private_construction(self):\n"
         )
-        for name in self.names:
-            self.text.write(f"        self.{name} = None\n")
-        self.text.write("\n")
+        for name in self.cells:
+            if keep is None or name in keep:
+                text.write(f"        self._{name} = None\n")
+        text.write("\n")
+        return text.getvalue()
 
 
 class DuckTypeName:
@@ -220,17 +519,43 @@ class ExcelToPy:
         self.parser = expression_parser()
 
         # Prefix aliases with 'self.'
-        self.inputs.update(self.formulae_on_sheets(config.input_sheets, config.inputs))
-        self.outputs.update(self.formulae_on_sheets(config.output_sheets, config.outputs))
+        config.inputs.update(self.formulae_on_sheets(config.input_sheets, config.inputs))
+        config.outputs.update(self.formulae_on_sheets(config.output_sheets, config.outputs))
         aliases = {}
         aliases.update(config.inputs)
         aliases.update(config.outputs)
-        self.pythonify = Pythonify(config.globals, aliases)
+        self.pythonify = Pythonify(config.globals, aliases, dict(config.input_types))
+
+        self.graph = DependencyGraph()
+        # Python name -> workbook reference, e.g. "'Sheet 1'!$A$1"
+        self.addresses = {}
+        # Names of cells calling toolkit functions
+        self.io_cells = set()
+        # Tuples of the names of cells whose formulae use each other
+        self.circular = []
+        # Settings for solving them, see BaseProformaCalc.solve_circular()
+        self.iteration = {}
+        # Name -> the inputs it depends on, for each cell
+        self.cell_inputs = {}
+        # Name -> the inputs it depends on, for cells shared between instances
+        self.shared_cells = {}
+        # Every range the formulae refer to, with the names of the formulae
+        self.range_index = RangeIndex()
+        self._toolkit_call = None
+        if config.globals:
+            self._toolkit_call = re.compile(
+                r'(?<![\w.])(?:' + '|'.join(sorted(map(re.escape, config.globals))) + r')\(')
+
+        self.stats = GenerationStats(trace_memory=bool(config.profile))
+        self.formulae = set()  # distinct formulae translated
+        # Cells which must be generated: outputs, and what subclasses rely on
+        self.roots = set(config.outputs.values()) | set(config.keep)
 
     def reformulate(self, cells):
         assert cells.Formula.startswith('='), cells.Formula
         formula = cells.Formula[1:]  # skip the '='
         self.pythonify.sheet = cells.Worksheet.Name
+        self.pythonify.references = set()
         return self.parser.parse(formula, semantics=self.pythonify)
 
     def formulae_on_sheets(self, sheets, aliases):
@@ -243,7 +568,6 @@ class ExcelToPy:
         :return:
         """
         # TODO: Implement
-        print("XXX")
         return {}
 
     def add_names_as_aliases(self, book):
@@ -264,46 +588,211 @@ class ExcelToPy:
         range_to_name.update(self.pythonify.aliases)
         self.pythonify.aliases = range_to_name
 
+    def index_ranges(self, translations):
+        """
+        Index the ranges each formula refers to, directly or by name.
+
+        :param translations: dict of name -> Translation
+        """
+        name_to_range = {
+            name: reference
+            for reference, name in self.pythonify.aliases.items()
+            if '!' in reference
+        }
+        for name, translation in sorted(translations.items()):
+            for looked_up in translation.lookups:
+                reference = looked_up if '!' in looked_up else name_to_range.get(looked_up)
+                if reference is None:
+                    continue
+                try:
+                    self.range_index.add(reference, name)
+                except ValueError:
+                    pass  # e.g. #REF!
+
+    def dependents(self, reference):
+        """
+        :param reference: a cell, e.g. "Sheet1!$B$4"
+        :return: sorted list of the names of formulae using a range which contains the cell
+        """
+        return sorted(self.range_index.dependents(reference))
+
+    def share_cells(self, properties):
+        """
+        Find the inputs each of the configured shared cells depends on
+
+        :param properties: the names of the cells generated as properties
+        """
+        properties = set(properties)
+        circular = {name for names in self.circular for name in names}
+        for name in sorted(self.config.shared_cells):
+            if name not in properties or name in circular:
+                print(f"Not sharing {name}: it isn't a formula, or it's a circular reference")
+                continue
+            self.shared_cells[name] = tuple(sorted(self.cell_inputs.get(name, ())))
+
+    def iteration_settings(self, xl):
+        """
+        Excel's iterative calculation settings, unless the config gives them
+
+        :param xl: Excel Application, or None
+        :return: dict of max_iterations, max_change and accelerate_circular
+        """
+        config = self.config
+        return {
+            'max_iterations': config.max_iterations or getattr(xl, 'MaxIterations', None) or 100,
+            'max_change': config.max_change or getattr(xl, 'MaxChange', None) or 0.001,
+            'accelerate_circular': config.accelerate,
+        }
+
+    def calls_toolkit(self, text):
+        """
+        :param text: translated formula
+        :return: True if it calls one of the toolkit functions, config.globals
+        """
+        return self._toolkit_call is not None and self._toolkit_call.search(text) is not None
+
+    def cells(self, reference):
+        """
+        :param reference: e.g. "'Sheet 1'!A1:B2"
+        :return: Range object
+        """
+        sheet_name, cell_name = reference.split('!')
+        return self.book.Sheets[sheet_name.strip("'")].Range(cell_name)
+
+    def has_formula(self, reference):
+        """
+        :param reference: e.g. "'Sheet 1'!A1:B2"
+        :return: True if all its cells have formulae, False if none do, None if some do
+        """
+        return self.cells(reference).HasFormula
+
+    def add_constant_types(self, book):
+        """
+        Update Pythonify's types with those of named constants.
+
+        This is done before any formula is translated so that formulae can use
+        constants defined later in the workbook. Declared input types take precedence.
+        :param book: Workbook object
+        :return: None
+        """
+        for name in book.Names:
+            if (name.RefersTo == '=#NAME?'
+                    or "!Print_Area" in name.Name
+                    or "#REF!" in name.RefersTo
+                    or name.Name in self.pythonify.types):
+                continue
+            cells = name.RefersToRange
+            if not cells.HasFormula:
+                self.pythonify.types[name.Name] = constant_type(cells, self.config.valid_date_formats)
+
     def generate(self):
-        xl, book = self._connect_to_excel()
+        with self.stats.phase('extract'):
+            xl, book = self._connect_to_excel()
+            self.book = book
+            self.iteration.update(self.iteration_settings(xl))
 
-        self.add_names_as_aliases(book)
+            self.add_names_as_aliases(book)
+            self.add_constant_types(book)
 
         # The section which uses a name defines section order.
         sections = [
             BadSection("EXCEL VARIABLES WITH NO USABLE FORMULA"),
-            CalculationSection("External interface", self.config.inputs, self.config.output_sheets, self.config.outputs),
+            CalculationSection(
+                "External interface", self.config.inputs, self.config.outputs, self.graph, self.addresses,
+                self.io_cells, self.circular, self.iteration, self.shared_cells),
             PropertySection("PROPERTIES", self),
-            ConstantSection("CONSTANTS", self.config.valid_date_formats),
+            ConstantSection(
+                "CONSTANTS", self.config.valid_date_formats, self.config.sidecar_cells,
+                os.path.splitext(os.path.basename(self.config.output))[0], bool(self.config.model)),
         ]
-        for name in book.Names:
-            for section in sections:
-                if section.do_name(name):
-                    # Names are handled by the first section which will accept them.
-                    break
-            else:
-                print("Do something about", name.Name)
-
-        # Warning: Changes Pythonify, moving a name from ranges to aliases
-        while self.pythonify.ranges:
-
-            range_name = self.pythonify.ranges.pop()
-            sheet_name, cell_name = range_name.split('!')
-            cells = book.Sheets[sheet_name.strip("'")].Range(cell_name)
-            py_name = Pythonify.py_name(range_name)
-            name = DuckTypeName(py_name, cells)
-            self.pythonify.aliases[range_name] = py_name
-            for section in sections:
-                if section.do_name(name):
+        property_section = sections[2]
+        names = 0
+        with self.stats.phase('sections'):
+            for name in book.Names:
+                names += 1
+                for section in sections:
+                    if section.do_name(name):
+                        # Names are handled by the first section which will accept them.
+                        break
+                else:
+                    print("Do something about", name.Name)
+
+        jobs = {}
+        translations = {}
+        ranges = 0
+        unresolved = 0
+        cache = None
+        if self.config.cache:
+            cache = TranslationCache(self.config.cache, self.pythonify.globals)
+        with FormulaTranslator(self.pythonify, self.config.processes, cache=cache) as translator:
+            while True:
+                pending = property_section.take_pending()
+                with self.stats.phase('parse'):
+                    for job, translation in zip(pending, translator.translate(pending)):
+                        jobs[job.name] = job
+                        translations[job.name] = translation
+                        self.pythonify.ranges.update(
+                            range_name for range_name in translation.ranges
+                            if range_name not in self.pythonify.aliases)
+                if not self.pythonify.ranges:
                     break
-            # get the new name
-            # add it to aliases
-            # process as above - which could add new ranges
-            # TODO:
 
-        self._write_class(reversed(sections))
+                # Warning: Changes Pythonify, moving a name from ranges to aliases
+                with self.stats.phase('ranges'):
+                    for range_name in sorted(self.pythonify.ranges):
+                        ranges += 1
+                        cells = self.cells(range_name)
+                        py_name = Pythonify.py_name(range_name)
+                        name = DuckTypeName(py_name, cells)
+                        self.pythonify.aliases[range_name] = py_name
+                        for section in sections:
+                            if section.do_name(name):
+                                break
+                        else:
+                            unresolved += 1
+                        if not cells.HasFormula and py_name not in self.pythonify.types:
+                            self.pythonify.types[py_name] = constant_type(cells, self.config.valid_date_formats)
+                    self.pythonify.ranges.clear()
+
+            with self.stats.phase('parse'):
+                blocks = property_section.blocks.keys() | property_section.recurrences.keys()
+                passes = resolve_types(translator, jobs, translations, self.pythonify.types, untyped=blocks)
+        property_section.write_cells(translations)
+        self.cell_inputs = self.graph.inputs_used(self.config.inputs.values())
+        self.share_cells(property_section.order)
+        self.index_ranges(translations)
+        if cache is not None:
+            cache.save()
+            print(f"Translation cache: {cache.hits} hits, {cache.misses} misses")
+            self.stats.count('cache_hits', cache.hits)
+            self.stats.count('cache_misses', cache.misses)
+
+        keep = None
+        if self.config.prune_unreachable:
+            keep = self.graph.reachable(self.roots)
+            self._report_pruning(sections, keep)
+
+        with self.stats.phase('write'):
+            self._write_class(reversed(sections), keep)
+        if self.config.model:
+            with self.stats.phase('model'):
+                self._write_model(sections, keep)
         print(self.pythonify.ranges)
 
+        self.stats.count('names', names)
+        self.stats.count('cells', sum(len(section.cells) for section in sections))
+        self.stats.count('spilled_cells', sum(section.cells.spilled for section in sections))
+        self.stats.count('distinct_formulae', len(self.formulae))
+        self.stats.count('ranges', ranges)
+        self.stats.count('unresolved_ranges', unresolved)
+        self.stats.count('indexed_ranges', len(self.range_index))
+        self.stats.count('type_passes', passes)
+        self.stats.count('circular_cells', sum(len(names) for names in self.circular))
+        if keep is not None:
+            self.stats.count('cells_written', len(keep))
+        if self.config.profile:
+            self.stats.write(self.config.profile)
+
     # def _formula_cell(self, name, cells):
     #     if is_tuple_formula(cells):
     #         # raise NotImplementedError("Tuple formulae are ranges of related cells."
@@ -327,25 +816,150 @@ class ExcelToPy:
     #         f"        return {value}\n"
     #     )
 
-    def _write_class(self, sections):
+    def _report_pruning(self, sections, keep):
+        """
+        Print the cells dropped because no output uses them and, with --compile-report,
+        the effect on the generated module.
+
+        Compile time stands in for import time: the generated module's imports
+        may not be available when it is generated. Building and compiling the module
+        twice is slow and needs it in memory, so it's only done when asked for.
+        :param sections: FileSection list
+        :param keep: set of cell names to generate
+        """
+        dropped = sorted(
+            name
+            for section in sections
+            for name in section.cells
+            if name not in keep
+        )
+        print(f"Dropped {len(dropped)} cells which no output uses:")
+        print(wrap_text(', '.join(dropped), 120, '    '))
+        if not self.config.compile_report:
+            return
+        for label, cells in (("Before", None), ("After", keep)):
+            counter = _CharacterCounter()
+            self._write_module(counter, reversed(sections), cells)
+            if counter.size > COMPILE_REPORT_SIZE:
+                print(f"{label}: {counter.size} bytes, too large to compile for this report")
+                continue
+            text = StringIO()
+            self._write_module(text, reversed(sections), cells)
+            start = time.perf_counter()
+            compile(text.getvalue(), self.config.output, 'exec')
+            seconds = time.perf_counter() - start
+            print(f"{label}: {counter.size} bytes, compiled in {seconds:.3f}s")
+
+    def _write_class(self, sections, keep=None):
+        """
+        Write the generated module, and any sheet modules and sidecar files
+
+        Each cell's text is copied to the file in turn, so the module is never
+        held in memory as a whole.
+        :param sections: FileSection list in output order
+        :param keep: If given, the set of cell names to write
+        """
+        sections = list(sections)
         with open(self.config.output, 'w') as f:
-            f.write(
-                '# WARNING: AUTOMATICALLY GENERATED CODE\n'
-                f'# Override this class using {self.config.class_name}\n'
-                f'# Generated at {datetime.datetime.now().isoformat()}\n'
-                f'# {" ".join(sys.argv)}\n'
-                '\n'
-                'from collections import namedtuple\n'
-                'from excel2py.excel_functions import *\n'
-                'from excel2py.base_proforma_calc import BaseProformaCalc\n'
-                f'{self.config.imports}\n'
-                'from excel2py.ex_datetime import ex_datetime\n'
-                '\n'
-                '\n'
-                f'class {self.config.gen_class_name}(BaseProformaCalc):\n'
-            )
-            for section in sections:
-                f.write(section.result())
+            self._write_module(f, sections, keep)
+        directory = os.path.dirname(self.config.output)
+        if self.config.split_sheets:
+            property_section = next(s for s in sections if isinstance(s, PropertySection))
+            for module, cells in property_section.sheet_modules(keep).items():
+                with open(os.path.join(directory, module + '.py'), 'w') as f:
+                    self._write_sheet_module(f, module, cells, keep)
+        constant_section = next(s for s in sections if isinstance(s, ConstantSection))
+        for filename, table in constant_section.sidecar_files(keep).items():
+            write_table(os.path.join(directory, filename), table)
+
+    def _write_model(self, sections, keep=None):
+        """
+        Write the serialized model run by excel2py.interpreter
+        """
+        if self.circular:
+            print(f"Not writing {self.config.model}: the interpreter can't solve circular references")
+            return
+        property_section = next(s for s in sections if isinstance(s, PropertySection))
+        loops = property_section.blocks.keys() | property_section.recurrences.keys()
+        if any(keep is None or name in keep for name in loops):
+            print(f"Not writing {self.config.model}: the interpreter can't calculate blocks of copied formulae")
+            return
+
+        def kept(section):
+            section = next(s for s in sections if isinstance(s, section))
+            return {
+                name: text for name, text in section.expressions.items()
+                if keep is None or name in keep
+            }
+
+        data = model_data(
+            self.config.gen_class_name,
+            self.config.inputs.values(),
+            self.config.outputs.values(),
+            kept(ConstantSection),
+            kept(PropertySection),
+        )
+        with open(self.config.model, 'w') as f:
+            json.dump(data, f)
+
+    def _header(self):
+        return (
+            '# WARNING: AUTOMATICALLY GENERATED CODE\n'
+            f'# Override this class using {self.config.class_name}\n'
+            f'# Generated at {datetime.datetime.now().isoformat()}\n'
+            f'# {" ".join(sys.argv)}\n'
+            '\n'
+        )
+
+    def _write_module(self, f, sections, keep=None):
+        """
+        Write the generated module
+
+        :param f: text file
+        :param sections: FileSection list in output order
+        :param keep: If given, the set of cell names to write
+        """
+        sections = list(sections)
+        f.write(
+            self._header() +
+            'from excel2py.runtime import *\n'
+            f'{self.config.imports}\n'
+        )
+        if self.config.split_sheets:
+            f.write('from excel2py.lazy_sheet import LazySheetProperty\n')
+        if any(isinstance(s, ConstantSection) and s.sidecar_files(keep) for s in sections):
+            f.write('from excel2py.sidecar import SidecarTable\n')
+        f.write(
+            '\n'
+            '\n'
+            f'class {self.config.gen_class_name}(BaseProformaCalc):\n'
+        )
+        for section in sections:
+            section.write_to(f, keep)
+
+    def _write_sheet_module(self, f, module, cells, keep=None):
+        """
+        Write a sheet module
+
+        :param f: text file
+        :param module: name of the sheet module
+        :param cells: CellStore of cell name -> function text
+        :param keep: If given, the set of cell names to write
+        """
+        f.write(
+            self._header() +
+            f'# Cells for {self.config.gen_class_name}, loaded when first used\n'
+            '\n'
+            'from excel2py.runtime import *\n'
+            f'{self.config.imports}\n'
+            '\n'
+        )
+        f.write('CELLS = (\n')
+        for name in cells:
+            if keep is None or name in keep:
+                f.write(f'    {name!r},\n')
+        f.write(')\n\n\n')
+        cells.write_to(f, keep)
 
     def _inputs_and_outputs(self):
         """
@@ -367,6 +981,9 @@ class ExcelToPy:
         return out.getvalue()
 
     def _connect_to_excel(self):
+        # Imported here so the generator can be driven without Excel, e.g. by the benchmarks
+        import win32com.client as win32
+
         xl = win32.gencache.EnsureDispatch('Excel.Application')
         try:
             book = xl.Workbooks(self.config.spreadsheet)
@@ -396,6 +1013,17 @@ def is_date(cells, valid_formats):
     return cells.NumberFormat in valid_formats
 
 
+def cell_reference(cells):
+    """
+    :param cells: Excel Range object
+    :return: Its address including the sheet, e.g. "Sheet1!$A$1" or "'Sheet 1'!$A$1"
+    """
+    sheet = cells.Worksheet.Name
+    if re.search(r'\W', sheet):
+        sheet = f"'{sheet}'"
+    return f"{sheet}!{cells.Address}"
+
+
 def is_tuple_formula(cells):
     """
     Is it a range containing many cells containing formulae?
@@ -60,6 +60,7 @@ cell = /\$?[A-Z]+\$?[0-9]+/
 
 const = number
     | text
+    | error
     ;
 
 number = /[+-]?\d+\.?\d*%?/
@@ -68,6 +69,9 @@ number = /[+-]?\d+\.?\d*%?/
 text = '\"' /[^"]+/ '\"' 
     ;
 
+error = /#(?:NULL!|DIV\/0!|VALUE!|REF!|NAME\?|NUM!|N\/A)/
+    ;
+
 operator = '>=' | '<=' | '<>' | '+' | '-' | '*' | '/' | '^' | '=' | '>' | '<' | '&' 
     ;
 '''
@@ -0,0 +1,633 @@
+"""
+Excel's financial functions: NPV, XNPV, IRR, XIRR, PMT, PV, FV and RATE
+
+Cash flows may be given as separate values, a range (a tuple of rows) or
+any nested sequence; as in Excel, text, logical values and empty cells in
+them are skipped. Errors in the arguments propagate.
+
+IRR, XIRR and RATE solve by Newton's method from the guess, with Excel's
+limits on iterations and accuracy. Where that doesn't converge, they
+bisect the first range of rates in BRACKETS over which the value changes
+sign, nearest the guess, and return #NUM! if there is none. They are
+BatchedFunctions: during calculate_batch() every row's call is solved in
+one bulk call. irr_many(), xirr_many() and rate_many() solve many series at
+once directly, e.g. for a portfolio, and also take NumPy arrays.
+
+With NumPy, the series are solved together: each iteration steps every
+series not yet solved with a few array operations per cash flow. Without
+it, they are solved one at a time.
+
+The runtime registers these functions, so this module is only imported
+by models which use them.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+from collections.abc import Iterable
+import datetime
+import math
+
+try:
+    import numpy
+except ImportError:  # the solvers work without it, one series at a time
+    numpy = None
+
+from excel2py.batching import BatchedFunction
+from excel2py.ex_datetime import to_excel_number
+from excel2py.excel_errors import ERROR_DIV0, ERROR_NUM, ERROR_VALUE, ExcelError, first_error
+
+# Excel's limits for its iterative functions: (iterations, accuracy)
+IRR_LIMITS = (20, 1e-7)
+XIRR_LIMITS = (100, 1e-8)
+RATE_LIMITS = (20, 1e-7)
+
+# Rates between which to bisect, in order, where Newton's method doesn't converge
+BRACKETS = (-0.99, -0.9, -0.5, -0.2, 0.0, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 100.0)
+# Enough steps to bisect the widest of them to within any of the limits' accuracy
+BISECTIONS = 100
+
+
+class _Error(Exception):
+    """Raised within this module to return an Excel error"""
+    def __init__(self, error):
+        super().__init__(error)
+        self.error = error
+
+
+def _number(value):
+    if isinstance(value, ExcelError):
+        raise _Error(value)
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, datetime.datetime):
+        return to_excel_number(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            raise _Error(ERROR_VALUE) from None
+    if value is None:
+        return 0
+    raise _Error(ERROR_VALUE)
+
+
+def _values(*args):
+    """
+    :param args: values, ranges or nested sequences
+    :return: list of the numbers in them, in order
+    """
+    found = []
+    for arg in args:
+        if isinstance(arg, ExcelError):
+            raise _Error(arg)
+        if isinstance(arg, Iterable) and not isinstance(arg, str):
+            for value in arg:
+                if isinstance(value, Iterable) and not isinstance(value, str):
+                    found.extend(_values(value))
+                elif isinstance(value, ExcelError):
+                    raise _Error(value)
+                elif isinstance(value, (int, float, datetime.datetime)) and not isinstance(value, bool):
+                    found.append(_number(value))
+        else:
+            found.append(_number(arg))
+    return found
+
+
+def _excel_errors(function):
+    """Decorator returning an _Error's Excel error, or the first error among the arguments"""
+    def wrapper(*args):
+        error = first_error(args)
+        if error is not None:
+            return error
+        try:
+            return function(*args)
+        except _Error as e:
+            return e.error
+        except ZeroDivisionError:
+            return ERROR_DIV0
+        except OverflowError:
+            return ERROR_NUM
+    wrapper.__name__ = wrapper.__qualname__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
+def _annuity(rate, nper, type_):
+    """
+    :return: (growth, factor): (1 + rate) ** nper, and what a payment each period adds to the future value
+    """
+    if rate == 0:
+        return 1.0, nper
+    growth = (1 + rate) ** nper
+    if isinstance(growth, complex):  # a fractional power of a negative number
+        raise _Error(ERROR_NUM)
+    return growth, (1 + rate * type_) * (growth - 1) / rate
+
+
+@_excel_errors
+def NPV(rate, *values):
+    """
+    :param rate: discount rate per period
+    :param values: cash flows at the end of periods 1, 2, ...
+    """
+    rate = _number(rate)
+    if rate == -1:
+        return ERROR_DIV0
+    discount = 1 / (1 + rate)
+    total = 0.0
+    for value in reversed(_values(*values)):
+        total = (total + value) * discount
+    return total
+
+
+@_excel_errors
+def XNPV(rate, values, dates):
+    """
+    :param rate: annual discount rate
+    :param values: cash flows
+    :param dates: the date of each, none before the first
+    """
+    rate = _number(rate)
+    values, days = _values(values), _values(dates)
+    if rate <= -1 or not values or len(values) != len(days):
+        return ERROR_NUM
+    years = _years(days)
+    return sum(value * (1 + rate) ** -year for value, year in zip(values, years))
+
+
+def _years(days):
+    """
+    :param days: dates as Excel numbers
+    :return: list of years after the first, as XNPV uses them
+    """
+    first = int(days[0])
+    years = [(int(day) - first) / 365 for day in days]
+    if min(years) < 0:
+        raise _Error(ERROR_NUM)
+    return years
+
+
+@_excel_errors
+def PV(rate, nper, pmt, fv=0, type_=0):
+    rate, nper, pmt, fv = _number(rate), _number(nper), _number(pmt), _number(fv)
+    growth, factor = _annuity(rate, nper, 1 if _number(type_) else 0)
+    return -(fv + pmt * factor) / growth
+
+
+@_excel_errors
+def FV(rate, nper, pmt, pv=0, type_=0):
+    rate, nper, pmt, pv = _number(rate), _number(nper), _number(pmt), _number(pv)
+    growth, factor = _annuity(rate, nper, 1 if _number(type_) else 0)
+    return -(pv * growth + pmt * factor)
+
+
+@_excel_errors
+def PMT(rate, nper, pv, fv=0, type_=0):
+    rate, nper, pv, fv = _number(rate), _number(nper), _number(pv), _number(fv)
+    if nper == 0:
+        return ERROR_NUM
+    growth, factor = _annuity(rate, nper, 1 if _number(type_) else 0)
+    return -(fv + pv * growth) / factor
+
+
+def _newton(function, guess, limits):
+    """
+    Solve function(rate) == 0 for a rate above -1
+
+    :param function: of rate, returning (value, derivative)
+    :param limits: (iterations, accuracy), e.g. IRR_LIMITS
+    :return: the rate, or #NUM! if it doesn't converge
+    """
+    iterations, accuracy = limits
+    rate = guess
+    for _ in range(iterations):
+        try:
+            value, derivative = function(rate)
+            step = value / derivative
+        except (ZeroDivisionError, OverflowError):
+            return ERROR_NUM
+        new_rate = rate - step
+        if new_rate <= -1:
+            new_rate = (rate - 1) / 2  # half way to -1, where the cash flows are undefined
+        if abs(new_rate - rate) <= accuracy:
+            return new_rate
+        rate = new_rate
+    return ERROR_NUM
+
+
+def _bisect(function, guess, accuracy):
+    """
+    Solve function(rate) == 0 within the range in BRACKETS holding a solution nearest the guess,
+    by bisection, taking Newton's step instead wherever it stays within the range
+
+    :param function: of rate, returning (value, derivative)
+    :return: the rate, or #NUM! if no range holds one
+    """
+    values = []
+    for rate in BRACKETS:
+        try:
+            value = function(rate)[0]
+        except (ZeroDivisionError, OverflowError):
+            value = None
+        values.append(value if value is not None and math.isfinite(value) else None)
+    ranges = [
+        (low, high, low_value)
+        for low, high, low_value, high_value in zip(BRACKETS, BRACKETS[1:], values, values[1:])
+        if low_value is not None and high_value is not None and _sign(low_value) != _sign(high_value)
+    ]
+    if not ranges:
+        return ERROR_NUM
+    low, high, low_value = min(ranges, key=lambda found: abs((found[0] + found[1]) / 2 - guess))
+    if low_value == 0:
+        return low
+    rate = (low + high) / 2
+    for _ in range(BISECTIONS):
+        try:
+            value, derivative = function(rate)
+        except (ZeroDivisionError, OverflowError):
+            return ERROR_NUM
+        if value == 0:
+            return rate
+        if _sign(value) == _sign(low_value):
+            low, low_value = rate, value
+        else:
+            high = rate
+        new_rate = rate - value / derivative if derivative else high
+        if not low < new_rate < high:
+            new_rate = (low + high) / 2
+        if abs(new_rate - rate) <= accuracy:
+            return new_rate
+        rate = new_rate
+    return ERROR_NUM
+
+
+def _sign(value):
+    return 1 if value > 0 else -1 if value < 0 else 0
+
+
+def _solve(function, guess, limits):
+    """
+    Solve function(rate) == 0 for a rate above -1, by _newton(), else _bisect()
+    """
+    rate = _newton(function, guess, limits)
+    if rate is ERROR_NUM:
+        rate = _bisect(function, guess, limits[1])
+    return rate
+
+
+def _check_signs(values):
+    if not (any(value > 0 for value in values) and any(value < 0 for value in values)):
+        raise _Error(ERROR_NUM)
+
+
+def _irr(values, guess=0.1):
+    """
+    :return: IRR of a list of numbers
+    """
+    _check_signs(values)
+    values = values[::-1]
+
+    def npv(rate):
+        # Horner's method in x = 1 / (1 + rate), with d/dx alongside
+        x = 1 / (1 + rate)
+        total = derivative = 0.0
+        for value in values:
+            derivative = derivative * x + total
+            total = total * x + value
+        return total, -derivative * x * x
+
+    return _solve(npv, guess, IRR_LIMITS)
+
+
+def _xirr(values, days, guess=0.1):
+    """
+    :return: XIRR of lists of numbers
+    """
+    if len(values) != len(days):
+        raise _Error(ERROR_NUM)
+    _check_signs(values)
+    flows = list(zip(values, _years(days)))
+
+    def xnpv(rate):
+        total = derivative = 0.0
+        for value, year in flows:
+            discounted = value * (1 + rate) ** -year
+            total += discounted
+            derivative -= year * discounted
+        return total, derivative / (1 + rate)
+
+    return _solve(xnpv, guess, XIRR_LIMITS)
+
+
+def _rate(nper, pmt, pv, fv=0, type_=0, guess=0.1):
+    """
+    :return: RATE of numbers
+    """
+    type_ = 1 if type_ else 0
+
+    def balance(rate):
+        # pv grown, plus the payments, plus fv, and its derivative in rate
+        if rate == 0:
+            return pv + pmt * nper + fv, pv * nper + pmt * (nper * (nper - 1) / 2 + type_ * nper)
+        growth = (1 + rate) ** nper
+        slope = nper * (1 + rate) ** (nper - 1)
+        value = pv * growth + pmt * (1 / rate + type_) * (growth - 1) + fv
+        derivative = pv * slope + pmt * ((1 / rate + type_) * slope - (growth - 1) / rate ** 2)
+        return value, derivative
+
+    return _solve(balance, guess, RATE_LIMITS)
+
+
+def _solve_many(function, guesses, limits):
+    """
+    As _solve() for many series at once, with NumPy
+
+    :param function: of (rates, rows), arrays of rates and the series they are for,
+            returning arrays of (values, derivatives) of those series at those rates
+    :param guesses: array with a guess for each series
+    :param limits: (iterations, accuracy), e.g. IRR_LIMITS
+    :return: array of rates, NaN where there is none
+    """
+    iterations, accuracy = limits
+    solved = numpy.full(len(guesses), numpy.nan)
+    rows = numpy.arange(len(guesses))
+    rates = guesses.astype(float)
+    with numpy.errstate(all='ignore'):
+        for _ in range(iterations):
+            if not len(rows):
+                break
+            value, derivative = function(rates, rows)
+            new_rates = rates - value / derivative
+            below = new_rates <= -1
+            new_rates[below] = (rates[below] - 1) / 2  # half way to -1, as _newton()
+            finite = numpy.isfinite(new_rates)
+            converged = finite & (numpy.abs(new_rates - rates) <= accuracy)
+            solved[rows[converged]] = new_rates[converged]
+            rows, rates = rows[finite & ~converged], new_rates[finite & ~converged]
+        unsolved = numpy.flatnonzero(numpy.isnan(solved))
+        if len(unsolved):
+            solved[unsolved] = _bisect_many(function, guesses[unsolved], accuracy, unsolved)
+    return solved
+
+
+def _bisect_many(function, guesses, accuracy, rows):
+    """
+    As _bisect() for many series at once, with NumPy
+
+    :param rows: array of the series to solve, for function
+    :return: array of rates, NaN where there is none
+    """
+    brackets = numpy.array(BRACKETS)
+    signs = numpy.sign([function(numpy.full(len(rows), rate), rows)[0] for rate in BRACKETS])
+    changes = ~numpy.isnan(signs[:-1]) & ~numpy.isnan(signs[1:]) & (signs[:-1] != signs[1:])
+    distance = numpy.abs((brackets[:-1, None] + brackets[1:, None]) / 2 - guesses)
+    nearest = numpy.argmin(numpy.where(changes, distance, numpy.inf), axis=0)
+    series = numpy.flatnonzero(changes[nearest, numpy.arange(len(rows))])  # those with a range
+    nearest = nearest[series]
+    low, high, low_sign = brackets[nearest], brackets[nearest + 1], signs[nearest, series]
+    solved = numpy.full(len(rows), numpy.nan)
+    solved[series[low_sign == 0]] = low[low_sign == 0]
+    keep = low_sign != 0
+    series, low, high, low_sign = series[keep], low[keep], high[keep], low_sign[keep]
+    rates = (low + high) / 2
+    for _ in range(BISECTIONS):
+        if not len(series):
+            break
+        value, derivative = function(rates, rows[series])
+        sign = numpy.sign(value)
+        left = sign == low_sign
+        low, low_sign, high = numpy.where(left, rates, low), numpy.where(left, sign, low_sign), numpy.where(left, high, rates)
+        new_rates = rates - value / derivative
+        outside = ~((low < new_rates) & (new_rates < high))
+        new_rates[outside] = ((low + high) / 2)[outside]
+        new_rates[value == 0] = rates[value == 0]
+        done = numpy.abs(new_rates - rates) <= accuracy
+        solved[series[done]] = new_rates[done]
+        keep = ~done & ~numpy.isnan(value)
+        series, rates, low, high, low_sign = series[keep], new_rates[keep], low[keep], high[keep], low_sign[keep]
+    return solved
+
+
+def _irr_arrays(flows, guesses):
+    """
+    :param flows: 2-D array with a series of cash flows in each row, padded with zeros
+    :param guesses: array with a guess for each row
+    :return: array of IRRs, NaN where there is none
+    """
+    rates = numpy.full(len(flows), numpy.nan)
+    valid = _signs_change(flows)
+    # A column per series, latest cash flow first, so each step of Horner's method is one row
+    columns = numpy.ascontiguousarray(flows[valid, ::-1].T)
+
+    def npv(rates, rows):
+        x = 1 / (1 + rates)
+        total, derivative = numpy.zeros(len(rows)), numpy.zeros(len(rows))
+        for values in _columns(columns, rows):
+            derivative *= x
+            derivative += total
+            total *= x
+            total += values
+        return total, -derivative * x * x
+
+    rates[valid] = _solve_many(npv, guesses[valid], IRR_LIMITS)
+    return rates
+
+
+def _xirr_arrays(flows, days, guesses):
+    """
+    :param flows: 2-D array with a series of cash flows in each row, padded with zeros
+    :param days: 2-D array of their dates, as Excel numbers, or 1-D if every row's are the same
+    :param guesses: array with a guess for each row
+    :return: array of XIRRs, NaN where there is none
+    """
+    days = numpy.trunc(numpy.broadcast_to(days, flows.shape))
+    years = (days - days[:, :1]) / 365
+    rates = numpy.full(len(flows), numpy.nan)
+    valid = _signs_change(flows) & (years >= 0).all(axis=1)
+    columns, year_columns = numpy.ascontiguousarray(flows[valid].T), numpy.ascontiguousarray(years[valid].T)
+
+    def xnpv(rates, rows):
+        growth = 1 + rates
+        total, derivative = numpy.zeros(len(rows)), numpy.zeros(len(rows))
+        for values, year in zip(_columns(columns, rows), _columns(year_columns, rows)):
+            discounted = values * growth ** -year
+            total += discounted
+            derivative -= year * discounted
+        return total, derivative / growth
+
+    rates[valid] = _solve_many(xnpv, guesses[valid], XIRR_LIMITS)
+    return rates
+
+
+def _rate_arrays(nper, pmt, pv, fv, type_, guesses):
+    """
+    :param nper, pmt, pv, fv, type_: arrays of RATE's arguments, one element per call
+    :param guesses: array with a guess for each call
+    :return: array of rates, NaN where there is none
+    """
+    type_ = (type_ != 0).astype(float)
+
+    def balance(rates, rows):
+        n, p, v, f, t = nper[rows], pmt[rows], pv[rows], fv[rows], type_[rows]
+        growth = (1 + rates) ** n
+        slope = n * (1 + rates) ** (n - 1)
+        value = v * growth + p * (1 / rates + t) * (growth - 1) + f
+        derivative = v * slope + p * ((1 / rates + t) * slope - (growth - 1) / rates ** 2)
+        zero = rates == 0
+        value[zero] = (v + p * n + f)[zero]
+        derivative[zero] = (v * n + p * (n * (n - 1) / 2 + t * n))[zero]
+        return value, derivative
+
+    return _solve_many(balance, guesses, RATE_LIMITS)
+
+
+def _signs_change(flows):
+    """
+    :return: array of True for each row of flows with both positive and negative cash flows
+    """
+    return (flows > 0).any(axis=1) & (flows < 0).any(axis=1)
+
+
+def _columns(columns, rows):
+    """
+    :param columns: 2-D array with a column for each series
+    :param rows: array of the series wanted
+    :return: the columns of those series, without a copy if they're all wanted
+    """
+    return columns if len(rows) == columns.shape[1] else columns[:, rows]
+
+
+def _padded(series):
+    """
+    :param series: list of lists of numbers
+    :return: 2-D array with a row for each, padded with zeros
+    """
+    table = numpy.zeros((len(series), max(map(len, series), default=0)))
+    for row, values in zip(table, series):
+        row[:len(values)] = values
+    return table
+
+
+def _solve_each(calls, arguments, solve, solve_arrays):
+    """
+    :param calls: sequence of argument tuples
+    :param arguments: converts a call's arguments to solve()'s, raising _Error if it can't
+    :param solve: _irr, _xirr or _rate, for one call
+    :param solve_arrays: with NumPy, solves every call at once: a function of the
+            list of solve()'s arguments, returning an array of rates, NaN where there is none
+    :return: list of results, an Excel error where a call fails
+    """
+    results = []
+    found = {}  # index in results -> solve()'s arguments
+    for args in calls:
+        result = first_error(args)
+        if result is None:
+            try:
+                found[len(results)] = arguments(*args)
+            except _Error as e:
+                result = e.error
+        results.append(result)
+    if numpy is None:
+        for i, args in found.items():
+            try:
+                results[i] = solve(*args)
+            except _Error as e:
+                results[i] = e.error
+    elif found:
+        for i, rate in zip(found, _results(solve_arrays(list(found.values())))):
+            results[i] = rate
+    return results
+
+
+def _results(rates):
+    """
+    :param rates: array of rates, NaN where there is none
+    :return: list of the rates, #NUM! where there is none
+    """
+    return [ERROR_NUM if rate != rate else rate for rate in rates.tolist()]  # NaN isn't equal to itself
+
+
+def _is_array(calls):
+    return numpy is not None and isinstance(calls, numpy.ndarray)
+
+
+def irr_many(calls, guess=0.1):
+    """
+    IRR of many series of cash flows
+
+    :param calls: sequence of (values,) or (values, guess), values as for IRR,
+            or a 2-D NumPy array with a series of cash flows in each row
+    :param guess: for each row of an array
+    :return: list of IRRs, or Excel errors
+    """
+    if _is_array(calls):
+        flows = calls.astype(float)
+        return _results(_irr_arrays(flows, numpy.full(len(flows), float(guess))))
+
+    def arguments(values, guess=0.1):
+        return _values(values), _number(guess)
+
+    def solve_arrays(found):
+        return _irr_arrays(_padded([values for values, _ in found]), numpy.array([guess for _, guess in found]))
+
+    return _solve_each(calls, arguments, _irr, solve_arrays)
+
+
+def xirr_many(calls, dates=None, guess=0.1):
+    """
+    XIRR of many series of cash flows
+
+    :param calls: sequence of (values, dates) or (values, dates, guess), as for XIRR,
+            or a 2-D NumPy array with a series of cash flows in each row
+    :param dates: for an array, the dates of its cash flows as Excel numbers: an array
+            of the same shape, or with one row if every series has the same dates
+    :param guess: for each row of an array
+    :return: list of XIRRs, or Excel errors
+    """
+    if _is_array(calls):
+        flows = calls.astype(float)
+        return _results(_xirr_arrays(flows, numpy.asarray(dates, dtype=float), numpy.full(len(flows), float(guess))))
+
+    def arguments(values, dates, guess=0.1):
+        values, days = _values(values), _values(dates)
+        if len(values) != len(days):
+            raise _Error(ERROR_NUM)
+        return values, days, _number(guess)
+
+    def solve_arrays(found):
+        # Padded with cash flows of zero on the last date, which make no difference
+        width = max(len(values) for values, _, _ in found)
+        return _xirr_arrays(
+            _padded([values for values, _, _ in found]),
+            _padded([days + days[-1:] * (width - len(days)) for _, days, _ in found]),
+            numpy.array([guess for _, _, guess in found]))
+
+    return _solve_each(calls, arguments, _xirr, solve_arrays)
+
+
+def rate_many(calls):
+    """
+    RATE of many annuities
+
+    :param calls: sequence of the arguments to RATE, or a 2-D NumPy array with a
+            row of them for each call: nper, pmt, pv and, optionally, fv, type and guess
+    :return: list of rates, or Excel errors
+    """
+    if _is_array(calls):
+        defaults = numpy.array([0.0, 0.0, 0.1])[calls.shape[1] - 3:]  # fv, type and guess not given
+        calls = numpy.hstack([calls.astype(float), numpy.tile(defaults, (len(calls), 1))])
+        return _results(_rate_arrays(*numpy.ascontiguousarray(calls.T)))
+
+    def arguments(nper, pmt, pv, fv=0, type_=0, guess=0.1):
+        return tuple(map(_number, (nper, pmt, pv, fv, type_, guess)))
+
+    def solve_arrays(found):
+        return _rate_arrays(*numpy.array(found, dtype=float).T.copy())
+
+    return _solve_each(calls, arguments, _rate, solve_arrays)
+
+
+IRR = BatchedFunction(irr_many, 'IRR')
+XIRR = BatchedFunction(xirr_many, 'XIRR')
+RATE = BatchedFunction(rate_many, 'RATE')
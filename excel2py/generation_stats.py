@@ -0,0 +1,92 @@
+"""
+Where the generator spends its time
+
+GenerationStats times named phases (wall and CPU time, and peak memory when
+enabled) and keeps counts such as the number of names and distinct formulae.
+The result is JSON for build dashboards.
+
+Usage:
+    stats = GenerationStats(trace_memory=True)
+    with stats.phase('extract'):
+        ...
+    stats.count('names', 42)
+    print(stats.to_json())
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class GenerationStats:
+    """
+    Phase timings and counts for one run of the generator.
+    """
+    def __init__(self, trace_memory=False):
+        """
+        :param trace_memory: Measure peak memory per phase. This slows generation.
+        """
+        self.trace_memory = trace_memory
+        # name -> {'calls', 'wall_seconds', 'cpu_seconds', 'peak_bytes'}
+        self.phases = {}
+        self.counts = {}
+        self._peaks = []  # peak memory seen by each active phase
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a phase. Phases may nest and may be entered repeatedly: times accumulate.
+        """
+        if self.trace_memory:
+            self._reset_peak()
+            self._peaks.append(0)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            stats = self.phases.setdefault(
+                name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_bytes': None})
+            stats['calls'] += 1
+            stats['wall_seconds'] += time.perf_counter() - wall
+            stats['cpu_seconds'] += time.process_time() - cpu
+            if self.trace_memory:
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                stats['peak_bytes'] = max(stats['peak_bytes'] or 0, peak)
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                self._reset_peak()
+
+    def _reset_peak(self):
+        """Start measuring the peak afresh, keeping the peak so far for the enclosing phase"""
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+        if hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+            tracemalloc.reset_peak()
+
+    def count(self, name, value):
+        """
+        Record a count, e.g. the number of names in the workbook
+        """
+        self.counts[name] = value
+
+    def as_dict(self):
+        return {'phases': self.phases, 'counts': self.counts}
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+    def write(self, path):
+        """
+        :param path: file for the JSON, or '-' for stderr, apart from the generator's messages
+        """
+        if path == '-':
+            print(self.to_json(), file=sys.stderr)
+        else:
+            with open(path, 'w') as f:
+                f.write(self.to_json())
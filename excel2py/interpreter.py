@@ -0,0 +1,315 @@
+"""
+Run a calculation from a serialized model instead of generated code
+
+The generator can also write the model as JSON (see --model): each cell's
+translated expression compiled to a short list of stack instructions, plus
+the inputs and outputs. Model loads that file and evaluates the cells an
+output needs in a tight loop. Loading reads one file, with nothing to
+compile, so one process can hold many models cheaply.
+
+Instructions, as stored:
+    ["const", value]        push a value
+    ["error", code]         push an Excel error, e.g. "#N/A"
+    ["load", name]          push the value of a cell, constant or input
+    ["call", function, n]   call a function with the top n values
+    ["unary", operator]     e.g. "neg", from the operator module
+    ["binary", operator]    e.g. "add", "eq"
+    ["tuple", n]            make a tuple of the top n values
+
+A model runs the generated cells only. Overrides in a hand-written
+subclass of the generated class don't apply.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import ast
+import builtins
+from collections import namedtuple
+import json
+import operator
+
+import excel2py.runtime
+from excel2py.excel_errors import ERRORS, ExcelError
+from excel2py.dependency_graph import evaluation_order
+
+FORMAT = 1
+
+# The builtins generated code calls. Not eval(), open() and the like: a model
+# file is data, and loading it mustn't be able to run arbitrary code.
+BUILTINS = ('abs', 'bool', 'float', 'int', 'len', 'max', 'min', 'range', 'round', 'str', 'sum', 'tuple', 'zip')
+
+_BINARY = {
+    ast.Add: 'add', ast.Sub: 'sub', ast.Mult: 'mul', ast.Div: 'truediv',
+    ast.FloorDiv: 'floordiv', ast.Mod: 'mod', ast.Pow: 'pow',
+}
+_COMPARE = {
+    ast.Eq: 'eq', ast.NotEq: 'ne', ast.Lt: 'lt', ast.LtE: 'le', ast.Gt: 'gt', ast.GtE: 'ge',
+}
+_UNARY = {ast.USub: 'neg', ast.UAdd: 'pos', ast.Not: 'not_'}
+
+# Opcodes after loading
+CONST, LOAD, CALL, UNARY, BINARY, TUPLE = range(6)
+
+
+def compile_expression(text):
+    """
+    Compile one cell's Python expression, as generated, to instructions
+
+    :param text: e.g. "IF(self.a>self.b,self.a-self.b,0)"
+    :return: list of instructions, see above
+    :raise ValueError: if the expression uses Python the model can't represent
+    """
+    try:
+        tree = ast.parse(text.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"Can't parse {text!r}: {e}") from None
+    try:
+        return [list(instruction) for instruction in _compile(tree.body)]
+    except ValueError as e:
+        raise ValueError(f"Can't compile {text!r}: {e}") from None
+
+
+def _compile(node):
+    try:
+        yield 'const', _literal(ast.literal_eval(node))
+        return
+    except ValueError:
+        pass
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == 'self':
+        yield 'load', node.attr
+    elif isinstance(node, ast.Name) and node.id in ERRORS:
+        yield 'error', ERRORS[node.id].code
+    elif isinstance(node, ast.Call) and not node.keywords:
+        function = _dotted_name(node.func)
+        for arg in node.args:
+            yield from _compile(arg)
+        yield 'call', function, len(node.args)
+    elif isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        yield from _compile(node.left)
+        yield from _compile(node.right)
+        yield 'binary', _BINARY[type(node.op)]
+    elif isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _COMPARE:
+        yield from _compile(node.left)
+        yield from _compile(node.comparators[0])
+        yield 'binary', _COMPARE[type(node.ops[0])]
+    elif isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY:
+        yield from _compile(node.operand)
+        yield 'unary', _UNARY[type(node.op)]
+    elif isinstance(node, ast.Tuple):
+        for element in node.elts:
+            yield from _compile(element)
+        yield 'tuple', len(node.elts)
+    else:
+        raise ValueError(f"unsupported {type(node).__name__}")
+
+
+def _dotted_name(node):
+    """
+    :return: the name of a function, e.g. 'ROUND' or 'math.floor'
+    """
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return _dotted_name(node.value) + '.' + node.attr
+    raise ValueError(f"unsupported function {type(node).__name__}")
+
+
+def _literal(value):
+    """
+    Check a constant can be stored as JSON, given tuples are stored as lists.
+    """
+    if isinstance(value, tuple):
+        for item in value:
+            _literal(item)
+    elif not (value is None or isinstance(value, (bool, int, float, str))):
+        raise ValueError(f"unsupported constant {value!r}")
+    return value
+
+
+def model_data(class_name, inputs, outputs, constants, cells):
+    """
+    :param class_name: name of the generated class the model is equivalent to
+    :param inputs: names of the inputs
+    :param outputs: names of the outputs, in the order calculate() returns them
+    :param constants: dict of name -> Python expression, evaluated when the model is loaded
+    :param cells: dict of name -> Python expression, evaluated when needed
+    :return: dict to store as JSON
+    """
+    return {
+        'format': FORMAT,
+        'class': class_name,
+        'inputs': list(inputs),
+        'outputs': list(outputs),
+        'constants': {name: compile_expression(text) for name, text in constants.items()},
+        'cells': {name: compile_expression(text) for name, text in cells.items()},
+    }
+
+
+def _tuples(value):
+    """JSON has lists where the model had tuples"""
+    if isinstance(value, list):
+        return tuple(_tuples(item) for item in value)
+    return value
+
+
+def _run(code, values):
+    """
+    :param code: list of (opcode, argument)
+    :param values: list of values, indexed by slot
+    :return: the value of the expression
+    """
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    for op, arg in code:
+        if op == LOAD:
+            push(values[arg])
+        elif op == CONST:
+            push(arg)
+        elif op == BINARY:
+            right = pop()
+            stack[-1] = arg(stack[-1], right)
+        elif op == CALL:
+            function, n = arg
+            if n:
+                args = stack[-n:]
+                del stack[-n:]
+                push(function(*args))
+            else:
+                push(function())
+        elif op == UNARY:
+            stack[-1] = arg(stack[-1])
+        else:  # TUPLE
+            items = tuple(stack[-arg:]) if arg else ()
+            del stack[len(stack) - arg:]
+            push(items)
+    return stack[0]
+
+
+class Model:
+    """
+    A calculation loaded from a serialized model.
+
+    Each name (input, constant or cell) has a slot in a list of values.
+    Constants are evaluated once, on loading.
+    """
+    def __init__(self, data, namespace=None):
+        """
+        :param data: dict from model_data(), e.g. as read from JSON
+        :param namespace: dict of functions the model calls, in addition to
+                the runtime's functions and BUILTINS. Use this for the
+                generator's --imports.
+        """
+        if data.get('format') != FORMAT:
+            raise ValueError(f"Unsupported model format {data.get('format')!r}")
+        self.class_name = data['class']
+        self.inputs = tuple(data['inputs'])
+        self.outputs = tuple(data['outputs'])
+        self._namespace = {name: getattr(builtins, name) for name in BUILTINS}
+        self._namespace.update(excel2py.runtime.functions())
+        self._namespace.update(namespace or {})
+
+        names = list(self.inputs) + list(data['constants']) + list(data['cells'])
+        self.slots = {name: slot for slot, name in enumerate(names)}
+        self.uses = {}
+        self._code = {}
+        for name, code in list(data['constants'].items()) + list(data['cells'].items()):
+            self._code[name] = self._link(name, code)
+
+        self._template = [None] * len(self.slots)
+        for name in data['constants']:
+            self._template[self.slots[name]] = _run(self._code[name], self._template)
+        self._cells = set(data['cells'])
+        self._plans = {}
+
+    @classmethod
+    def load(cls, path, namespace=None):
+        """
+        :param path: JSON file written by the generator's --model option
+        :param namespace: see __init__
+        :return: Model
+        """
+        with open(path) as f:
+            return cls(json.load(f), namespace)
+
+    def _link(self, name, instructions):
+        """
+        Resolve names to slots and functions.
+
+        :return: list of (opcode, argument)
+        """
+        code = []
+        uses = set()
+        for kind, *args in instructions:
+            if kind == 'const':
+                code.append((CONST, _tuples(args[0])))
+            elif kind == 'error':
+                code.append((CONST, ExcelError(args[0])))
+            elif kind == 'load':
+                if args[0] not in self.slots:
+                    raise NameError(f"{name} uses {args[0]}, which isn't in the model")
+                uses.add(args[0])
+                code.append((LOAD, self.slots[args[0]]))
+            elif kind == 'call':
+                code.append((CALL, (self._function(name, args[0]), args[1])))
+            elif kind == 'unary':
+                code.append((UNARY, getattr(operator, args[0])))
+            elif kind == 'binary':
+                code.append((BINARY, getattr(operator, args[0])))
+            elif kind == 'tuple':
+                code.append((TUPLE, args[0]))
+            else:
+                raise ValueError(f"{name}: unknown instruction {kind!r}")
+        self.uses[name] = tuple(sorted(uses))
+        return code
+
+    def _function(self, name, function):
+        first, *rest = function.split('.')
+        try:
+            value = self._namespace[first]
+            for attribute in rest:
+                value = getattr(value, attribute)
+        except (KeyError, AttributeError):
+            raise NameError(f"{name} calls {function}, which isn't defined") from None
+        return value
+
+    def _plan(self, outputs):
+        """
+        :return: (list of (slot, code) to run in order, output slots, result namedtuple type)
+        """
+        try:
+            return self._plans[outputs]
+        except KeyError:
+            pass
+        unknown = set(outputs) - set(self.outputs)
+        if unknown:
+            raise TypeError(f"calculate() got {len(unknown)} unknown outputs {','.join(sorted(unknown))}")
+        cell_uses = {name: self.uses[name] for name in self._cells}
+        steps = [
+            (self.slots[name], self._code[name])
+            for name in evaluation_order(cell_uses, outputs)
+            if name in self._cells
+        ]
+        plan = steps, [self.slots[name] for name in outputs], namedtuple('CalcResult', outputs)
+        self._plans[outputs] = plan
+        return plan
+
+    def calculate(self, outputs=None, **inputs):
+        """
+        :param outputs: sequence of output names, or None for all of them
+        :param inputs: a value for each input
+        :return: CalcResult namedtuple of the outputs, as the generated class's calculate()
+        """
+        missing = set(self.inputs) - set(inputs)
+        if missing:
+            raise TypeError(f"calculate() missing {len(missing)} required arguments {','.join(sorted(missing))}")
+        extra = set(inputs) - set(self.inputs)
+        if extra:
+            raise TypeError(f"calculate() got {len(extra)} extra arguments {','.join(sorted(extra))}")
+
+        steps, output_slots, result_type = self._plan(tuple(self.outputs if outputs is None else outputs))
+        values = self._template[:]
+        for name, value in inputs.items():
+            values[self.slots[name]] = value
+        for slot, code in steps:
+            values[slot] = _run(code, values)
+        return result_type(*[values[slot] for slot in output_slots])
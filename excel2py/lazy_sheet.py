@@ -0,0 +1,61 @@
+"""
+Load a generated sheet module only when one of its cells is first used
+
+When generated with --split-sheets, each sheet's cells are written to their
+own module as plain functions. The generated class has a LazySheetProperty
+for each of those cells. The first time any of them is used, the sheet's
+module is imported and all its cells become ordinary properties of the
+class, so later access costs nothing extra.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import importlib.util
+import os
+import sys
+
+
+class LazySheetProperty:
+    """
+    Stands in for a cell property until its sheet module is loaded.
+    """
+    def __init__(self, module):
+        """
+        :param module: name of the sheet module, which is beside the generated module
+        """
+        self.module = module
+        self.owner = None
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        load_sheet(self.owner, self.module)
+        return self.owner.__dict__[self.name].__get__(instance, owner)
+
+
+def load_sheet(cls, module):
+    """
+    Replace the LazySheetProperty objects for a sheet with properties from its module
+
+    :param cls: the generated class
+    :param module: name of the sheet module, which is beside the generated module
+    :return: the sheet module
+    """
+    generated = sys.modules[cls.__module__]
+    full_name = f"{generated.__package__}.{module}" if generated.__package__ else module
+    path = os.path.join(os.path.dirname(generated.__file__), module + '.py')
+    sheet = sys.modules.get(full_name)
+    if sheet is None or sheet.__file__ != path:
+        spec = importlib.util.spec_from_file_location(full_name, path)
+        sheet = importlib.util.module_from_spec(spec)
+        sys.modules[full_name] = sheet
+        spec.loader.exec_module(sheet)
+    for name in sheet.CELLS:
+        placeholder = cls.__dict__.get(name)
+        if isinstance(placeholder, LazySheetProperty):
+            setattr(cls, name, property(getattr(sheet, name)))
+    return sheet
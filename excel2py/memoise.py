@@ -0,0 +1,177 @@
+"""
+Cache the results of toolkit functions, with statistics
+
+Toolkit functions (see config.globals) are usually pure within a run and
+are called with the same arguments by many cells and many calculations.
+Mark them as cacheable where they are defined:
+
+    @cacheable(maxsize=10000, ttl=3600)
+    def tk_factor(name, date):
+        ...
+
+Each function's cache is shared by the whole process. Arguments which are
+ranges (tuples, or lists, of values) are cached by value; calls with
+arguments which can't be hashed go straight to the function.
+cache_stats() reports hits and misses for every cacheable function.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+from collections import OrderedDict, namedtuple
+import functools
+import threading
+import time
+
+# uncacheable: calls with arguments which couldn't be hashed
+# evictions: results dropped because the cache was full
+# expirations: results dropped because they were older than the ttl
+CacheStats = namedtuple('CacheStats', 'name hits misses uncacheable evictions expirations size maxsize')
+
+# name -> FunctionCache for every cacheable function in the process
+_caches = {}
+
+
+class FunctionCache:
+    """
+    A bounded LRU cache of one function's results, optionally with a time to live
+    """
+    def __init__(self, name, maxsize=1024, ttl=None, clock=time.monotonic):
+        """
+        :param name: for statistics, usually the function's name
+        :param maxsize: most results to keep, or None for no limit
+        :param ttl: seconds a result stays valid, or None for as long as the process runs
+        :param clock: function returning the time in seconds
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._results = OrderedDict()  # key -> (result, expiry time)
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """
+        Drop all results and reset the statistics.
+        """
+        with self._lock:
+            self._results.clear()
+            self.hits = 0
+            self.misses = 0
+            self.uncacheable = 0
+            self.evictions = 0
+            self.expirations = 0
+
+    def call(self, function, args):
+        """
+        :return: function(*args), from the cache if possible
+        """
+        try:
+            key = _key(args)
+            hash(key)
+        except TypeError:
+            with self._lock:
+                self.uncacheable += 1
+            return function(*args)
+
+        with self._lock:
+            found = self._results.get(key)
+            if found is not None:
+                result, expires = found
+                if expires is None or self.clock() < expires:
+                    self.hits += 1
+                    self._results.move_to_end(key)
+                    return result
+                del self._results[key]
+                self.expirations += 1
+            self.misses += 1
+
+        # Not holding the lock: the function may be slow, e.g. a database look-up
+        result = function(*args)
+        with self._lock:
+            self._results[key] = (result, None if self.ttl is None else self.clock() + self.ttl)
+            self._results.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._results) > self.maxsize:
+                    self._results.popitem(last=False)
+                    self.evictions += 1
+        return result
+
+    def stats(self):
+        """
+        :return: CacheStats
+        """
+        with self._lock:
+            return CacheStats(
+                self.name, self.hits, self.misses, self.uncacheable,
+                self.evictions, self.expirations, len(self._results), self.maxsize)
+
+
+def _key(value):
+    """
+    A hashable equivalent of the arguments: ranges may be given as lists.
+    """
+    if isinstance(value, (tuple, list)):
+        return tuple(_key(item) for item in value)
+    return value
+
+
+def cacheable(maxsize=1024, ttl=None, name=None, clock=time.monotonic):
+    """
+    Decorator caching a toolkit function's results process-wide
+
+    :param maxsize: most results to keep, or None for no limit
+    :param ttl: seconds a result stays valid, or None for as long as the process runs
+    :param name: name for statistics. Defaults to the function's module and name.
+    :param clock: function returning the time in seconds
+    :return: decorator. The decorated function has a 'cache' attribute, the FunctionCache.
+    """
+    def decorator(function):
+        cache = function_cache(name or f"{function.__module__}.{function.__qualname__}", maxsize, ttl, clock)
+
+        @functools.wraps(function)
+        def cached(*args):
+            return cache.call(function, args)
+
+        cached.cache = cache
+        return cached
+
+    return decorator
+
+
+def function_cache(name, maxsize=1024, ttl=None, clock=time.monotonic):
+    """
+    A FunctionCache included in cache_stats() and clear_caches()
+
+    A cache made again with the same name, e.g. by a module imported again, replaces the old one.
+    :return: FunctionCache
+    """
+    cache = FunctionCache(name, maxsize, ttl, clock)
+    _caches[name] = cache
+    return cache
+
+
+def cache_stats():
+    """
+    :return: list of CacheStats, one per cacheable function or shared cell, by name
+    """
+    return [cache.stats() for _, cache in sorted(_caches.items())]
+
+
+def clear_caches():
+    """
+    Drop the results of all cacheable functions, e.g. when reference data changes.
+    """
+    for cache in _caches.values():
+        cache.clear()
+
+
+def format_cache_stats():
+    """
+    :return: text of the statistics, one line per function
+    """
+    lines = [f"{'hits':>9} {'misses':>9} {'hit rate':>8} {'size':>7}  function"]
+    for stats in cache_stats():
+        calls = stats.hits + stats.misses
+        rate = f"{stats.hits / calls:8.1%}" if calls else f"{'-':>8}"
+        lines.append(f"{stats.hits:9} {stats.misses:9} {rate} {stats.size:7}  {stats.name}")
+    return '\n'.join(lines)
@@ -0,0 +1,227 @@
+"""
+Load generated calculations on demand, keeping a bounded number resident
+
+A service may host many models, e.g. one per version of each workbook.
+ModelRegistry imports a model's module when the model is first asked for,
+and drops the least recently used models when those resident use more
+memory than allowed.
+
+Register the module holding the customised class (the sub-class of the
+generated class, see the generator's class_name) so customisations apply.
+Modules it imports by name, such as the generated module, are shared
+through sys.modules while the model is resident, so give each version's
+modules distinct names; the generator names them after the output file.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import builtins
+from collections import OrderedDict, namedtuple
+import gc
+import importlib.util
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+import types
+
+from excel2py.base_proforma_calc import BaseProformaCalc
+
+# hits, misses: calls to get() which found the model resident or had to load it
+# load_seconds: total time spent loading
+# resident_bytes: estimated memory used by the resident models
+RegistryStats = namedtuple('RegistryStats', 'hits misses loads evictions load_seconds resident resident_bytes')
+
+# A registered model's source: path to its module and, optionally, the class to use
+_Source = namedtuple('_Source', 'path class_name')
+
+# A resident model
+_Loaded = namedtuple('_Loaded', 'cls modules size')
+
+# Numbers the modules loaded, so that each has a unique name
+_loads = itertools.count()
+
+
+class ModelRegistry:
+    """
+    Generated calculation classes by model id and version, loaded on demand.
+    """
+    def __init__(self, max_bytes=None, max_models=None):
+        """
+        :param max_bytes: evict models when those resident use more memory than this.
+                None for no limit. The most recently used model is always kept.
+        :param max_models: evict models when more than this many are resident. None for no limit.
+        """
+        self.max_bytes = max_bytes
+        self.max_models = max_models
+        self._sources = {}
+        self._resident = OrderedDict()  # (model id, version) -> _Loaded, least recently used first
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    def register(self, model_id, version, path, class_name=None):
+        """
+        :param model_id: e.g. the workbook's name
+        :param version: e.g. the workbook's revision
+        :param path: the Python file defining the model's class
+        :param class_name: the class to use. By default, the most derived
+                BaseProformaCalc sub-class defined in the file.
+        """
+        with self._lock:
+            key = (model_id, version)
+            self._sources[key] = _Source(os.path.abspath(path), class_name)
+            if key in self._resident:
+                self._evict(key)
+
+    def __contains__(self, key):
+        """
+        :param key: (model id, version)
+        """
+        return key in self._sources
+
+    def get(self, model_id, version):
+        """
+        :return: the model's class, loading it if need be
+        :raise KeyError: if the model isn't registered
+        """
+        key = (model_id, version)
+        with self._lock:
+            loaded = self._resident.get(key)
+            if loaded is not None:
+                self.hits += 1
+                self._resident.move_to_end(key)
+                return loaded.cls
+            if key not in self._sources:
+                raise KeyError(f"Model {model_id!r} version {version!r} isn't registered")
+            self.misses += 1
+            loaded = self._load(key, self._sources[key])
+            self._resident[key] = loaded
+            self._shrink()
+            return loaded.cls
+
+    def calculator(self, model_id, version, **inputs):
+        """
+        :return: an instance of the model's class for these inputs
+        """
+        return self.get(model_id, version)(**inputs)
+
+    def stats(self):
+        """
+        :return: RegistryStats
+        """
+        with self._lock:
+            return RegistryStats(
+                self.hits, self.misses, self.loads, self.evictions, self.load_seconds,
+                len(self._resident), self.resident_bytes())
+
+    def resident_bytes(self):
+        with self._lock:
+            return sum(loaded.size for loaded in self._resident.values())
+
+    def clear(self):
+        """
+        Evict all resident models. They stay registered.
+        """
+        with self._lock:
+            for key in list(self._resident):
+                self._evict(key)
+
+    def _load(self, key, source):
+        """
+        Import the source's module under a new, unique name.
+
+        :return: _Loaded
+        """
+        start = time.perf_counter()
+        before = set(sys.modules)
+        name = f"_excel2py_model_{next(_loads)}_" + re.sub(r'\W', '_', f"{key[0]}_{key[1]}")
+        directory = os.path.dirname(source.path)
+        spec = importlib.util.spec_from_file_location(name, source.path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        sys.path.insert(0, directory)
+        try:
+            spec.loader.exec_module(module)
+            cls = _model_class(module, source.class_name)
+        except BaseException:
+            for added in set(sys.modules) - before:
+                del sys.modules[added]
+            raise
+        finally:
+            sys.path.remove(directory)
+
+        # Modules imported with the model, e.g. the generated module, belong to it
+        modules = [
+            sys.modules[added] for added in sorted(set(sys.modules) - before)
+            if os.path.dirname(getattr(sys.modules[added], '__file__', None) or '') == directory
+        ]
+        size = module_size(modules)
+        self.loads += 1
+        self.load_seconds += time.perf_counter() - start
+        return _Loaded(cls, [module.__name__ for module in modules], size)
+
+    def _shrink(self):
+        """
+        Evict least recently used models until within the limits
+        """
+        while len(self._resident) > 1 and (
+                (self.max_models is not None and len(self._resident) > self.max_models)
+                or (self.max_bytes is not None and self.resident_bytes() > self.max_bytes)):
+            self._evict(next(iter(self._resident)))
+
+    def _evict(self, key):
+        loaded = self._resident.pop(key)
+        for name in loaded.modules:
+            sys.modules.pop(name, None)
+        self.evictions += 1
+
+
+def _model_class(module, class_name=None):
+    """
+    :return: the named class, or the most derived BaseProformaCalc sub-class defined in the module
+    """
+    if class_name is not None:
+        return getattr(module, class_name)
+    candidates = [
+        value for value in vars(module).values()
+        if isinstance(value, type)
+        and issubclass(value, BaseProformaCalc)
+        and value.__module__ == module.__name__
+    ]
+    leaves = [cls for cls in candidates if not any(other is not cls and issubclass(other, cls) for other in candidates)]
+    if len(leaves) != 1:
+        raise TypeError(f"{module.__file__} defines {len(leaves)} calculation classes; give the class_name")
+    return leaves[0]
+
+
+def module_size(modules):
+    """
+    Estimate the memory used by modules: everything reachable from them
+    except other modules, builtins, and classes and functions defined elsewhere.
+
+    :param modules: list of module objects
+    :return: bytes
+    """
+    names = {module.__name__ for module in modules}
+    shared = {id(vars(builtins))}
+    seen = set()
+    size = 0
+    stack = [vars(module) for module in modules]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or id(obj) in shared:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, types.ModuleType):
+            continue
+        if (isinstance(obj, (type, types.FunctionType, types.BuiltinFunctionType))
+                and getattr(obj, '__module__', None) not in names):
+            continue
+        size += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return size
@@ -0,0 +1,188 @@
+"""
+Per-cell profiling of generated calculations
+
+Profiler makes a subclass of a generated class in which every cell property
+and every function the generated code calls is timed. The generated class
+itself is untouched, so there is no overhead unless you use the subclass.
+
+Split sheets' modules are loaded so that their cells are timed too. The
+formula of a circular cell, evaluated each iteration, has a row of its own,
+e.g. _formula_x.
+
+Usage:
+    profiler = Profiler(MyCalc)
+    calc = profiler.cls(first_input=1, second_input=2)
+    calc.calculate()
+    print(profiler.format_report())
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import time
+import types
+from collections import namedtuple
+
+from excel2py.lazy_sheet import LazySheetProperty, load_sheet
+from excel2py.runtime.registry import LazyFunction
+
+# One row of the hot-cell report. Times are in seconds.
+CellProfile = namedtuple('CellProfile', 'name address accesses evaluations cumulative self_time')
+FunctionProfile = namedtuple('FunctionProfile', 'name calls cumulative')
+
+# Prefix of the methods calculating circular cells, see BaseProformaCalc.solve_circular()
+FORMULA = '_formula_'
+
+
+class _Stats:
+    __slots__ = ('accesses', 'evaluations', 'cumulative', 'self_time')
+
+    def __init__(self):
+        self.accesses = 0
+        self.evaluations = 0
+        self.cumulative = 0.0
+        self.self_time = 0.0
+
+
+class Profiler:
+    """
+    Time each cell and function used by a generated calculation class.
+    """
+    def __init__(self, calc_class, clock=time.perf_counter):
+        """
+        :param calc_class: a generated class (or customised subclass)
+        :param clock: function returning the time in seconds
+        """
+        self.calc_class = calc_class
+        self.clock = clock
+        self.cells = {}  # name -> _Stats
+        self.functions = {}  # name -> [calls, cumulative]
+        # Time spent in cells called by the cells being evaluated; one entry per active cell.
+        self._child_time = []
+        self.cls = self._profiled_class()
+
+    def reset(self):
+        """Discard the statistics gathered so far"""
+        for stats in self.cells.values():
+            stats.__init__()
+        self.functions.clear()
+
+    def _profiled_class(self):
+        namespace = {}
+        wrapped_globals = {}
+        for klass in reversed(self.calc_class.__mro__):
+            # Split sheets' cells are properties once their modules are loaded
+            for module in {value.module for value in vars(klass).values() if isinstance(value, LazySheetProperty)}:
+                load_sheet(klass, module)
+            for name, value in vars(klass).items():
+                if isinstance(value, property) and value.fget is not None:
+                    fget = self._with_timed_globals(value.fget, wrapped_globals)
+                    namespace[name] = property(self._time_cell(name, fget), value.fset, value.fdel, value.__doc__)
+                elif isinstance(value, types.FunctionType) and name.startswith(FORMULA):
+                    # A circular cell's formula, evaluated each iteration by solve_circular()
+                    formula = self._with_timed_globals(value, wrapped_globals)
+                    namespace[name] = self._time_cell(name, formula, cached=False)
+        return type(f"Profiled{self.calc_class.__name__}", (self.calc_class,), namespace)
+
+    def _with_timed_globals(self, fget, wrapped_globals):
+        """
+        A copy of fget which sees timed versions of the functions in its module
+
+        :param fget: property getter
+        :param wrapped_globals: cache of module globals dict id -> timed copy
+        """
+        original = fget.__globals__
+        timed = wrapped_globals.get(id(original))
+        if timed is None:
+            timed = dict(original)
+            for name, value in original.items():
+                if isinstance(value, (types.FunctionType, types.BuiltinFunctionType, LazyFunction)) and not name.startswith('_'):
+                    timed[name] = self._time_function(name, value)
+            wrapped_globals[id(original)] = timed
+        copy = types.FunctionType(fget.__code__, timed, fget.__name__, fget.__defaults__, fget.__closure__)
+        copy.__kwdefaults__ = fget.__kwdefaults__
+        return copy
+
+    def _time_cell(self, name, fget, cached=True):
+        """
+        :param cached: False for a function which evaluates the cell each time it's called
+        """
+        stats = self.cells.setdefault(name, _Stats())
+        cache_name = '_' + name if cached else None
+        clock = self.clock
+        child_time = self._child_time
+
+        def timed(calc):
+            stats.accesses += 1
+            if cache_name is None or getattr(calc, cache_name, None) is None:
+                stats.evaluations += 1
+            child_time.append(0.0)
+            start = clock()
+            try:
+                return fget(calc)
+            finally:
+                elapsed = clock() - start
+                children = child_time.pop()
+                stats.cumulative += elapsed
+                stats.self_time += elapsed - children
+                if child_time:
+                    child_time[-1] += elapsed
+
+        return timed
+
+    def _time_function(self, name, function):
+        clock = self.clock
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stats = self.functions.setdefault(name, [0, 0.0])
+                stats[0] += 1
+                stats[1] += clock() - start
+
+        timed.__name__ = name
+        return timed
+
+    def report(self, key='self_time'):
+        """
+        :param key: CellProfile field to sort by, largest first
+        :return: list of CellProfile for cells which were accessed
+        """
+        addresses = getattr(self.calc_class, 'cell_addresses', {})
+        rows = [
+            CellProfile(
+                name, addresses.get(_cell_name(name), ''), s.accesses, s.evaluations, s.cumulative, s.self_time)
+            for name, s in self.cells.items()
+            if s.accesses
+        ]
+        return sorted(rows, key=lambda row: getattr(row, key), reverse=True)
+
+    def function_report(self):
+        """
+        :return: list of FunctionProfile, most time first
+        """
+        rows = [FunctionProfile(name, calls, cumulative) for name, (calls, cumulative) in self.functions.items()]
+        return sorted(rows, key=lambda row: row.cumulative, reverse=True)
+
+    def format_report(self, limit=20):
+        """
+        :param limit: maximum number of cells and of functions to list
+        :return: text of the hot cells and functions
+        """
+        lines = [f"{'self s':>10} {'cum s':>10} {'evals':>7} {'reads':>7}  cell"]
+        for row in self.report()[:limit]:
+            lines.append(
+                f"{row.self_time:10.6f} {row.cumulative:10.6f} {row.evaluations:7} {row.accesses:7}"
+                f"  {row.name} {row.address}")
+        lines.append('')
+        lines.append(f"{'cum s':>10} {'calls':>7}  function")
+        for row in self.function_report()[:limit]:
+            lines.append(f"{row.cumulative:10.6f} {row.calls:7}  {row.name}")
+        return '\n'.join(lines)
+
+
+def _cell_name(name):
+    """
+    :return: the cell a report row is for, e.g. 'x' for '_formula_x'
+    """
+    return name[len(FORMULA):] if name.startswith(FORMULA) else name
@@ -8,6 +8,9 @@ By Michael Grazebrook of Joined Up Finance Ltd
 import re
 import keyword
 
+from excel2py import type_inference
+from excel2py.excel_errors import ExcelError
+
 
 # A list of names used by Excel: these shouldn't be prefixed with 'self.'
 # List taken from:
@@ -85,6 +88,18 @@ ALL_EXCEL_FUNCTIONS = {
 }
 
 
+class PyExpr(str):
+    """
+    Python text for part of an expression, annotated with its type if known.
+
+    See type_inference for the type names. None means unknown.
+    """
+    def __new__(cls, text, type=None):
+        expr = super().__new__(cls, text)
+        expr.type = type
+        return expr
+
+
 class Pythonify:
     """
     Handle a single Excel expression. Convert it into Python.
@@ -95,7 +110,7 @@ class Pythonify:
     The Excel expression is everything after '='
     """
 
-    def __init__(self, functions: set, aliases: dict = {}):
+    def __init__(self, functions: set, aliases: dict = {}, types: dict = None):
         """
         Parse an Excel expression and reformulate it as Python
 
@@ -104,6 +119,8 @@ class Pythonify:
                 e.g. { 'my_tk_function' }
         :param aliases: Used to ether rename a name or give a range a name
                 e.g. { 'lambda': 'my_lambda', 'Sheet1!A1' : 'limburger_amount' }
+        :param types: Known types of Python names, see type_inference
+                e.g. { 'limburger_amount': 'float' }
         """
         # If ranges used here don't have names, the caller will need to look them up.
         # This is built up as we progress.
@@ -114,6 +131,17 @@ class Pythonify:
 
         self.aliases = aliases
 
+        # Where types are known, function calls can be specialised
+        self.types = {} if types is None else types
+
+        # Names used by the expression(s) parsed since this was last cleared.
+        # The caller uses these to build the dependency graph.
+        self.references = set()
+
+        # Aliases consulted since this was last cleared: text -> alias, or None if not aliased.
+        # A cached translation is only valid while these are unchanged.
+        self.lookups = {}
+
         self.sheet = None
 
     @staticmethod
@@ -121,7 +149,55 @@ class Pythonify:
         py_expression = Pythonify._default(ast)
         # TODO: Can I use autopep8 (pycodestyle) as a library to pretty print it?
         # https://github.com/hhatto/autopep8
-        return py_expression + '\n'
+        parts = _items(ast)
+        py_type = parts[0].type if len(parts) == 1 and isinstance(parts[0], PyExpr) else None
+        return PyExpr(py_expression + '\n', py_type)
+
+    @staticmethod
+    def expression(ast):
+        """
+        Either a single term or [term, operator, expression]
+
+        The parser nests operators to the right, so the whole chain of terms and
+        operators is kept as 'chain' and translated again at each level: division
+        needs its operands in Excel's precedence, see _arithmetic().
+        """
+        if isinstance(ast, (list, tuple)) and len(ast) == 3:
+            left, operator, right = ast
+            chain = [left, operator] + getattr(right, 'chain', [right])
+            expr = _arithmetic(chain)
+            expr.chain = chain
+            return expr
+        return Pythonify._default(ast)
+
+    @staticmethod
+    def group(ast):
+        """
+        A bracketed, comma separated list: a function's arguments or just brackets
+
+        :return: PyExpr with the translated arguments as 'args'
+        """
+        args = [arg for arg in _items(ast[1:-1]) if arg != ',']
+        group = PyExpr(_flatten(ast), args[0].type if len(args) == 1 and isinstance(args[0], PyExpr) else None)
+        group.args = args
+        return group
+
+    def function(self, ast):
+        """
+        Call the generic excel_functions implementation unless argument types are proven.
+        """
+        name, group = ast
+        args = getattr(group, 'args', [])
+        arg_types = [getattr(arg, 'type', None) for arg in args]
+        result_type = type_inference.function_type(name, arg_types)
+        specialised = type_inference.specialise(name, args)
+        if specialised is not None:
+            return PyExpr(specialised, result_type)
+        return PyExpr(_flatten(ast), result_type)
+
+    @staticmethod
+    def text(ast):
+        return PyExpr(_flatten(ast), type_inference.STR)
 
     @staticmethod
     def operator(ast):
@@ -153,6 +229,7 @@ class Pythonify:
                 range_name = f"'{self.sheet}'!{range_name}"
             else:
                 range_name = f"{self.sheet}!{range_name}"
+        self.lookups[range_name] = self.aliases.get(range_name)
         try:
             name = self.aliases[range_name]
         except KeyError:  # NB: Not an error
@@ -161,7 +238,8 @@ class Pythonify:
             self.ranges.add(range_name)
         if name in self.globals:
             return name
-        return f'self.{name}'
+        self.references.add(name)
+        return PyExpr(f'self.{name}', self.types.get(name))
 
     @staticmethod
     def py_name(range_name):
@@ -171,24 +249,34 @@ class Pythonify:
         """
         return re.sub("[ _!:$']+", '', range_name)
 
+    @staticmethod
+    def error(ast):
+        """
+        :param ast: an error literal, e.g. '#N/A'
+        :return: the name of the error value, e.g. ERROR_NA
+        """
+        return PyExpr(ExcelError(_flatten(ast)).name)
+
     @staticmethod
     def number(ast):
         text = _flatten(ast)
         if text[-1] == '%':
-            return repr(float(text[:-1])/100)
-        return text
+            return PyExpr(repr(float(text[:-1])/100), type_inference.FLOAT)
+        return PyExpr(text, type_inference.number_type(text))
 
     def name(self, ast):
         text = _flatten(ast)
+        self.lookups[text] = self.aliases.get(text)
         if text in self.aliases:
             text = self.aliases[text]
         if text == 'TRUE':
-            return 'True'
+            return PyExpr('True', type_inference.BOOL)
         if text == 'FALSE':
-            return 'False'
+            return PyExpr('False', type_inference.BOOL)
         if text in self.globals:
             return text
-        return 'self.' + text
+        self.references.add(text)
+        return PyExpr('self.' + text, self.types.get(text))
 
     @staticmethod
     def _default(ast):
@@ -198,12 +286,56 @@ class Pythonify:
 def _flatten(ast):
     if isinstance(ast, str):
         return ast
-    if isinstance(ast, list):
+    if isinstance(ast, (list, tuple)):  # TatSu versions differ
         return ''.join([_flatten(bit) for bit in ast])
     assert False, repr(ast)  # Should be unreachable
     return repr(ast)
 
 
+def _arithmetic(chain):
+    """
+    Python for a chain of terms and translated operators, e.g. [a, '/', b, '+', c]
+
+    Division is a call of DIVIDE, which returns #DIV/0! rather than raising, so
+    IFERROR and the like see the error. Plain '/' is only kept where the divisor
+    is a non-zero number. The other operators are left to Python's precedence.
+    :return: PyExpr with the type, if known
+    """
+    def typed(part):
+        return part if isinstance(part, PyExpr) else PyExpr(part)
+
+    def combine(parts, operators, join):
+        # Join the operands of a run of operators, left to right
+        combined = [typed(parts[0])]
+        for operator, part in zip(parts[1::2], parts[2::2]):
+            if operator in operators:
+                combined[-1] = join(combined[-1], operator, typed(part))
+            else:
+                combined += [operator, typed(part)]
+        return combined
+
+    def join(left, operator, right):
+        if operator == '/' and not type_inference.non_zero(right):
+            return PyExpr(f'DIVIDE({left},{right})')
+        return PyExpr(left + operator + right, type_inference.operator_type(left.type, operator, right.type))
+
+    parts = combine(combine(chain, ('**',), join), ('*', '/'), join)
+    # The remaining operators, typed as the parser nests them
+    expr = parts[-1]
+    for operator, left in zip(parts[-2::-2], parts[-3::-2]):
+        expr = PyExpr(left + operator + expr, type_inference.operator_type(left.type, operator, expr.type))
+    return expr
+
+
+def _items(ast):
+    """
+    Flatten nested lists from the parser into a list of their parts, keeping each part intact
+    """
+    if isinstance(ast, (list, tuple)):
+        return [item for bit in ast for item in _items(bit)]
+    return [ast]
+
+
 if __name__ == "__main__":
     from expression_parser import expression_parser
 
@@ -0,0 +1,173 @@
+"""
+Find the ranges which contain a cell, without scanning every range
+
+Formulae refer to ranges such as "Sheet1!$B$3:$C$5". RangeIndex keeps,
+for each sheet, an interval tree over the ranges' rows: each node holds
+the ranges spanning its centre row, sorted by their first and by their
+last row. Finding the ranges containing a cell visits one node per level
+of the tree and only those ranges whose rows include the cell's, checking
+their columns.
+
+Each range may carry any number of values, e.g. the names of the
+formulae which use it.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+from collections import namedtuple
+import re
+
+# Excel's limits, for whole rows and columns such as "A:A" or "1:1"
+MAX_ROW = 1048576
+MAX_COLUMN = 16384
+
+# A rectangle of cells. Rows and columns start at 1.
+Area = namedtuple('Area', 'sheet top left bottom right')
+
+_CORNER = re.compile(r'\$?([A-Za-z]{0,3})\$?([0-9]*)')
+
+
+def column_number(letters):
+    """'A' -> 1, 'AA' -> 27"""
+    number = 0
+    for letter in letters.upper():
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+
+def column_letters(column):
+    """1 -> 'A', 27 -> 'AA'"""
+    letters = ''
+    while column:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def parse_reference(reference, sheet=None):
+    """
+    :param reference: e.g. "Sheet1!$A$1", "'Sheet 1'!B3:C5", "Sheet1!A:A" or "B3"
+    :param sheet: the sheet, for references without one
+    :return: Area
+    :raise ValueError: if it isn't a reference to cells
+    """
+    if '!' in reference:
+        sheet, reference = reference.rsplit('!', 1)
+        sheet = sheet.strip("'")
+    if sheet is None:
+        raise ValueError(f"No sheet in {reference!r}")
+    corners = []
+    for corner in reference.split(':'):
+        match = _CORNER.fullmatch(corner)
+        if not match or not any(match.groups()):
+            raise ValueError(f"Not a reference to cells: {reference!r}")
+        letters, digits = match.groups()
+        corners.append((int(digits) if digits else None, column_number(letters) if letters else None))
+    if len(corners) == 1:
+        corners *= 2
+    if len(corners) != 2:
+        raise ValueError(f"Not a reference to cells: {reference!r}")
+    (row1, column1), (row2, column2) = corners
+    rows = (row1 or 1, row2 or MAX_ROW) if row1 is None or row2 is None else (row1, row2)
+    columns = (column1 or 1, column2 or MAX_COLUMN) if column1 is None or column2 is None else (column1, column2)
+    return Area(sheet, min(rows), min(columns), max(rows), max(columns))
+
+
+class _Node:
+    """
+    A node of an interval tree over rows
+    """
+    __slots__ = ('centre', 'by_top', 'by_bottom', 'lower', 'higher')
+
+    def __init__(self, entries):
+        """
+        :param entries: non-empty list of (Area, reference)
+        """
+        rows = sorted(row for area, _ in entries for row in (area.top, area.bottom))
+        self.centre = rows[len(rows) // 2]
+        spanning = [entry for entry in entries if entry[0].top <= self.centre <= entry[0].bottom]
+        lower = [entry for entry in entries if entry[0].bottom < self.centre]
+        higher = [entry for entry in entries if entry[0].top > self.centre]
+        self.by_top = sorted(spanning, key=lambda entry: entry[0].top)
+        self.by_bottom = sorted(spanning, key=lambda entry: -entry[0].bottom)
+        self.lower = _Node(lower) if lower else None
+        self.higher = _Node(higher) if higher else None
+
+    def containing(self, row, column):
+        """
+        :return: iterator of the references whose area contains the cell
+        """
+        node = self
+        while node is not None:
+            if row < node.centre:
+                for area, reference in node.by_top:
+                    if area.top > row:
+                        break
+                    if area.left <= column <= area.right:
+                        yield reference
+                node = node.lower
+            else:
+                for area, reference in node.by_bottom:
+                    if area.bottom < row:
+                        break
+                    if area.left <= column <= area.right:
+                        yield reference
+                node = node.higher if row > node.centre else None
+
+
+class RangeIndex:
+    """
+    Ranges, and the values associated with each, indexed by sheet and position
+    """
+    def __init__(self):
+        self.values = {}  # reference -> set of values
+        self._areas = {}  # reference -> Area
+        self._trees = {}  # sheet -> _Node, built when first needed
+        self._sheets = {}  # sheet -> list of (Area, reference)
+
+    def add(self, reference, value=None, sheet=None):
+        """
+        :param reference: e.g. "Sheet1!$B$3:$C$5"
+        :param value: e.g. the name of a formula using the range
+        :param sheet: the sheet, for references without one
+        :raise ValueError: if the reference isn't to cells
+        """
+        if reference not in self._areas:
+            area = parse_reference(reference, sheet)
+            self._areas[reference] = area
+            self._sheets.setdefault(area.sheet, []).append((area, reference))
+            self._trees.pop(area.sheet, None)
+            self.values[reference] = set()
+        if value is not None:
+            self.values[reference].add(value)
+
+    def __len__(self):
+        return len(self._areas)
+
+    def __contains__(self, reference):
+        return reference in self._areas
+
+    def containing(self, reference, sheet=None):
+        """
+        :param reference: a cell, e.g. "Sheet1!$B$4"
+        :param sheet: the sheet, for references without one
+        :return: list of the references which contain the cell, sorted
+        """
+        area = parse_reference(reference, sheet)
+        tree = self._trees.get(area.sheet)
+        if tree is None:
+            entries = self._sheets.get(area.sheet)
+            if not entries:
+                return []
+            tree = self._trees[area.sheet] = _Node(entries)
+        return sorted(tree.containing(area.top, area.left))
+
+    def dependents(self, reference, sheet=None):
+        """
+        :param reference: a cell, e.g. "Sheet1!$B$4"
+        :param sheet: the sheet, for references without one
+        :return: set of the values of all the ranges which contain the cell
+        """
+        found = set()
+        for containing in self.containing(reference, sheet):
+            found |= self.values[containing]
+        return found
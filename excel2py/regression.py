@@ -0,0 +1,338 @@
+"""
+Check a generated model against values calculated by Excel
+
+After each regeneration, run the model over a file of scenarios, each a
+set of inputs and the outputs Excel calculated for them, and report how
+far each output is from Excel's. The scenarios are exported once, e.g.
+with workbook_scenario() from each of a set of workbooks whose cached
+values Excel has calculated, and reused for every regeneration.
+
+Scenario files are JSON lines, one scenario per line:
+    {"id": "case 17", "inputs": {"age": 63, ...}, "expected": {"pension": 1234.5, ...}}
+or CSV with a column per input and per output, named as the class's
+inputs and outputs, and optionally an "id" column. Expected errors are
+Excel's text for them, e.g. "#N/A".
+
+Scenarios are read as they are needed and calculated in chunks across a
+pool of processes, each of which imports the model once. The results are
+merged as chunks finish, so memory doesn't grow with the number of
+scenarios.
+
+Usage:
+    python -m excel2py.regression gen_mycalc.py scenarios.jsonl --processes 8
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import csv
+import datetime
+import heapq
+import importlib.util
+import inspect
+from itertools import count, islice
+import json
+import math
+import numbers
+import os
+import sys
+
+from excel2py.base_proforma_calc import BaseProformaCalc
+from excel2py.ex_datetime import to_excel_number
+from excel2py.excel_errors import ExcelError, error_from_exception
+
+
+def workbook_scenario(book, inputs, outputs, scenario_id=None):
+    """
+    A scenario from a workbook's cached values: its inputs, and the outputs Excel calculated
+
+    :param book: Excel workbook, as passed to ExcelToPy
+    :param inputs: dict of address -> variable name, e.g. config.inputs
+    :param outputs: dict of address -> variable name, e.g. config.outputs
+    :param scenario_id: to identify the scenario in reports, e.g. the workbook's name
+    :return: dict, as a line of a scenario file
+    """
+    def values(names):
+        found = {}
+        for address, name in names.items():
+            sheet, cell = address.rsplit('!', 1)
+            found[name] = book.Sheets[sheet.strip("'")].Range(cell).Value2
+        return found
+
+    return {'id': scenario_id, 'inputs': values(inputs), 'expected': values(outputs)}
+
+
+def write_scenarios(path, scenarios):
+    """
+    :param path: JSON lines file to write
+    :param scenarios: iterable of dicts with 'inputs' and 'expected', and optionally 'id'
+    """
+    with open(path, 'w') as f:
+        for scenario in scenarios:
+            f.write(json.dumps(scenario, default=_json_value) + '\n')
+
+
+def _json_value(value):
+    if isinstance(value, ExcelError):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return to_excel_number(value)
+    raise TypeError(f"{value!r} can't be stored in a scenario file")
+
+
+def read_scenarios(path, inputs, outputs):
+    """
+    Read scenarios lazily
+
+    :param path: .jsonl or .csv file
+    :param inputs: names of the model's inputs, for CSV columns
+    :param outputs: names of the model's outputs, for CSV columns
+    :return: iterator of (id, inputs dict, expected dict)
+    """
+    if path.lower().endswith('.csv'):
+        with open(path, newline='') as f:
+            for line, row in enumerate(csv.DictReader(f), 2):
+                yield (
+                    row.get('id') or f"line {line}",
+                    {name: _csv_value(row[name]) for name in inputs if name in row},
+                    {name: _csv_value(row[name]) for name in outputs if name in row},
+                )
+        return
+    with open(path) as f:
+        for line, text in enumerate(f, 1):
+            if text.strip():
+                scenario = json.loads(text)
+                yield scenario.get('id') or f"line {line}", scenario['inputs'], scenario['expected']
+
+
+def _csv_value(text):
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def difference(expected, actual, rel_tol, abs_tol):
+    """
+    :return: 0.0 if actual matches expected within the tolerances. Otherwise
+            how far out it is: the absolute difference for numbers, else inf.
+    """
+    if isinstance(actual, ExcelError) or isinstance(expected, str) and expected.startswith('#'):
+        return 0.0 if str(actual) == expected else math.inf
+    if isinstance(actual, datetime.datetime) and isinstance(expected, numbers.Real):
+        actual = to_excel_number(actual)
+    if isinstance(actual, numbers.Real) and isinstance(expected, numbers.Real):
+        if math.isclose(actual, expected, rel_tol=rel_tol, abs_tol=abs_tol):
+            return 0.0
+        return abs(actual - expected)
+    return 0.0 if actual == expected else math.inf
+
+
+class OutputReport:
+    """
+    How one output compares with Excel across the scenarios
+
+    worst: list of (difference, scenario id, expected, actual), largest first
+    """
+    def __init__(self, name, worst_size=5):
+        self.name = name
+        self.worst_size = worst_size
+        self.scenarios = 0
+        self.failures = 0
+        self.max_difference = 0.0
+        self._worst = []  # heap of (difference, sequence, id, expected, actual)
+        self._sequence = count()
+
+    def add(self, scenario_id, expected, actual, diff):
+        self.scenarios += 1
+        if not diff:
+            return
+        self.failures += 1
+        self.max_difference = max(self.max_difference, diff)
+        self._offer(diff, scenario_id, expected, actual)
+
+    def _offer(self, diff, scenario_id, expected, actual):
+        """Keep a failure if it's among the worst"""
+        item = (diff, next(self._sequence), scenario_id, expected, actual)
+        if len(self._worst) < self.worst_size:
+            heapq.heappush(self._worst, item)
+        elif diff > self._worst[0][0]:
+            heapq.heapreplace(self._worst, item)
+
+    def merge(self, other):
+        """Add another report's counts and offenders for the same output"""
+        self.scenarios += other.scenarios
+        self.failures += other.failures
+        self.max_difference = max(self.max_difference, other.max_difference)
+        for diff, _, scenario_id, expected, actual in other._worst:
+            self._offer(diff, scenario_id, expected, actual)
+
+    @property
+    def worst(self):
+        return [item[:1] + item[2:] for item in sorted(self._worst, reverse=True)]
+
+
+def model_inputs(calc_class):
+    """
+    :return: the names of a model class's inputs: its constructor's arguments
+    """
+    return tuple(inspect.signature(calc_class).parameters)
+
+
+# In each pool process: (model class, rel_tol, abs_tol, worst_size), set by _load_model()
+_model = None
+
+
+def load_model(module_path, class_name=None):
+    """
+    Import a generated (or customised) module from a file
+
+    :param module_path: .py file
+    :param class_name: the class to check. If None, the module's one subclass of BaseProformaCalc.
+    :return: the class
+    """
+    directory, file_name = os.path.split(os.path.abspath(module_path))
+    module_name = os.path.splitext(file_name)[0]
+    if directory not in sys.path:
+        sys.path.insert(0, directory)  # for sheet modules and the model's own imports
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    if class_name is not None:
+        return getattr(module, class_name)
+    classes = [
+        value for value in vars(module).values()
+        if isinstance(value, type) and issubclass(value, BaseProformaCalc)
+        and value.__module__ == module_name
+    ]
+    if len(classes) != 1:
+        raise ValueError(f"{module_path} has {len(classes)} model classes: give the class name")
+    return classes[0]
+
+
+def _load_model(module_path, class_name, rel_tol, abs_tol, worst_size):
+    global _model
+    _model = load_model(module_path, class_name), rel_tol, abs_tol, worst_size
+
+
+def _check_chunk(chunk):
+    """
+    :param chunk: list of (id, inputs, expected)
+    :return: dict of output name -> OutputReport for the chunk
+    """
+    calc_class, rel_tol, abs_tol, worst_size = _model
+    reports = {}
+    for scenario_id, inputs, expected in chunk:
+        try:
+            actual = calc_class(**inputs).calculate()._asdict()
+        except Exception as e:
+            error = f"{error_from_exception(e)} {type(e).__name__}: {e}"
+            actual = {name: error for name in expected}
+        for name, value in expected.items():
+            report = reports.get(name)
+            if report is None:
+                report = reports[name] = OutputReport(name, worst_size)
+            result = actual.get(name)
+            report.add(scenario_id, value, result, difference(value, result, rel_tol, abs_tol))
+    return reports
+
+
+def run_regression(module_path, scenarios, class_name=None, processes=None, chunk_size=500,
+                   rel_tol=1e-9, abs_tol=1e-9, worst_size=5, progress=None):
+    """
+    Calculate the model for each scenario and compare the outputs with Excel's
+
+    :param module_path: the generated module, or a customised one
+    :param scenarios: iterable of (id, inputs, expected), e.g. from read_scenarios()
+    :param class_name: see load_model()
+    :param processes: size of the process pool, None for one per CPU, or 1 to run here
+    :param chunk_size: scenarios sent to a process at a time
+    :param rel_tol: relative tolerance, as math.isclose()
+    :param abs_tol: absolute tolerance, as math.isclose()
+    :param worst_size: offenders to keep for each output
+    :param progress: function called with the merged reports after each chunk
+    :return: dict of output name -> OutputReport, in name order
+    """
+    settings = (module_path, class_name, rel_tol, abs_tol, worst_size)
+    reports = {}
+
+    def merge(chunk_reports):
+        for name, report in chunk_reports.items():
+            if name in reports:
+                reports[name].merge(report)
+            else:
+                reports[name] = report
+        if progress:
+            progress(reports)
+
+    scenarios = iter(scenarios)
+    chunks = iter(lambda: list(islice(scenarios, chunk_size)), [])
+    if processes == 1:
+        _load_model(*settings)
+        for chunk in chunks:
+            merge(_check_chunk(chunk))
+    else:
+        processes = processes or os.cpu_count() or 1
+        with ProcessPoolExecutor(processes, initializer=_load_model, initargs=settings) as executor:
+            # A few chunks per process in flight: enough to keep them busy, without reading every scenario
+            limit = 2 * processes
+            running = set()
+            for chunk in chunks:
+                running.add(executor.submit(_check_chunk, chunk))
+                if len(running) >= limit:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        merge(future.result())
+            for future in running:
+                merge(future.result())
+    return dict(sorted(reports.items()))
+
+
+def format_report(reports):
+    """
+    :param reports: from run_regression()
+    :return: text: a line per output, then each failing output's worst offenders
+    """
+    lines = [f"{'output':30} {'scenarios':>10} {'failures':>10} {'max difference':>16}"]
+    for report in reports.values():
+        lines.append(
+            f"{report.name:30} {report.scenarios:10} {report.failures:10} {report.max_difference:16.6g}")
+    for report in reports.values():
+        if report.failures:
+            lines.append(f"\nWorst for {report.name}:")
+            for diff, scenario_id, expected, actual in report.worst:
+                lines.append(f"    {scenario_id}: expected {expected!r}, got {actual!r} (difference {diff:.6g})")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check a generated model against Excel's values")
+    parser.add_argument("module", help="The generated module, or a customised one")
+    parser.add_argument("scenarios", help="Scenario file: .jsonl, or .csv with a column per input and output")
+    parser.add_argument("--class", dest="class_name", help="Class to check (default: the module's model class)")
+    parser.add_argument("--processes", type=int, help="Process pool size (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Scenarios per task (default: 500)")
+    parser.add_argument("--rel-tol", type=float, default=1e-9, help="Relative tolerance (default: 1e-9)")
+    parser.add_argument("--abs-tol", type=float, default=1e-9, help="Absolute tolerance (default: 1e-9)")
+    parser.add_argument("--worst", type=int, default=5, help="Offenders to show per output (default: 5)")
+    args = parser.parse_args(argv)
+
+    calc_class = load_model(args.module, args.class_name)
+
+    def progress(reports):
+        scenarios = max((report.scenarios for report in reports.values()), default=0)
+        failing = sum(1 for report in reports.values() if report.failures)
+        print(f"\r{scenarios} scenarios, {failing} outputs failing", end='', file=sys.stderr, flush=True)
+
+    reports = run_regression(
+        args.module, read_scenarios(args.scenarios, model_inputs(calc_class), calc_class.outputs),
+        calc_class.__name__, args.processes, args.chunk_size, args.rel_tol, args.abs_tol, args.worst,
+        progress)
+    print(file=sys.stderr)
+    print(format_report(reports))
+    return 1 if any(report.failures for report in reports.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+"""
+What generated code needs at run time, and nothing more
+
+Generated modules do "from excel2py.runtime import *", which gives them
+BaseProformaCalc, ex_datetime, the Excel error values and the Excel
+function library. It doesn't import the generator, its parser or Excel
+automation, so a short-lived process running a model only pays for the
+runtime. Functions registered with registry.register(), such as the
+financial functions, are imported when first called.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+from excel2py.base_proforma_calc import BaseProformaCalc
+from excel2py.ex_datetime import ex_datetime
+from excel2py.excel_functions import *
+from excel2py.runtime.registry import LazyFunction, register
+
+__all__ = [
+    name for name in globals()
+    if not name.startswith('_') and name not in ('registry', 'register', 'LazyFunction')
+]
+
+# Imported by models which use them
+for _name in ('FV', 'IRR', 'NPV', 'PMT', 'PV', 'RATE', 'XIRR', 'XNPV'):
+    register(_name, 'excel2py.financial_functions')
+
+
+def functions():
+    """
+    :return: dict of name -> value, as generated code sees them, e.g. for the interpreter
+    """
+    return {name: globals()[name] for name in __all__}
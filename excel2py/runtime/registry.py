@@ -0,0 +1,70 @@
+"""
+Excel functions loaded when first called
+
+Most of the function library is small and imported with the runtime. A
+function which is rarely used, or needs a heavy library such as NumPy, is
+registered here instead: the runtime exports a LazyFunction standing in
+for it, which imports the real function on its first call. Generated code
+calls it like any other function.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import importlib
+import sys
+
+
+class LazyFunction:
+    """
+    Stands in for a function until it's first called
+    """
+    __slots__ = ('__name__', 'target', '_function')
+
+    def __init__(self, name, target):
+        """
+        :param name: the name generated code calls it by, e.g. 'XIRR'
+        :param target: where it is, as 'module:attribute', or 'module' if the attribute is name
+        """
+        self.__name__ = name
+        self.target = target
+        self._function = None
+
+    def __call__(self, *args, **kwargs):
+        function = self._function
+        if function is None:
+            function = self.load()
+        return function(*args, **kwargs)
+
+    def load(self):
+        """
+        Import the function, if it hasn't been already
+
+        :return: the function
+        """
+        if self._function is None:
+            module, _, attribute = self.target.partition(':')
+            self._function = getattr(importlib.import_module(module), attribute or self.__name__)
+        return self._function
+
+    @property
+    def loaded(self):
+        return self._function is not None
+
+    def __repr__(self):
+        return f"LazyFunction({self.__name__!r}, {self.target!r})"
+
+
+def register(name, target):
+    """
+    Add a function to the runtime, to be imported when first called
+
+    Register toolkit functions before importing the generated modules which use them.
+    :param name: the name generated code calls it by
+    :param target: 'module:attribute', see LazyFunction
+    :return: the LazyFunction
+    """
+    function = LazyFunction(name, target)
+    runtime = sys.modules['excel2py.runtime']  # this module's package, so always imported first
+    setattr(runtime, name, function)
+    if name not in runtime.__all__:
+        runtime.__all__.append(name)
+    return function
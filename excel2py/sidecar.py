@@ -0,0 +1,164 @@
+"""
+Keep large constant tables out of the generated module
+
+A named table of thousands of numbers written as a Python literal makes
+the generated module slow to compile and import, and every process using
+it has its own copy. Instead, the generator writes each large numeric table
+to a .npy file beside the generated module, and the class attribute is a
+SidecarTable. The first time it's used, the file is memory-mapped and the
+attribute becomes a MappedTable: a read-only sequence of rows, like the
+tuple of tuples it replaces. Processes mapping the same file share its
+pages.
+
+The files are in NumPy's .npy format (little-endian float64, C order), so
+numpy.load(path, mmap_mode='r') reads them too, but numpy isn't needed.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+from array import array
+import ast
+from collections.abc import Sequence
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'\x93NUMPY'
+_ALIGNMENT = 64
+
+
+def is_numeric_table(value):
+    """
+    :param value: a constant's value, e.g. a range's Value2
+    :return: True if it's a tuple of rows of numbers, all the same length
+    """
+    if not isinstance(value, tuple) or not value or not isinstance(value[0], tuple):
+        return False
+    width = len(value[0])
+    return all(
+        isinstance(row, tuple) and len(row) == width
+        and all(isinstance(item, (int, float)) and not isinstance(item, bool) for item in row)
+        for row in value)
+
+
+def write_table(path, rows):
+    """
+    Write a table of numbers as a .npy file
+
+    :param path: file to write
+    :param rows: tuple of rows of numbers, all the same length
+    """
+    height, width = len(rows), len(rows[0]) if rows else 0
+    header = f"{{'descr': '<f8', 'fortran_order': False, 'shape': ({height}, {width}), }}"
+    # The data starts on an aligned boundary, as numpy expects
+    unpadded = len(MAGIC) + 2 + 2 + len(header) + 1
+    header += ' ' * (-unpadded % _ALIGNMENT) + '\n'
+    data = array('d', (float(item) for row in rows for item in row))
+    if sys.byteorder == 'big':
+        data.byteswap()
+    with open(path, 'wb') as f:
+        f.write(MAGIC + b'\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1'))
+        f.write(data.tobytes())
+
+
+def read_table(path):
+    """
+    Memory-map a table written by write_table()
+
+    :param path: .npy file of a 2-D, little-endian float64 array in C order
+    :return: MappedTable
+    :raise ValueError: if the file isn't such an array
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} isn't a .npy file")
+        major, _ = f.read(2)
+        size_format = '<H' if major == 1 else '<I'
+        (header_size,) = struct.unpack(size_format, f.read(struct.calcsize(size_format)))
+        header = ast.literal_eval(f.read(header_size).decode('latin1'))
+        offset = f.tell()
+        if header.get('descr') != '<f8' or header.get('fortran_order') or len(header.get('shape', ())) != 2:
+            raise ValueError(f"{path} isn't a 2-D array of float64 in C order: {header}")
+        height, width = header['shape']
+        if height * width == 0:
+            return MappedTable(array('d'), height, width)
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    values = memoryview(mapped)[offset:offset + 8 * height * width].cast('d')
+    if sys.byteorder == 'big':
+        values = array('d', values.tobytes())  # a copy, as the file is little-endian
+        values.byteswap()
+    return MappedTable(values, height, width)
+
+
+class MappedTable(Sequence):
+    """
+    A read-only table of numbers: a sequence of rows, each a tuple
+
+    It's equal to, and hashes the same as, the tuple of tuples it replaces,
+    so it can be an argument to memoised functions.
+    """
+    __slots__ = ('_values', '_height', '_width', '_hash')
+
+    def __init__(self, values, height, width):
+        """
+        :param values: the numbers, row by row, e.g. a memoryview of a memory map
+        :param height: number of rows
+        :param width: number of columns
+        """
+        self._values = values
+        self._height = height
+        self._width = width
+        self._hash = None  # found when first needed: it's the same for as long as the table is used
+
+    def __len__(self):
+        return self._height
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self[i] for i in range(*index.indices(self._height)))
+        if index < 0:
+            index += self._height
+        if not 0 <= index < self._height:
+            raise IndexError("table row out of range")
+        start = index * self._width
+        return tuple(self._values[start:start + self._width])
+
+    def __iter__(self):
+        for index in range(self._height):
+            yield self[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (MappedTable, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(tuple(self))
+        return self._hash
+
+    def __repr__(self):
+        return f"MappedTable({self._height} rows, {self._width} columns)"
+
+
+class SidecarTable:
+    """
+    Stands in for a constant table until it's first used.
+    """
+    def __init__(self, filename):
+        """
+        :param filename: the .npy file, beside the generated module
+        """
+        self.filename = filename
+        self.owner = None
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        module = sys.modules[self.owner.__module__]
+        table = read_table(os.path.join(os.path.dirname(module.__file__), self.filename))
+        setattr(self.owner, self.name, table)
+        return table
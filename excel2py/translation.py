@@ -0,0 +1,153 @@
+"""
+Translate many Excel formulae to Python, optionally across a process pool
+
+Once the workbook has been read, translating one formula doesn't depend on
+translating any other, except through the types of the cells it uses. So
+formulae are translated in passes: the first with the types of inputs and
+constants, later passes re-translating only those formulae which use a cell
+whose type has since been inferred. Serial and parallel translation give
+the same results.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+from collections import ChainMap, namedtuple
+import multiprocessing
+
+from excel2py.expression_parser import expression_parser
+from excel2py.pythonify import Pythonify
+
+# A formula to translate.
+# extra_types: types of the cells it uses, learnt since translation started
+Job = namedtuple('Job', 'name formula sheet extra_types')
+
+# The result of translating a formula
+# text: Python text, type: its type, see type_inference
+# references: names it uses, ranges: unnamed ranges it uses
+# lookups: the aliases consulted, see Pythonify.lookups
+Translation = namedtuple('Translation', 'text type references ranges lookups')
+
+# Worker state: one parser and Pythonify per process
+_parser = None
+_pythonify = None
+_base_types = None
+
+
+def _init_worker(functions, aliases, types):
+    global _parser, _pythonify, _base_types
+    _parser = expression_parser()
+    _pythonify = Pythonify(functions, aliases)
+    _base_types = types
+
+
+def _translate(job):
+    """
+    :param job: Job
+    :return: Translation
+    """
+    _pythonify.types = ChainMap(job.extra_types, _base_types)
+    _pythonify.references = set()
+    _pythonify.ranges = set()
+    _pythonify.lookups = {}
+    _pythonify.sheet = job.sheet
+    value = _parser.parse(job.formula, semantics=_pythonify)
+    return Translation(
+        str(value), getattr(value, 'type', None),
+        frozenset(_pythonify.references), frozenset(_pythonify.ranges), _pythonify.lookups)
+
+
+class FormulaTranslator:
+    """
+    Translate formulae, serially or across a pool of processes.
+    """
+    def __init__(self, pythonify, processes=1, chunk_size=64, cache=None):
+        """
+        :param pythonify: Pythonify holding the globals, aliases and types to start with
+        :param processes: Number of worker processes. 1 translates in this process.
+                0 or None means one per CPU.
+        :param chunk_size: Formulae sent to a worker at a time
+        :param cache: TranslationCache of translations from previous runs, or None
+        """
+        self.base_types = dict(pythonify.types)
+        self.aliases = dict(pythonify.aliases)
+        self.init_args = (set(pythonify.globals), self.aliases, self.base_types)
+        self.cache = cache
+        self.processes = processes if processes else multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self._pool = None
+
+    def __enter__(self):
+        if self.processes > 1:
+            self._pool = multiprocessing.Pool(self.processes, _init_worker, self.init_args)
+        else:
+            _init_worker(*self.init_args)
+        return self
+
+    def __exit__(self, *exc):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def translate(self, jobs):
+        """
+        :param jobs: list of Job
+        :return: list of Translation, in the same order as the jobs
+        """
+        if self.cache is None:
+            return self._translate(jobs)
+
+        results = [None] * len(jobs)
+        misses = []
+        for i, job in enumerate(jobs):
+            entry = self.cache.get(job, self.aliases, ChainMap(job.extra_types, self.base_types))
+            if entry is None:
+                misses.append(i)
+            else:
+                results[i] = Translation(
+                    entry['text'], entry['type'],
+                    frozenset(entry['references']), frozenset(entry['ranges']), entry['lookups'])
+        for i, translation in zip(misses, self._translate([jobs[i] for i in misses])):
+            job = jobs[i]
+            self.cache.put(job, translation, ChainMap(job.extra_types, self.base_types))
+            results[i] = translation
+        return results
+
+    def _translate(self, jobs):
+        if self._pool is not None:
+            return self._pool.map(_translate, jobs, self.chunk_size)
+        return [_translate(job) for job in jobs]
+
+
+def resolve_types(translator, jobs, translations, types, untyped=()):
+    """
+    Re-translate formulae until the types of the cells they use are stable.
+
+    Types only ever go from unknown to known, so this terminates.
+    :param translator: FormulaTranslator
+    :param jobs: dict of name -> Job last used to translate it
+    :param translations: dict of name -> Translation, updated in place
+    :param types: dict of name -> type, updated in place with the types of formulae
+    :param untyped: names whose formula's type isn't the cell's, e.g. blocks of formulae
+    :return: number of passes made
+    """
+    passes = 0
+    while True:
+        for name, translation in translations.items():
+            if translation.type is not None and name not in untyped:
+                types[name] = translation.type
+        stale = []
+        for name in sorted(translations):
+            job = jobs[name]
+            learnt = {
+                ref: types[ref]
+                for ref in sorted(translations[name].references)
+                if types.get(ref) is not None and translator.base_types.get(ref) is None
+            }
+            if learnt != job.extra_types:
+                stale.append(job._replace(extra_types=learnt))
+        if not stale:
+            return passes
+        passes += 1
+        for job, translation in zip(stale, translator.translate(stale)):
+            jobs[job.name] = job
+            translations[job.name] = translation
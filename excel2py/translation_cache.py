@@ -0,0 +1,103 @@
+"""
+On-disk cache of formula translations, for fast regeneration
+
+An entry is found by a hash of the formula, its sheet, the globals and the
+version of the translation code. It is only used if the aliases and types
+its translation depended on are unchanged, so that renaming a cell or
+changing the type of an input re-translates just the formulae affected.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import hashlib
+import json
+import os
+
+import excel2py.excel_errors
+import excel2py.expression_parser
+import excel2py.pythonify
+import excel2py.translation
+import excel2py.type_inference
+
+
+def _generator_version():
+    """
+    A hash of the code which translates formulae: any change invalidates the cache.
+    """
+    digest = hashlib.sha256()
+    for module in (excel2py.excel_errors, excel2py.expression_parser, excel2py.pythonify,
+                   excel2py.translation, excel2py.type_inference):
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+GENERATOR_VERSION = _generator_version()
+
+
+class TranslationCache:
+    """
+    Translations from previous runs, stored as JSON.
+    """
+    # Translations kept for each formula
+    VARIANTS = 4
+
+    def __init__(self, path, globals):
+        """
+        :param path: cache file. It needn't exist yet.
+        :param globals: names Pythonify doesn't prefix with 'self.'
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        digest = hashlib.sha256(GENERATOR_VERSION.encode())
+        digest.update('\0'.join(sorted(globals)).encode())
+        self._salt = digest.hexdigest()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('version') == self._salt:
+                self.entries = data['entries']
+
+    def _key(self, job):
+        return hashlib.sha256('\0'.join((self._salt, job.sheet, job.formula)).encode()).hexdigest()
+
+    def get(self, job, aliases, types):
+        """
+        :param job: Job
+        :param aliases: the aliases the job would be translated with
+        :param types: the types the job would be translated with
+        :return: the cached entry (a dict with the fields of Translation) or None
+        """
+        for entry in self.entries.get(self._key(job), ()):
+            if (all(aliases.get(text) == alias for text, alias in entry['lookups'].items())
+                    and all(types.get(name) == type for name, type in entry['types'].items())):
+                self.hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    def put(self, job, translation, types):
+        """
+        Add a translation. A formula may be translated more than once as
+        types are inferred, so each keeps its most recent few translations.
+
+        :param job: Job
+        :param translation: Translation
+        :param types: the types the job was translated with
+        """
+        entry = {
+            'text': translation.text,
+            'type': translation.type,
+            'references': sorted(translation.references),
+            'ranges': sorted(translation.ranges),
+            'lookups': translation.lookups,
+            'types': {name: types.get(name) for name in sorted(translation.references)},
+        }
+        variants = self.entries.setdefault(self._key(job), [])
+        variants.insert(0, entry)
+        del variants[self.VARIANTS:]
+
+    def save(self):
+        with open(self.path, 'w') as f:
+            json.dump({'version': self._salt, 'entries': self.entries}, f)
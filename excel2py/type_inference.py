@@ -0,0 +1,176 @@
+"""
+Type inference for generated code
+
+Excel functions such as SUM, MAX and ROUND are implemented generically in
+excel_functions: they check types, detect dates and skip text. Where the
+types of the arguments are known at generation time, Pythonify can emit
+plain Python instead, e.g. 'a + b' for SUM(a, b).
+
+Types are deduced from constant values, their number formats, input types
+declared in the config and, for formulae, the types of what they use.
+A type of None means "unknown": such cells keep the generic functions.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import re
+
+FLOAT = 'float'
+INT = 'int'
+DATE = 'date'
+STR = 'str'
+BOOL = 'bool'
+
+ALL_TYPES = {FLOAT, INT, DATE, STR, BOOL}
+NUMERIC = {FLOAT, INT}
+
+# Excel number format meaning 'treat as text'
+TEXT_FORMAT = '@'
+
+ARITHMETIC_OPERATORS = {'+', '-', '*', '/', '**'}
+COMPARISON_OPERATORS = {'==', '!=', '>=', '<=', '>', '<'}
+
+
+def constant_type(cells, valid_date_formats):
+    """
+    Type of a non-formula cell
+
+    :param cells: Excel Range object for a single cell
+    :param valid_date_formats: Sequence of Excel date format strings
+    :return: one of ALL_TYPES or None if unknown (e.g. a range of cells)
+    """
+    value = cells.Value2
+    if isinstance(value, bool):
+        return BOOL
+    if isinstance(value, str):
+        return STR
+    if isinstance(value, (int, float)):
+        if cells.NumberFormat in valid_date_formats:
+            return DATE
+        if cells.NumberFormat == TEXT_FORMAT:
+            return None  # a number Excel will treat as text: leave it to the generic code
+        if isinstance(value, int):
+            return INT
+        return FLOAT
+    return None
+
+
+def number_type(text):
+    """
+    :param text: Python text for a numeric literal
+    :return: INT or FLOAT
+    """
+    if any(c in text for c in '.eE'):
+        return FLOAT
+    return INT
+
+
+def non_zero(text):
+    """
+    :param text: Python text for a divisor
+    :return: True if it's a numeric literal other than zero, so plain '/' can't fail
+    """
+    return bool(re.fullmatch(r'[+-]?\d+\.?\d*(e[+-]?\d+)?', text.strip())) and float(text) != 0
+
+
+def operator_type(left, operator, right):
+    """
+    Type of 'left operator right'
+
+    :param left: type of the left operand
+    :param operator: Python operator, possibly padded with spaces
+    :param right: type of the right operand
+    :return: resulting type or None if it can't be proven
+    """
+    operator = operator.strip()
+    if left is None or right is None:
+        return None
+    if operator in COMPARISON_OPERATORS:
+        if left == right or {left, right} <= NUMERIC:
+            return BOOL
+        return None
+    if operator in ARITHMETIC_OPERATORS:
+        if {left, right} <= NUMERIC:
+            if operator in ('/', '**') or FLOAT in (left, right):
+                return FLOAT
+            return INT
+        if operator == '+' and DATE in (left, right) and {left, right} & NUMERIC:
+            return DATE  # ex_datetime + days
+        if operator == '-' and left == DATE:
+            if right == DATE:
+                return FLOAT  # difference in days
+            if right in NUMERIC:
+                return DATE
+        if operator == '+' and left == right == STR:
+            return STR  # '&' is translated to '+'
+    return None
+
+
+def _common_numeric(arg_types):
+    """INT if all are INT, FLOAT if all are numeric, else None"""
+    if not arg_types or not set(arg_types) <= NUMERIC:
+        return None
+    if set(arg_types) == {INT}:
+        return INT
+    return FLOAT
+
+
+def function_type(name, arg_types):
+    """
+    Return type of an Excel function called with arguments of known types
+
+    :param name: Excel function name, e.g. 'SUM'
+    :param arg_types: list of argument types (None where unknown)
+    :return: resulting type or None if it can't be proven
+    """
+    if name in ('SUM', 'PRODUCT', 'MIN', 'MAX'):
+        return _common_numeric(arg_types)
+    if name == 'ROUND' and len(arg_types) == 2 and arg_types[0] in NUMERIC:
+        return arg_types[0]
+    if name in ('ROUNDDOWN', ) and arg_types and arg_types[0] in NUMERIC:
+        return FLOAT
+    if name in ('INT', 'YEAR', 'MONTH', 'DAY'):
+        return INT
+    if name == 'DATE':
+        return DATE
+    if name in ('AND', 'OR', 'ISERROR', 'ISBLANK'):
+        return BOOL
+    if name == 'IF' and len(arg_types) == 3 and arg_types[1] == arg_types[2]:
+        return arg_types[1]
+    return None
+
+
+def specialise(name, args):
+    """
+    Plain Python for an Excel function call whose argument types are proven
+
+    :param name: Excel function name, e.g. 'SUM'
+    :param args: translated arguments, each with a 'type' attribute
+    :return: Python text, or None to keep the generic excel_functions call
+    """
+    arg_types = [getattr(arg, 'type', None) for arg in args]
+    if not args or not set(arg_types) <= NUMERIC:
+        return None
+    if name in ('SUM', 'PRODUCT', 'MIN', 'MAX') and len(args) == 1:
+        return _bracket(args[0])
+    if name == 'SUM':
+        return '(' + ' + '.join(map(_bracket, args)) + ')'
+    if name == 'PRODUCT':
+        return '(' + ' * '.join(map(_bracket, args)) + ')'
+    # MIN and MAX of several values keep the generic functions: an Excel error
+    # compares as false, so the builtins would keep or drop it depending on its position
+    if name == 'ROUND' and len(args) == 2:
+        digits = args[1]
+        if arg_types[1] != INT:
+            digits = f'int({digits})'
+        return f'round({args[0]}, {digits})'
+    return None
+
+
+def _bracket(text):
+    """
+    :return: text in brackets, unless it's a name or number, so it keeps its meaning next to an operator
+    """
+    text = text.strip()
+    if re.fullmatch(r'[\w.]+', text):
+        return text
+    return f'({text})'
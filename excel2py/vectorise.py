@@ -0,0 +1,372 @@
+"""
+Calculate a block of copied formulae as one computation
+
+A column of 600 monthly formulae, each "=A2*B2" one row down from the
+last, is one formula copied down. If every formula in a range has the same
+relative form, the range is translated once: each relative reference
+becomes the range of cells it refers to across the block, and the
+generated code loops over those ranges together, e.g.
+
+    tuple(tuple(a0*a1 for a0, a1 in zip(r0, r1)) for r0, r1 in zip(self.CalcA2A601, self.CalcB2B601))
+
+A reference which is relative in only one direction, such as $A2,
+repeats its one column (or row) across the block. Formulae using relative
+ranges such as SUM(A1:A3) are left as they were, as are blocks whose
+widened ranges mix constants and formulae: such a range would be read as
+constants, Excel's last calculated values, formulae and all.
+
+Only named ranges are calculated as blocks. Copies of a formula in unnamed
+cells, such as a projection column which only its last row's users refer
+to, are still calculated one cell at a time.
+
+A block whose rows refer to the row before, such as a fund value rolled
+forward month by month, is a recurrence. Each column has a formula for its
+first row and one copied down the rest. Its rows are calculated in one
+loop carrying the previous row's values, e.g.
+
+    v0 = [self.in_0]
+    for r0 in self.CalcE2E601:
+        p0 = v0[-1]
+        v0.append(p0*(1+r0[0]))
+    self._fund = tuple(zip(v0))
+
+A step may use the row before in any of the block's columns, and the same
+row in the columns to its left.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+from collections import namedtuple
+import ast
+import re
+
+from excel2py.range_index import Area, column_letters, column_number, parse_reference
+
+# formula: the block's formula for the generator to translate, with each
+# relative reference replaced by the range it covers across the block
+# refs: BlockRef for each distinct range replacing relative references
+# height, width: the block's size
+Block = namedtuple('Block', 'formula refs height width')
+
+# reference: the range as written in the formula, e.g. "Calc!A2:A601"
+# count: how often it appears in the formula
+# rows, columns: True if the reference is relative in that direction
+BlockRef = namedtuple('BlockRef', 'reference count rows columns')
+
+# first: the formula for each column's first row
+# steps: the formula for each column's other rows, with relative references
+# widened as for Block
+# refs: BlockRef for each range replacing relative references in the steps
+# height: the block's number of rows
+Recurrence = namedtuple('Recurrence', 'first steps refs height')
+
+# Names standing for cells of a recurrence in its formulae, e.g.
+# recurrence_prev_1 for the row before in the block's second column and
+# recurrence_curr_0 for the same row in its first column
+PREVIOUS = 'recurrence_prev_'
+CURRENT = 'recurrence_curr_'
+PLACEHOLDER = re.compile(r'recurrence_(prev|curr)_[0-9]+')
+
+_REFERENCE = re.compile(
+    r"(?<![\w.$])"
+    r"(?P<sheet>(?:'[^']+'|[A-Za-z_]\w*)!)?"
+    r"(?P<first>\$?[A-Z]{1,3}\$?[0-9]+)"
+    r"(?::(?P<second>\$?[A-Z]{1,3}\$?[0-9]+))?"
+    r"(?![\w(])")
+_CELL = re.compile(r'(\$?)([A-Z]{1,3})(\$?)([0-9]+)')
+
+
+def _outside_strings(formula):
+    """
+    :return: list of (text, is_code): the parts of the formula outside and inside string literals
+    """
+    return [(part, i % 2 == 0) for i, part in enumerate(formula.split('"'))]
+
+
+def relative_form(formula, row, column):
+    """
+    :param formula: e.g. "=A2*$B$1"
+    :param row: the row of the formula's cell
+    :param column: the column of the formula's cell
+    :return: the formula with relative references as offsets, e.g. "=R[0]C[-2]*$B$1",
+            or None if it uses a relative range
+    """
+    parts = []
+    for text, is_code in _outside_strings(formula):
+        if not is_code:
+            parts.append(text)
+            continue
+        relative_range = False
+
+        def offset(match):
+            nonlocal relative_range
+            if match.group('second'):
+                if (match.group('first') + match.group('second')).count('$') < 4:
+                    relative_range = True
+                return match.group(0)
+            column_absolute, letters, row_absolute, digits = _CELL.fullmatch(match.group('first')).groups()
+            if column_absolute and row_absolute:
+                return match.group(0)
+            column_part = f"${letters}" if column_absolute else f"C[{column_number(letters) - column}]"
+            row_part = f"${digits}" if row_absolute else f"R[{int(digits) - row}]"
+            return (match.group('sheet') or '') + row_part + column_part
+
+        parts.append(_REFERENCE.sub(offset, text))
+        if relative_range:
+            return None
+    return '"'.join(parts)
+
+
+def block_formula(sheet, address, formulae, has_formula):
+    """
+    :param sheet: the block's sheet name
+    :param address: the block's address, e.g. "$C$2:$C$601"
+    :param formulae: tuple of rows of formulae, as Range.Formula
+    :param has_formula: function of a widened reference, e.g. "Calc!A2:A601", returning
+            its Range.HasFormula: True, False or None if it mixes constants and formulae
+    :return: Block, or None if the formulae aren't all copies of one formula
+    """
+    area = parse_reference(address, sheet)
+    height, width = area.bottom - area.top + 1, area.right - area.left + 1
+    if height * width < 2 or len(formulae) != height or any(len(row) != width for row in formulae):
+        return None
+    first = formulae[0][0]
+    if not isinstance(first, str) or not first.startswith('='):
+        return None
+    form = relative_form(first, area.top, area.left)
+    if form is None:
+        return None
+    for i, row in enumerate(formulae):
+        for j, formula in enumerate(row):
+            if relative_form(formula, area.top + i, area.left + j) != form:
+                return None
+
+    refs = {}
+    self_reference = False
+
+    def widen(match):
+        nonlocal self_reference
+        if match.group('second'):
+            return match.group(0)
+        column_absolute, letters, row_absolute, digits = _CELL.fullmatch(match.group('first')).groups()
+        if column_absolute and row_absolute:
+            return match.group(0)
+        top = int(digits)
+        left = column_number(letters)
+        bottom = top if row_absolute else top + height - 1
+        right = left if column_absolute else left + width - 1
+        ref_sheet = match.group('sheet')[:-1].strip("'") if match.group('sheet') else sheet
+        if (ref_sheet == sheet and top <= area.bottom and bottom >= area.top
+                and left <= area.right and right >= area.left):
+            self_reference = True
+        if bottom == top and right == left:
+            return match.group(0)  # the same cell throughout, e.g. G$2 in one column
+        quoted = f"'{ref_sheet}'" if re.search(r'\W', ref_sheet) else ref_sheet
+        reference = f"{quoted}!{column_letters(left)}{top}:{column_letters(right)}{bottom}"
+        count, rows, columns = refs.get(reference, (0, not row_absolute, not column_absolute))
+        refs[reference] = (count + 1, rows, columns)
+        return reference
+
+    parts = []
+    for text, is_code in _outside_strings(first):
+        parts.append(_REFERENCE.sub(widen, text) if is_code else text)
+    if self_reference or not refs or not _resolved(refs, has_formula):
+        return None
+    return Block(
+        '"'.join(parts),
+        [BlockRef(reference, *found) for reference, found in refs.items()],
+        height, width)
+
+
+def _resolved(refs, has_formula):
+    """
+    :param refs: the widened references
+    :return: True if each is all constants or all formulae, so the generator calculates its values
+    """
+    return all(has_formula(reference) is not None for reference in refs)
+
+
+def block_expression(block, text, names):
+    """
+    Python for the block, from the translation of its formula
+
+    :param block: Block
+    :param text: the translation of block.formula
+    :param names: dict of each BlockRef's reference -> the Python name it was translated to
+    :return: Python expression, or None if the translation can't be looped over
+    """
+    text = text.strip()
+    outer_vars, outer_values, inner_vars, inner_values = [], [], [], []
+    for k, ref in enumerate(block.refs):
+        attribute = re.compile(rf'self\.{re.escape(names[ref.reference])}\b')
+        if len(attribute.findall(text)) != ref.count:
+            return None  # the same range is also used whole
+        if ref.rows and ref.columns:
+            outer_vars.append(f"r{k}")
+            outer_values.append(f"self.{names[ref.reference]}")
+            inner_vars.append(f"a{k}")
+            inner_values.append(f"r{k}")
+            element = f"a{k}"
+        elif ref.rows:
+            outer_vars.append(f"r{k}")
+            outer_values.append(f"self.{names[ref.reference]}")
+            element = f"r{k}[0]"
+        else:
+            inner_vars.append(f"a{k}")
+            inner_values.append(f"self.{names[ref.reference]}[0]")
+            element = f"a{k}"
+        text = attribute.sub(element, text)
+
+    inner = _loop(inner_vars, inner_values, block.width)
+    outer = _loop(outer_vars, outer_values, block.height)
+    return f"tuple(tuple({text} {inner}) {outer})"
+
+
+def _loop(names, values, size):
+    if not names:
+        return f"for _ in range({size})"
+    if len(names) == 1:
+        return f"for {names[0]} in {values[0]}"
+    return f"for {', '.join(names)} in zip({', '.join(values)})"
+
+
+def recurrence_formula(sheet, address, formulae, has_formula):
+    """
+    :param sheet: the block's sheet name
+    :param address: the block's address, e.g. "$C$1:$D$600"
+    :param formulae: tuple of rows of formulae, as Range.Formula
+    :param has_formula: as for block_formula()
+    :return: Recurrence, or None if the block isn't one
+    """
+    area = parse_reference(address, sheet)
+    height, width = area.bottom - area.top + 1, area.right - area.left + 1
+    if height < 2 or len(formulae) != height or any(len(row) != width for row in formulae):
+        return None
+    if not all(isinstance(formula, str) and formula.startswith('=') for row in formulae for formula in row):
+        return None
+
+    first, steps, refs = [], [], {}
+    for j in range(width):
+        form = relative_form(formulae[1][j], area.top + 1, area.left + j)
+        if form is None:
+            return None
+        for i in range(2, height):
+            if relative_form(formulae[i][j], area.top + i, area.left + j) != form:
+                return None
+        start = _recurrence_part(formulae[0][j], area, j, area.top, None)
+        step = _recurrence_part(formulae[1][j], area, j, area.top + 1, refs)
+        if start is None or step is None:
+            return None
+        first.append(start)
+        steps.append(step)
+    if not any(PREVIOUS in step for step in steps) or not _resolved(refs, has_formula):
+        return None
+    return Recurrence(
+        first, steps,
+        [BlockRef(reference, *found) for reference, found in refs.items()],
+        height)
+
+
+def _recurrence_part(formula, area, column, row, refs):
+    """
+    :param formula: formula of one of a recurrence's cells
+    :param area: the recurrence's Area
+    :param column: the cell's column in the block, from 0
+    :param row: the cell's row
+    :param refs: for the steps, dict of widened reference -> (count, rows, columns),
+            updated. None for the first row, whose references aren't widened.
+    :return: the formula with references to the block replaced by placeholders,
+            or None if it refers to the block in some other way
+    """
+    rows = 1 if refs is None else area.bottom - row + 1
+    failed = False
+
+    def replace(match):
+        nonlocal failed
+        ref_sheet = match.group('sheet')[:-1].strip("'") if match.group('sheet') else area.sheet
+        if match.group('second'):
+            found = parse_reference(match.group('first') + ':' + match.group('second'), ref_sheet)
+            if _overlaps(found, area):
+                failed = True
+            return match.group(0)
+        column_absolute, letters, row_absolute, digits = _CELL.fullmatch(match.group('first')).groups()
+        top, left = int(digits), column_number(letters)
+        bottom = top if row_absolute else top + rows - 1
+        if _overlaps(Area(ref_sheet, top, left, bottom, left), area):
+            offset = top - row
+            if not row_absolute and offset == -1 and refs is not None:
+                return PREVIOUS + str(left - area.left)
+            if not row_absolute and offset == 0 and left - area.left < column:
+                return CURRENT + str(left - area.left)
+            failed = True
+            return match.group(0)
+        if row_absolute or bottom == top:
+            return match.group(0)  # the same cell for every step, or the first row's
+        quoted = f"'{ref_sheet}'" if re.search(r'\W', ref_sheet) else ref_sheet
+        reference = f"{quoted}!{column_letters(left)}{top}:{column_letters(left)}{bottom}"
+        count, _, _ = refs.get(reference, (0, True, False))
+        refs[reference] = (count + 1, True, False)
+        return reference
+
+    parts = []
+    for text, is_code in _outside_strings(formula[1:]):  # skip the '='
+        parts.append(_REFERENCE.sub(replace, text) if is_code else text)
+    return None if failed else '"'.join(parts)
+
+
+def _overlaps(one, other):
+    return (one.sheet == other.sheet
+            and one.top <= other.bottom and one.bottom >= other.top
+            and one.left <= other.right and one.right >= other.left)
+
+
+def recurrence_job_formula(recurrence):
+    """
+    :return: one formula to translate all the recurrence's formulae together, as a group
+    """
+    return '(' + ','.join(recurrence.first + recurrence.steps) + ')'
+
+
+def recurrence_code(recurrence, text, names):
+    """
+    Python calculating the recurrence, from the translation of recurrence_job_formula()
+
+    :param recurrence: Recurrence
+    :param text: the translation
+    :param names: dict of each BlockRef's reference -> the Python name it was translated to
+    :return: (statements, expression for the block's value), or None if the translation
+            can't be looped over
+    """
+    text = text.strip()
+    width = len(recurrence.first)
+    try:
+        tree = ast.parse(text, mode='eval').body
+    except SyntaxError:
+        return None
+    if not isinstance(tree, ast.Tuple) or len(tree.elts) != 2 * width:
+        return None
+    parts = [ast.get_source_segment(text, element) for element in tree.elts]
+    first, steps = parts[:width], parts[width:]
+
+    def placeholders(part):
+        part = re.sub(rf'self\.{PREVIOUS}([0-9]+)\b', r'p\1', part)
+        return re.sub(rf'self\.{CURRENT}([0-9]+)\b', r'v\1[-1]', part)
+
+    first = [placeholders(part) for part in first]
+    steps = [placeholders(part) for part in steps]
+    loop_vars, loop_values = [], []
+    for k, ref in enumerate(recurrence.refs):
+        attribute = re.compile(rf'self\.{re.escape(names[ref.reference])}\b')
+        if len(attribute.findall(text)) != ref.count:
+            return None  # the same range is also used whole
+        loop_vars.append(f"r{k}")
+        loop_values.append(f"self.{names[ref.reference]}")
+        steps = [attribute.sub(f"r{k}[0]", part) for part in steps]
+
+    previous = [f"p{j}" for j in range(width)]
+    statements = [f"v{j} = [{part}]\n" for j, part in enumerate(first)]
+    statements.append(_loop(loop_vars, loop_values, recurrence.height - 1) + ":\n")
+    statements.append(
+        f"    {', '.join(previous)} = {', '.join(f'v{j}[-1]' for j in range(width))}\n"
+        if width > 1 else "    p0 = v0[-1]\n")
+    statements.extend(f"    v{j}.append({part})\n" for j, part in enumerate(steps))
+    return ''.join(statements), f"tuple(zip({', '.join(f'v{j}' for j in range(width))}))"
@@ -13,7 +13,7 @@ setuptools.setup(
     long_description_content_type='text/markdown',
     packages=setuptools.find_packages(
         exclude=('tests',),
-        include=('excel2py',),
+        include=('excel2py', 'excel2py.*'),
     ),  # TODO: Should I only install the run-time components?
     classifiers=[
         "Programming Language :: Python :: 3",
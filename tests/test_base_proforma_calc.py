@@ -1,4 +1,8 @@
-from excel2py.base_proforma_calc import BaseProformaCalc
+from excel2py.base_proforma_calc import BaseProformaCalc, evaluation_waves
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
 import unittest
 
 
@@ -22,5 +26,184 @@ class TestBaseProformaCalc(unittest.TestCase):
             s.calculate(x=5, y=3, z=4)
 
 
+class Calc(BaseProformaCalc):
+    """Hand written in the style of the generated code"""
+    outputs = ('total', 'doubled', 'other')
+    cell_uses = {
+        'total': ('a', 'b'),
+        'doubled': ('total',),
+        'other': ('c',),
+        'a': (),
+        'b': (),
+        'c': (),
+    }
+
+    def __init__(self):
+        self.evaluated = []
+
+    def _cell(self, name, value):
+        self.evaluated.append(name)
+        return value
+
+    a = property(lambda self: self._cell('a', 1))
+    b = property(lambda self: self._cell('b', 2))
+    c = property(lambda self: self._cell('c', 3))
+    total = property(lambda self: self._cell('total', self.a + self.b))
+    doubled = property(lambda self: self._cell('doubled', 2 * self.total))
+    other = property(lambda self: self._cell('other', self.c))
+
+
+class TestEvaluate(unittest.TestCase):
+    def test_all(self):
+        result = Calc().evaluate()
+        self.assertEqual(result._fields, Calc.outputs)
+        self.assertEqual(tuple(result), (3, 6, 3))
+
+    def test_subset(self):
+        calc = Calc()
+        result = calc.evaluate(['doubled'])
+        self.assertEqual(result.doubled, 6)
+        self.assertEqual(result._fields, ('doubled',))
+        self.assertNotIn('c', calc.evaluated)
+        self.assertNotIn('other', calc.evaluated)
+
+    def test_dependencies_first(self):
+        plan = Calc.evaluation_plan(['doubled'])
+        self.assertEqual(plan.cells[-1], 'doubled')
+        self.assertLess(plan.cells.index('total'), plan.cells.index('doubled'))
+        self.assertLess(plan.cells.index('a'), plan.cells.index('total'))
+
+    def test_plan_is_cached(self):
+        self.assertIs(Calc.evaluation_plan(['other', 'total']), Calc.evaluation_plan(['other', 'total']))
+        self.assertIn(('other', 'total'), Calc.__dict__['_evaluation_plans'])
+
+    def test_unknown_output(self):
+        with self.assertRaises(TypeError):
+            Calc().evaluate(['nonsense'])
+
+
+class Lookups(BaseProformaCalc):
+    """Three independent look-ups, and one which depends on them"""
+    outputs = ('total', 'second')
+    cell_uses = {
+        'key': (),
+        'first': ('key',),
+        'second': ('key',),
+        'third': (),
+        'sum': ('first', 'second', 'third'),
+        'total': ('sum',),
+    }
+    io_cells = frozenset({'first', 'second', 'third', 'total'})
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.most_active = 0
+
+    def lookup(self, value):
+        with self.lock:
+            self.active += 1
+            self.most_active = max(self.most_active, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        return value
+
+    key = property(lambda self: 1)
+    first = property(lambda self: self.lookup(self.key * 10))
+    second = property(lambda self: self.lookup(self.key * 20))
+    third = property(lambda self: self.lookup(30))
+    sum = property(lambda self: self.first + self.second + self.third)
+    total = property(lambda self: self.lookup(self.sum))
+
+
+class Loan(BaseProformaCalc):
+    """Interest on the average balance, in the style of the generated code"""
+    outputs = ('balance',)
+    cell_uses = {'balance': ('interest',), 'interest': ('balance',)}
+    circular = (('balance', 'interest'),)
+    max_change = 1e-6
+
+    def __init__(self, opening, rate):
+        self.opening = opening
+        self.rate = rate
+        self._balance = None
+        self._interest = None
+
+    @property
+    def balance(self):
+        if self._balance is None:
+            self.solve_circular(('balance', 'interest'))
+        return self._balance
+
+    def _formula_balance(self):
+        return self.opening + self.interest
+
+    @property
+    def interest(self):
+        if self._interest is None:
+            self.solve_circular(('balance', 'interest'))
+        return self._interest
+
+    def _formula_interest(self):
+        return (self.opening + self.balance) / 2 * self.rate
+
+
+class TestSolveCircular(unittest.TestCase):
+    def test_converges(self):
+        loan = Loan(1000.0, 0.1)
+        self.assertAlmostEqual(loan.evaluate().balance, 1050 / 0.95, places=5)
+        stats = loan.circular_stats[('balance', 'interest')]
+        self.assertTrue(stats.converged)
+        self.assertLessEqual(stats.change, 1e-6)
+
+    def test_max_iterations(self):
+        loan = Loan(1000.0, 0.1)
+        loan.max_iterations = 3
+        loan.balance
+        stats = loan.circular_stats[('balance', 'interest')]
+        self.assertEqual((stats.iterations, stats.converged), (3, False))
+
+    def test_accelerated(self):
+        plain = Loan(1000.0, 1.5)
+        accelerated = Loan(1000.0, 1.5)
+        accelerated.accelerate_circular = True
+        self.assertAlmostEqual(accelerated.balance, plain.balance, places=4)
+        self.assertLess(
+            accelerated.circular_stats[('balance', 'interest')].iterations,
+            plain.circular_stats[('balance', 'interest')].iterations)
+
+    def test_error(self):
+        loan = Loan(1000.0, None)
+        with self.assertRaises(TypeError):
+            loan.balance
+        self.assertIsNone(loan._balance)
+        loan.rate = 0.1
+        self.assertAlmostEqual(loan.balance, 1050 / 0.95, places=5)
+
+
+class TestCalculateAsync(unittest.TestCase):
+    def test_waves(self):
+        plan = Lookups.evaluation_plan()
+        self.assertEqual(len(plan.waves), 2)
+        inline, io = plan.waves[0]
+        self.assertEqual(inline, ('key',))
+        self.assertEqual(sorted(io), ['first', 'second', 'third'])
+        self.assertEqual(plan.waves[1], (('sum',), ('total',)))
+
+    def test_no_io(self):
+        self.assertEqual(evaluation_waves(('a', 'b'), {'b': ('a',)}, frozenset()), ((('a', 'b'), ()),))
+
+    def test_concurrent(self):
+        calc = Lookups()
+        with ThreadPoolExecutor(4) as executor:
+            result = asyncio.run(calc.calculate_async(executor=executor))
+        self.assertEqual(tuple(result), (60, 20))
+        self.assertEqual(calc.most_active, 3)
+
+    def test_same_as_calculate(self):
+        self.assertEqual(asyncio.run(Calc().calculate_async(['doubled'])), Calc().evaluate(['doubled']))
+
+
 if __name__ == "__main__":
     unittest.main()
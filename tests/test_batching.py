@@ -0,0 +1,186 @@
+"""
+Test batching toolkit calls across rows
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import sqlite3
+import unittest
+from excel2py.base_proforma_calc import BaseProformaCalc
+from excel2py.batching import Batch, batched, calculate_batch, sqlite_lookup
+from excel2py.excel_errors import ERROR_VALUE
+
+
+def make_database():
+    connection = sqlite3.connect(':memory:')
+    connection.execute('CREATE TABLE rates (currency TEXT, rate REAL)')
+    connection.executemany('INSERT INTO rates VALUES (?, ?)', [('GBP', 1.0), ('USD', 0.8), ('EUR', 0.9)])
+    connection.execute('CREATE TABLE fees (band INTEGER, fee REAL)')
+    connection.executemany('INSERT INTO fees VALUES (?, ?)', [(band, band * 10.0) for band in range(10)])
+    return connection
+
+
+class CountingConnection:
+    """Counts the queries made"""
+    def __init__(self, connection):
+        self.connection = connection
+        self.queries = 0
+
+    def execute(self, *args):
+        self.queries += 1
+        return self.connection.execute(*args)
+
+
+connection = CountingConnection(make_database())
+tk_rate = sqlite_lookup(connection, 'rates', 'currency', 'rate', default=0.0)
+tk_fee = sqlite_lookup(connection, 'fees', 'band', 'fee')
+
+
+class Pricing(BaseProformaCalc):
+    """Hand written in the style of the generated code"""
+    inputs = {'currency', 'amount'}
+    outputs = ('converted', 'fee')
+    cell_uses = {
+        'converted': (),
+        'band': ('converted',),
+        'fee': ('band',),
+    }
+    io_cells = frozenset({'converted', 'fee'})
+
+    def __init__(self, currency, amount):
+        self.currency = currency
+        self.amount = amount
+        self._converted = None
+        self._band = None
+        self._fee = None
+
+    @property
+    def converted(self):
+        if self._converted is not None:
+            return self._converted
+        self._converted = self.amount * tk_rate(self.currency)
+        return self._converted
+
+    @property
+    def band(self):
+        if self._band is not None:
+            return self._band
+        self._band = min(9, int(self.converted // 100))
+        return self._band
+
+    @property
+    def fee(self):
+        if self._fee is not None:
+            return self._fee
+        self._fee = tk_fee(self.band) + tk_rate(self.currency)
+        return self._fee
+
+
+class TestCalculateBatch(unittest.TestCase):
+    def setUp(self):
+        currencies = ['GBP', 'USD', 'EUR', 'JPY']
+        self.rows = [
+            {'currency': currencies[i % 4], 'amount': float(i * 7)}
+            for i in range(200)
+        ]
+
+    def test_same_as_one_at_a_time(self):
+        expected = [Pricing(**row).evaluate() for row in self.rows]
+        self.assertEqual(calculate_batch(Pricing, self.rows), expected)
+
+    def test_round_trips(self):
+        connection.queries = 0
+        batch = Batch()
+        calculate_batch(Pricing, self.rows, batch=batch)
+        # tk_rate for the first wave; tk_fee for the second, which reuses tk_rate's results
+        self.assertEqual(batch.round_trips, 2)
+        self.assertEqual(connection.queries, 2)
+        self.assertGreater(batch.calls, 400)
+
+        connection.queries = 0
+        for row in self.rows:
+            Pricing(**row).evaluate()
+        self.assertEqual(connection.queries, 600)
+
+    def test_errors(self):
+        rows = self.rows[:3] + [{'currency': 'GBP', 'amount': 'bad'}] + self.rows[3:6]
+        batch = Batch()
+        result = calculate_batch(Pricing, rows, batch=batch)
+        self.assertEqual(result[:3] + result[4:], calculate_batch(Pricing, self.rows[:6]))
+        self.assertEqual(tuple(result[3]), (ERROR_VALUE, ERROR_VALUE))
+        self.assertEqual(batch.masks['fee'], [False] * 3 + [True] + [False] * 3)
+        self.assertEqual(set(batch.exceptions), {(3, 'converted'), (3, 'band')})
+        self.assertIsInstance(batch.exceptions[3, 'converted'], TypeError)
+
+    def test_some_outputs(self):
+        result = calculate_batch(Pricing, self.rows[:3], ['converted'])
+        self.assertEqual(result, [Pricing(**row).evaluate(['converted']) for row in self.rows[:3]])
+        self.assertEqual(result[0]._fields, ('converted',))
+
+    def test_nested_calls(self):
+        @batched
+        def double(calls):
+            double.trips += 1
+            return [args[0] * 2 for args in calls]
+        double.trips = 0
+
+        class Nested(BaseProformaCalc):
+            outputs = ('result',)
+            cell_uses = {'result': ()}
+            io_cells = frozenset({'result'})
+
+            def __init__(self, x):
+                self.x = x
+
+            @property
+            def result(self):
+                return double(double(self.x) + 1)
+
+        results = calculate_batch(Nested, [{'x': x} for x in range(50)])
+        self.assertEqual([r.result for r in results], [(x * 2 + 1) * 2 for x in range(50)])
+        self.assertEqual(double.trips, 2)
+
+    def test_circular(self):
+        class Deposit(BaseProformaCalc):
+            """Interest on the average balance, at a rate looked up by currency"""
+            outputs = ('balance',)
+            cell_uses = {'balance': ('interest',), 'interest': ('balance',)}
+            io_cells = frozenset({'interest'})
+            circular = (('balance', 'interest'),)
+
+            def __init__(self, currency, amount):
+                self.currency = currency
+                self.amount = amount
+                self._balance = None
+                self._interest = None
+
+            @property
+            def balance(self):
+                if self._balance is None:
+                    self.solve_circular(('balance', 'interest'))
+                return self._balance
+
+            def _formula_balance(self):
+                return self.amount + self.interest
+
+            @property
+            def interest(self):
+                if self._interest is None:
+                    self.solve_circular(('balance', 'interest'))
+                return self._interest
+
+            def _formula_interest(self):
+                return (self.amount + self.balance) / 2 * tk_rate(self.currency) / 10
+
+        rows = [{'currency': 'USD', 'amount': 100.0}, {'currency': 'EUR', 'amount': 200.0}]
+        batch = Batch()
+        results = calculate_batch(Deposit, rows, batch=batch)
+        self.assertEqual(results, [Deposit(**row).evaluate() for row in rows])
+        self.assertEqual(batch.round_trips, 1)
+
+    def test_outside_a_batch(self):
+        self.assertEqual(tk_rate('USD'), 0.8)
+        self.assertEqual(tk_rate('XXX'), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
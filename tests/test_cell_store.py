@@ -0,0 +1,49 @@
+"""
+Test the store of generated text for each cell
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+from io import StringIO
+import unittest
+from excel2py.cell_store import CellStore
+
+
+class TestCellStore(unittest.TestCase):
+    def test_in_memory(self):
+        store = CellStore()
+        store['a'] = "    a = 1\n"
+        store['b'] = "    b = 'é'\n"
+        self.assertEqual(list(store), ['a', 'b'])
+        self.assertEqual(store['b'], "    b = 'é'\n")
+        self.assertEqual(store.spilled, 0)
+
+    def test_spills(self):
+        store = CellStore(spill_size=15)
+        texts = {f"c{i}": f"    c{i} = {'é' * i}\n" for i in range(20)}
+        for name, text in texts.items():
+            store[name] = text
+        self.assertEqual(dict(store.items()), texts)
+        self.assertEqual(store.spilled, 19)
+        f = StringIO()
+        store.write_to(f, keep={'c1', 'c0', 'c12'})
+        self.assertEqual(f.getvalue(), texts['c0'] + texts['c1'] + texts['c12'])
+
+    def test_replace_and_delete(self):
+        store = CellStore(spill_size=10)
+        store['a'] = "a = 1\n"
+        store['b'] = "b = 22222\n"
+        store['a'] = "a = 3\n"
+        del store['b']
+        self.assertEqual(list(store.items()), [('a', "a = 3\n")])
+        self.assertNotIn('b', store)
+        self.assertEqual(len(store), 1)
+
+    def test_replace_keeps_in_memory(self):
+        store = CellStore(spill_size=10)
+        for value in range(5):
+            store['a'] = f"a = {value}\n"
+        self.assertEqual(store.spilled, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
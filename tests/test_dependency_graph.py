@@ -0,0 +1,71 @@
+"""
+Tests for DependencyGraph
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import unittest
+from excel2py.dependency_graph import DependencyGraph
+
+
+class TestReachable(unittest.TestCase):
+    def setUp(self):
+        self.graph = DependencyGraph()
+        self.graph.add('result', {'a', 'b'})
+        self.graph.add('a', {'rate'})
+        self.graph.add('b')
+        self.graph.add('rate')
+        self.graph.add('scratch', {'a', 'audit'})
+        self.graph.add('audit')
+
+    def test_reachable(self):
+        self.assertEqual(self.graph.reachable(['result']), {'result', 'a', 'b', 'rate'})
+
+    def test_unreachable(self):
+        self.assertEqual(self.graph.unreachable(['result']), ['audit', 'scratch'])
+
+    def test_keep(self):
+        self.assertEqual(self.graph.unreachable(['result', 'audit']), ['scratch'])
+
+    def test_evaluation_order(self):
+        order = self.graph.evaluation_order(['result'])
+        self.assertEqual(set(order), {'result', 'a', 'b', 'rate'})
+        self.assertLess(order.index('rate'), order.index('a'))
+        self.assertEqual(order[-1], 'result')
+
+    def test_inputs_used(self):
+        self.graph.add('b', {'age'})
+        self.graph.add('rate', {'sex', 'age'})
+        used = self.graph.inputs_used({'age', 'sex', 'term'})
+        self.assertEqual(used['result'], {'age', 'sex'})
+        self.assertEqual(used['a'], {'age', 'sex'})
+        self.assertEqual(used['audit'], set())
+
+    def test_cycle(self):
+        self.graph.add('rate', {'result'})
+        self.assertEqual(self.graph.unreachable(['rate']), ['audit', 'scratch'])
+
+
+class TestCircular(unittest.TestCase):
+    def test_components(self):
+        graph = DependencyGraph()
+        graph.add('interest', {'balance', 'rate'})
+        graph.add('balance', {'opening', 'interest'})
+        graph.add('fee', {'fee'})
+        graph.add('total', {'balance', 'fee'})
+        graph.add('rate')
+        graph.add('opening')
+        self.assertEqual(
+            sorted(sorted(component) for component in graph.circular()),
+            [['balance', 'interest'], ['fee']])
+        self.assertEqual(graph.circular({'interest', 'total', 'rate'}), [])
+
+    def test_long_chain(self):
+        graph = DependencyGraph()
+        for i in range(5000):
+            graph.add(f"c{i}", {f"c{i + 1}"})
+        graph.add('c5000', {'c0'})
+        self.assertEqual(len(graph.circular()[0]), 5001)
+
+
+if __name__ == "__main__":
+    unittest.main()
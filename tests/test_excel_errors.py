@@ -0,0 +1,63 @@
+"""
+Test Excel's error values
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import copy
+import math
+import pickle
+import unittest
+from excel2py.excel_errors import (
+    ERROR_DIV0, ERROR_NA, ERROR_NAME, ERROR_NUM, ERROR_REF, ERROR_VALUE, ERRORS,
+    ExcelError, error_from_exception, first_error, is_error)
+
+
+class TestExcelError(unittest.TestCase):
+    def test_singletons(self):
+        self.assertIs(ExcelError('#N/A'), ERROR_NA)
+        self.assertIs(pickle.loads(pickle.dumps(ERROR_DIV0)), ERROR_DIV0)
+        self.assertIs(copy.deepcopy([ERROR_NA])[0], ERROR_NA)
+        self.assertEqual(ERRORS['ERROR_REF'].code, '#REF!')
+        with self.assertRaises(ValueError):
+            ExcelError('#OOPS!')
+
+    def test_text(self):
+        self.assertEqual(str(ERROR_DIV0), '#DIV/0!')
+        self.assertEqual(repr(ERROR_DIV0), 'ERROR_DIV0')
+
+    def test_propagates(self):
+        for value in (
+                ERROR_NA + 1, 1 + ERROR_NA, 2 - ERROR_NA, 2 * ERROR_NA, ERROR_NA / 0, 2 ** ERROR_NA,
+                -ERROR_NA, abs(ERROR_NA), round(ERROR_NA, 2), math.floor(ERROR_NA),
+                ERROR_NA == 1, 1 < ERROR_NA, ERROR_NA + ERROR_DIV0,
+        ):
+            self.assertIs(value, ERROR_NA)
+
+    def test_not_found_by_mistake(self):
+        self.assertNotIn(1, [ERROR_NA])
+        self.assertIn(ERROR_NA, [1, ERROR_NA])
+        self.assertEqual({ERROR_NA: 1}[ERROR_NA], 1)
+
+    def test_from_exception(self):
+        for exception, error in (
+                (ZeroDivisionError(), ERROR_DIV0),
+                (ValueError('math domain error'), ERROR_NUM),
+                (OverflowError(), ERROR_NUM),
+                (IndexError(), ERROR_REF),
+                (KeyError('x'), ERROR_NA),
+                (NameError('x'), ERROR_NAME),
+                (TypeError(), ERROR_VALUE),
+                (RuntimeError(), ERROR_VALUE),
+        ):
+            with self.subTest(exception=exception):
+                self.assertIs(error_from_exception(exception), error)
+
+    def test_first_error(self):
+        self.assertIsNone(first_error((1, (2, 3))))
+        self.assertIs(first_error((1, (2, ERROR_REF), ERROR_NA)), ERROR_REF)
+        self.assertTrue(is_error(ERROR_REF))
+        self.assertFalse(is_error(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,10 +7,10 @@ import unittest
 import datetime
 import excel2py.excel_functions as ef
 from excel2py.ex_datetime import ex_datetime
+from excel2py.excel_errors import ERROR_DIV0, ERROR_NA, ERROR_VALUE
 
 # skipping:
-# ISERROR(val), IFERROR(value, value_if_error),
-# IFNA(value, value_if_na), DATE(year, month, day),
+# DATE(year, month, day),
 
 
 class TestToNumber(unittest.TestCase):
@@ -121,19 +121,22 @@ class TestVLookup(unittest.TestCase):
         table = ((1, 2), (3, 4))
 
         for expected, val, range_lookup, name in (
-                (None, 0, True, "range, before"),
+                (ERROR_NA, 0, True, "range, before"),
                 (2, 1, True, "range, first"),
                 (2, 2, True, "range, mid"),
                 (4, 3, True, "range, second"),
                 (4, 4, True, "range, after"),
-                (None, 0, False, "exact, before"),
+                (ERROR_NA, 0, False, "exact, before"),
                 (2, 1, False, "exact, first"),
-                (None, 2, False, "exact, mid"),
+                (ERROR_NA, 2, False, "exact, mid"),
                 (4, 3, False, "exact, second"),
-                (None, 4, False, "exact, after"),
+                (ERROR_NA, 4, False, "exact, after"),
         ):
             with self.subTest(name):
-                self.assertEqual(expected, ef.VLOOKUP(val, table, 2, range_lookup), name)
+                self.assertIs(expected, ef.VLOOKUP(val, table, 2, range_lookup), name)
+
+    def test_error(self):
+        self.assertIs(ef.VLOOKUP(ERROR_VALUE, ((1, 2),), 2), ERROR_VALUE)
 
 
 class TestBoolean(unittest.TestCase):
@@ -156,6 +159,44 @@ class TestBoolean(unittest.TestCase):
             self.assertTrue(ef.AND())  # Not legal in Excel either
 
 
+class TestErrors(unittest.TestCase):
+    def test_propagate(self):
+        for value in (
+                ef.SUM(1, ERROR_DIV0, 3),
+                ef.MAX([1, ERROR_DIV0]),
+                ef.AND(True, ERROR_DIV0),
+                ef.ROUND(ERROR_DIV0, 2),
+                ef.ROUNDDOWN(1.5, ERROR_DIV0),
+                ef.INT(ERROR_DIV0),
+                ef.IF(ERROR_DIV0, 1, 2),
+                ef.IF(True, ERROR_DIV0, 2),
+        ):
+            self.assertIs(value, ERROR_DIV0)
+
+    def test_is(self):
+        self.assertTrue(ef.ISERROR(ERROR_NA))
+        self.assertTrue(ef.ISERROR(None))
+        self.assertFalse(ef.ISERROR(0))
+        self.assertTrue(ef.ISNA(ef.NA()))
+        self.assertFalse(ef.ISNA(ERROR_VALUE))
+        self.assertTrue(ef.ISERR(ERROR_VALUE))
+        self.assertFalse(ef.ISERR(ERROR_NA))
+        self.assertFalse(ef.ISBLANK(ERROR_NA))
+
+    def test_if_error(self):
+        self.assertEqual(ef.IFERROR(ERROR_DIV0, 0), 0)
+        self.assertEqual(ef.IFNA(ERROR_NA, 0), 0)
+        self.assertIs(ef.IFNA(ERROR_DIV0, 0), ERROR_DIV0)
+        self.assertEqual(ef.IFERROR(2, 0), 2)
+
+    def test_divide(self):
+        self.assertEqual(ef.DIVIDE(3, 2), 1.5)
+        self.assertIs(ef.DIVIDE(3, 0), ERROR_DIV0)
+        self.assertIs(ef.DIVIDE(3, None), ERROR_DIV0)
+        self.assertIs(ef.DIVIDE(ERROR_NA, 0), ERROR_NA)
+        self.assertIs(ef.DIVIDE(3, ERROR_VALUE), ERROR_VALUE)
+
+
 class TestInt(unittest.TestCase):
     def test_ok(self):
         for val, expect in (
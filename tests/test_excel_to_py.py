@@ -0,0 +1,448 @@
+"""
+Test the generator using synthetic workbooks, so Excel isn't needed
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import io
+import os
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+from benchmarks.run_benchmarks import synthetic_config, SyntheticExcelToPy, load_class
+from benchmarks.synthetic_workbook import synthetic_workbook
+from excel2py.batching import Batch, calculate_batch
+from excel2py.excel_errors import ERROR_NA
+from excel2py.interpreter import Model
+
+
+def generate(directory, processes=1, cache=None, edit=None, split_sheets=False, model=None,
+             toolkit=frozenset(), sidecar_cells=0, compile_report=False, **settings):
+    """
+    :param edit: function to change the synthetic workbook before generating
+    :return: (config, generated text without the time stamp)
+    """
+    book, workbook_config = synthetic_workbook(**settings)
+    if edit:
+        edit(book)
+    cfg = synthetic_config(directory, workbook_config)
+    cfg.processes = processes
+    cfg.cache = cache
+    cfg.split_sheets = split_sheets
+    cfg.model = model
+    cfg.globals = set(toolkit)
+    cfg.sidecar_cells = sidecar_cells
+    cfg.compile_report = compile_report
+    app = SyntheticExcelToPy(cfg, book)
+    app.generate()
+    with open(cfg.output) as f:
+        text = ''.join(line for line in f if not line.startswith('# Generated at'))
+    return app, text
+
+
+class TestGenerate(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_calculates(self):
+        app, text = generate(self.directory.name, cells=40, depth=4, outputs=3)
+        calc_class = load_class(app.config)
+        result = calc_class(in_0=1.0, in_1=2.0, in_2=3.0, in_3=4.0).calculate()
+        self.assertEqual(result._fields, ('out_0', 'out_1', 'out_2'))
+        self.assertTrue(all(isinstance(value, float) for value in result))
+
+    def test_parallel_is_identical(self):
+        serial_dir = os.path.join(self.directory.name, 'serial')
+        parallel_dir = os.path.join(self.directory.name, 'parallel')
+        os.mkdir(serial_dir)
+        os.mkdir(parallel_dir)
+        _, serial = generate(serial_dir, processes=1, cells=200, depth=8)
+        _, parallel = generate(parallel_dir, processes=2, cells=200, depth=8)
+        self.assertEqual(serial, parallel)
+
+    def test_spilled_is_identical(self):
+        in_memory_dir = os.path.join(self.directory.name, 'memory')
+        spilled_dir = os.path.join(self.directory.name, 'spilled')
+        os.mkdir(in_memory_dir)
+        os.mkdir(spilled_dir)
+        _, in_memory = generate(in_memory_dir, cells=200, depth=8)
+        with mock.patch('excel2py.cell_store.SPILL_SIZE', 1000):
+            app, spilled = generate(spilled_dir, cells=200, depth=8)
+        self.assertEqual(in_memory, spilled)
+        self.assertGreater(app.stats.counts['spilled_cells'], 100)
+
+    def test_specialised(self):
+        _, text = generate(self.directory.name, cells=40, depth=2)
+        self.assertIn('round(self.in_', text)
+        self.assertNotIn('max(', text)
+
+    def test_specialised_compound_arguments(self):
+        formulae = {
+            'product': ("=PRODUCT(in_0+in_1,in_2)", lambda a, b, c, d: (a + b) * c),
+            'doubled': ("=SUM(in_0+in_1)*2", lambda a, b, c, d: (a + b) * 2),
+            'scaled': ("=2*MAX(in_0-in_1)", lambda a, b, c, d: 2 * (a - b)),
+        }
+
+        def edit(book):
+            for row, (name, (formula, _)) in enumerate(formulae.items(), 1):
+                book.Sheets['Results'].set(f"$E${row}", None, formula)
+                book.add_name(name, 'Results', f"$E${row}")
+
+        app, text = generate(self.directory.name, edit=edit, cells=40, depth=4, outputs=3)
+        self.assertIn("self._product = ((self.in_0+self.in_1) * self.in_2)", text)
+        calc = load_class(app.config)(in_0=5.0, in_1=2.0, in_2=3.0, in_3=4.0)
+        for name, (_, expected) in formulae.items():
+            with self.subTest(name=name):
+                self.assertEqual(getattr(calc, name), expected(5.0, 2.0, 3.0, 4.0))
+
+    def test_io_cells(self):
+        def edit(book):
+            book.Sheets['Calc'].cells[(3, 1)].formula = '=tk_rate(in_0)*2'
+
+        _, text = generate(self.directory.name, edit=edit, toolkit={'tk_rate'}, cells=40, depth=4, outputs=10)
+        self.assertIn('tk_rate(self.in_0)', text)
+        self.assertIn("    io_cells = frozenset({\n        'c_0_2',\n    })", text)
+
+    def test_dependents(self):
+        app, _ = generate(self.directory.name, cells=40, depth=4, outputs=3)
+        self.assertIn('c_1_2', app.dependents("Tables!$A$5"))  # VLOOKUP(c_0_1,Tables!A1:C50,3)
+        self.assertIn('c_0_2', app.dependents("Inputs!$B$1"))  # uses in_0
+        self.assertEqual(app.dependents("Tables!$Z$5"), [])
+
+    def test_blocks(self):
+        def edit(book):
+            sheet = book.Sheets['Results']
+            for row in range(1, 13):
+                sheet.set(f"$E${row}", float(row))
+                sheet.set(f"$F${row}", None, f"=E{row}*in_0+$E$14")
+            sheet.set("$E$14", 0.5)
+            for row in range(1, 4):
+                for column in 'GH':
+                    sheet.set(f"${column}${row}", None, f"={column}$5*$E{row}")
+            sheet.set("$G$5", 10.0)
+            sheet.set("$H$5", 100.0)
+            for row in range(1, 4):
+                sheet.set(f"$K${row}", None, f"=E{row}*K$5")
+            sheet.set("$K$5", 3.0)
+            book.add_name('growth', 'Results', "$F$1:$F$12")
+            book.add_name('grid', 'Results', "$G$1:$H$3")
+            book.add_name('scaled', 'Results', "$K$1:$K$3")
+
+        app, text = generate(self.directory.name, edit=edit, cells=40, depth=4, outputs=3)
+        self.assertIn("self._growth = tuple(tuple(", text)
+        self.assertNotIn("ResultsE12", text)
+        calc = load_class(app.config)(in_0=2.0, in_1=2.0, in_2=3.0, in_3=4.0)
+        self.assertEqual(calc.growth, tuple((row * 2.0 + 0.5,) for row in range(1, 13)))
+        self.assertEqual(calc.grid, tuple((10.0 * row, 100.0 * row) for row in range(1, 4)))
+        self.assertEqual(calc.scaled, tuple((3.0 * row,) for row in range(1, 4)))
+
+    def test_synthetic_ranges(self):
+        app, text = generate(self.directory.name, cells=40, depth=4, outputs=3, ranges=2, range_rows=20)
+        self.assertIn("self._rng_1 = tuple(tuple(", text)
+        result = load_class(app.config)(in_0=1.0, in_1=2.0, in_2=3.0, in_3=4.0).calculate()
+        self.assertEqual(result.rng_1, tuple((row * 2.0,) for row in range(1, 21)))
+
+    def test_block_using_mixed_range(self):
+        def edit(book):
+            sheet = book.Sheets['Results']
+            for row in range(1, 5):
+                if row % 2:
+                    sheet.set(f"$E${row}", float(row))
+                else:
+                    sheet.set(f"$E${row}", -12345.0, "=in_0*10")  # Excel's last calculated value is stale
+                sheet.set(f"$F${row}", None, f"=E{row}*2")
+            sheet.set("$G$1", None, "=in_0+1")
+            sheet.set("$G$2", None, "=in_1*3")
+            book.add_name('mixed', 'Results', "$F$1:$F$4")
+            book.add_name('uneven', 'Results', "$G$1:$G$2")
+
+        app, text = generate(self.directory.name, edit=edit, cells=40, depth=4, outputs=3)
+        self.assertNotIn("ResultsE1E4 =", text)
+        self.assertNotIn("-12345", text)
+        calc = load_class(app.config)(in_0=4.0, in_1=2.0, in_2=3.0, in_3=4.0)
+        self.assertEqual(calc.mixed, ((2.0,), (80.0,), (6.0,), (80.0,)))
+        self.assertEqual(calc.uneven, ((5.0,), (6.0,)))
+
+    def test_error_literal(self):
+        def edit(book):
+            book.Sheets['Results'].set("$E$1", None, "=IF(in_0>2,in_0,#N/A)+1")
+            book.add_name('checked', 'Results', "$E$1")
+
+        app, text = generate(self.directory.name, edit=edit, cells=40, depth=4, outputs=3)
+        self.assertIn("self._checked = IF(self.in_0>2,self.in_0,ERROR_NA)+1", text)
+        calc_class = load_class(app.config)
+        self.assertEqual(calc_class(in_0=3.0, in_1=2.0, in_2=3.0, in_3=4.0).checked, 4.0)
+        self.assertIs(calc_class(in_0=1.0, in_1=2.0, in_2=3.0, in_3=4.0).checked, ERROR_NA)
+
+    def test_division_by_zero(self):
+        def edit(book):
+            book.Sheets['Results'].set("$B$1", None, "=IFERROR(in_0/in_1,0)")  # out_0
+
+        app, text = generate(self.directory.name, edit=edit, cells=40, depth=4, outputs=3)
+        self.assertIn("self._out_0 = IFERROR(DIVIDE(self.in_0,self.in_1),0)", text)
+        calc_class = load_class(app.config)
+        self.assertEqual(calc_class(in_0=3.0, in_1=0.0, in_2=3.0, in_3=4.0).out_0, 0)
+        rows = [dict(in_0=3.0, in_1=divisor, in_2=3.0, in_3=4.0) for divisor in (2.0, 0.0)]
+        batch = Batch()
+        results = calculate_batch(calc_class, rows, batch=batch)
+        self.assertEqual([result.out_0 for result in results], [1.5, 0])
+        self.assertEqual(batch.masks['out_0'], [False, False])
+        self.assertEqual(batch.exceptions, {})
+
+    def test_recurrence(self):
+        months = 600
+
+        def edit(book):
+            sheet = book.Sheets['Results']
+            sheet.set("$E$1", 0.01)
+            sheet.set("$I$1", None, "=in_0")
+            sheet.set("$J$1", None, "=I1*2")
+            for row in range(2, months + 1):
+                sheet.set(f"$H${row}", float(row))
+                sheet.set(f"$I${row}", None, f"=I{row - 1}*(1+$E$1)+H{row}")
+                sheet.set(f"$J${row}", None, f"=J{row - 1}+I{row}*in_1")
+            book.add_name('fund', 'Results', f"$I$1:$J${months}")
+
+        app, text = generate(self.directory.name, edit=edit, cells=40, depth=4, outputs=3)
+        self.assertIn("    for r0 in self.ResultsH2H600:\n", text)
+        self.assertNotIn("ResultsI599", text)
+        fund = load_class(app.config)(in_0=100.0, in_1=0.5, in_2=3.0, in_3=4.0).fund
+        expected = [(100.0, 200.0)]
+        for row in range(2, months + 1):
+            value = expected[-1][0] * 1.01 + row
+            expected.append((value, expected[-1][1] + value * 0.5))
+        self.assertEqual(fund, tuple(expected))
+
+    def test_recurrence_of_two_rows(self):
+        def edit(book):
+            sheet = book.Sheets['Results']
+            sheet.set("$E$1", 0.01)
+            sheet.set("$H$2", 5.0)
+            sheet.set("$I$1", None, "=in_0")
+            sheet.set("$I$2", None, "=I1*(1+$E$1)+H2")
+            book.add_name('fund', 'Results', "$I$1:$I$2")
+
+        app, text = generate(self.directory.name, edit=edit, cells=40, depth=4, outputs=3)
+        self.assertNotIn("ResultsH2H2", text)
+        self.assertIn("    for _ in range(1):\n", text)
+        fund = load_class(app.config)(in_0=100.0, in_1=0.5, in_2=3.0, in_3=4.0).fund
+        self.assertEqual(fund, ((100.0,), (100.0 * 1.01 + 5.0,)))
+
+    def test_unused_cells_pruned(self):
+        _, text = generate(self.directory.name, cells=40, depth=4, outputs=1)
+        self.assertIn('def out_0(self)', text)
+        self.assertNotIn('def c_3_5(self)', text)
+
+    def test_compile_report(self):
+        for compile_report in (False, True):
+            stdout = io.StringIO()
+            with redirect_stdout(stdout):
+                generate(self.directory.name, compile_report=compile_report, cells=40, depth=4, outputs=1)
+            self.assertIn("Dropped", stdout.getvalue())
+            self.assertEqual("compiled in" in stdout.getvalue(), compile_report)
+
+
+class TestCircular(unittest.TestCase):
+    """
+    Interest on the average balance, which depends on the interest
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.inputs = dict(in_0=1000.0, in_1=2.0, in_2=3.0, in_3=4.0)
+
+    @staticmethod
+    def edit(book):
+        sheet = book.Sheets['Results']
+        sheet.set("$K$1", 0.1)
+        sheet.set("$K$2", None, "=in_0+$K$3")
+        sheet.set("$K$3", None, "=(in_0+$K$2)/2*$K$1")
+        book.add_name('balance', 'Results', "$K$2")
+        book.add_name('interest', 'Results', "$K$3")
+
+    def test_solved(self):
+        app, text = generate(self.directory.name, edit=self.edit, cells=40, depth=4, outputs=3)
+        self.assertIn("    circular = (\n        ('ResultsK2', 'ResultsK3'),\n    )\n", text)
+        calc = load_class(app.config)(**self.inputs)
+        self.assertAlmostEqual(calc.balance, 1050 / 0.95, delta=0.001)
+        self.assertAlmostEqual(calc.interest, calc.balance - 1000, delta=0.001)
+        stats = calc.circular_stats[('ResultsK2', 'ResultsK3')]
+        self.assertTrue(stats.converged)
+        self.assertLessEqual(stats.change, 0.001)
+
+    def test_accelerated(self):
+        def iterations(directory, accelerate):
+            os.mkdir(directory)
+            book, workbook_config = synthetic_workbook(cells=40, depth=4, outputs=3)
+            self.edit(book)
+            cfg = synthetic_config(directory, workbook_config)
+            cfg.accelerate = accelerate
+            cfg.max_change = 1e-9
+            app = SyntheticExcelToPy(cfg, book)
+            app.generate()
+            calc = load_class(cfg)(**self.inputs)
+            self.assertAlmostEqual(calc.balance, 1050 / 0.95, places=6)
+            return calc.circular_stats[('ResultsK2', 'ResultsK3')].iterations
+
+        plain = iterations(os.path.join(self.directory.name, 'plain'), False)
+        accelerated = iterations(os.path.join(self.directory.name, 'accelerated'), True)
+        self.assertLess(accelerated, plain)
+
+
+class TestSharedCells(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_shared(self):
+        book, workbook_config = synthetic_workbook(cells=40, depth=4, outputs=3)
+        cfg = synthetic_config(self.directory.name, workbook_config)
+        cfg.shared_cells = {'c_1_2', 'k_0'}
+        app = SyntheticExcelToPy(cfg, book)
+        app.generate()
+        self.assertEqual(app.shared_cells, {'c_1_2': ('in_0',)})  # VLOOKUP(c_0_1,...), c_0_1 uses in_0
+        self.assertEqual(app.cell_inputs['out_1'], {'in_0', 'in_3'})
+
+        calc_class = load_class(cfg)
+        first = calc_class(in_0=1.0, in_1=2.0, in_2=3.0, in_3=4.0)
+        second = calc_class(in_0=1.0, in_1=5.0, in_2=6.0, in_3=7.0)
+        expected = first.c_1_2
+        self.assertEqual(second.c_1_2, expected)
+        self.assertIsNone(second._c_0_1)  # not needed: c_1_2 came from the cache
+        third = calc_class(in_0=2.0, in_1=2.0, in_2=3.0, in_3=4.0)
+        third.c_1_2
+        self.assertIsNotNone(third._c_0_1)
+        stats = type(first).c_1_2.fget.cache.stats()
+        self.assertEqual((stats.hits, stats.misses), (1, 2))
+        fourth = calc_class(in_0=1.0, in_1=2.0, in_2=3.0, in_3=4.0)
+        self.assertEqual(fourth.calculate(), first.calculate())
+        self.assertIsNone(fourth._c_0_1)  # calculate() doesn't evaluate what a cached cell uses
+
+
+class TestSplitSheets(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.inputs = dict(in_0=1.0, in_1=2.0, in_2=3.0, in_3=4.0)
+
+    def test_same_results(self):
+        whole_dir = os.path.join(self.directory.name, 'whole')
+        split_dir = os.path.join(self.directory.name, 'split')
+        os.mkdir(whole_dir)
+        os.mkdir(split_dir)
+        app, _ = generate(whole_dir, cells=60, depth=4, outputs=3)
+        expected = load_class(app.config)(**self.inputs).calculate()
+        app, text = generate(split_dir, split_sheets=True, cells=60, depth=4, outputs=3)
+        self.assertIn("LazySheetProperty('gen_synthetic_calc')", text)
+        self.assertEqual(load_class(app.config)(**self.inputs).calculate(), expected)
+
+    def test_loaded_when_used(self):
+        app, _ = generate(self.directory.name, split_sheets=True, cells=60, depth=4, outputs=3)
+        sys.modules.pop('gen_synthetic_calc', None)
+        sys.modules.pop('gen_synthetic_results', None)
+        calc = load_class(app.config)(**self.inputs)
+        self.assertNotIn('gen_synthetic_calc', sys.modules)
+        calc.out_0
+        self.assertIn('gen_synthetic_calc', sys.modules)
+        first = sys.modules['gen_synthetic_calc'].CELLS[0]
+        self.assertIsInstance(type(calc).__dict__[first], property)
+
+    def test_pruned_sheet_not_written(self):
+        def edit(book):
+            book.sheet('Scratch').set("$A$1", None, "=Calc!A2*2")
+            book.add_name('scratch', 'Scratch', "$A$1")
+
+        app, text = generate(self.directory.name, edit=edit, split_sheets=True, cells=60, depth=4, outputs=3)
+        self.assertNotIn('gen_synthetic_scratch', text)
+        self.assertNotIn('gen_synthetic_scratch.py', os.listdir(self.directory.name))
+        self.assertIn('gen_synthetic_calc.py', os.listdir(self.directory.name))
+
+
+class TestSidecar(unittest.TestCase):
+    """
+    Large tables are written to .npy files and give the same results
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_same_results(self):
+        settings = dict(cells=80, depth=4, outputs=5, tables=2, table_rows=40)
+        literal_dir = os.path.join(self.directory.name, 'literal')
+        sidecar_dir = os.path.join(self.directory.name, 'sidecar')
+        os.mkdir(literal_dir)
+        os.mkdir(sidecar_dir)
+        literal_app, literal = generate(literal_dir, **settings)
+        sidecar_app, sidecar = generate(sidecar_dir, sidecar_cells=100, **settings)
+        self.assertNotIn('SidecarTable', literal)
+        self.assertIn("TablesA1C40 = SidecarTable('gen_synthetic_TablesA1C40.npy')", sidecar)
+        self.assertIn('gen_synthetic_TablesA1C40.npy', os.listdir(sidecar_dir))
+        self.assertLess(len(sidecar), len(literal))
+        inputs = dict(in_0=1.0, in_1=12.0, in_2=3.0, in_3=4.0)
+        expected = load_class(literal_app.config)(**inputs).calculate()
+        self.assertEqual(load_class(sidecar_app.config)(**inputs).calculate(), expected)
+
+
+class TestModel(unittest.TestCase):
+    """
+    The interpreter gives the same results as the generated code
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'model.json')
+
+    def test_same_results(self):
+        app, _ = generate(self.directory.name, model=self.path, cells=300, depth=10, outputs=5)
+        calc_class = load_class(app.config)
+        model = Model.load(self.path)
+        self.assertEqual(model.outputs, calc_class.outputs)
+        for i in range(5):
+            inputs = dict(in_0=1.0 + i, in_1=2.5 * i, in_2=3.0 - i, in_3=i / 3)
+            self.assertEqual(model.calculate(**inputs), calc_class(**inputs).calculate())
+
+    def test_some_outputs(self):
+        app, _ = generate(self.directory.name, model=self.path, cells=60, depth=4, outputs=3)
+        inputs = dict(in_0=1.0, in_1=2.0, in_2=3.0, in_3=4.0)
+        expected = load_class(app.config)(**inputs).calculate(['out_2'])
+        self.assertEqual(Model.load(self.path).calculate(['out_2'], **inputs), expected)
+
+    def test_blocks_not_written(self):
+        def edit(book):
+            for row in range(1, 5):
+                book.Sheets['Results'].set(f"$E${row}", float(row))
+                book.Sheets['Results'].set(f"$F${row}", None, f"=E{row}*in_0")
+            book.add_name('growth', 'Results', "$F$1:$F$4")
+
+        generate(self.directory.name, edit=edit, model=self.path, cells=40, depth=4, outputs=3)
+        self.assertFalse(os.path.exists(self.path))
+
+
+class TestTranslationCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache = os.path.join(self.directory.name, 'cache.json')
+
+    def test_regenerate(self):
+        app, first = generate(self.directory.name, cache=self.cache, cells=100, depth=5)
+        self.assertEqual(app.stats.counts['cache_hits'], 0)
+
+        app, second = generate(self.directory.name, cache=self.cache, cells=100, depth=5)
+        self.assertEqual(app.stats.counts['cache_misses'], 0)
+        self.assertEqual(first, second)
+
+    def test_edited_cell(self):
+        def edit(book):
+            book.Sheets['Calc'].cells[(1, 1)].formula = '=in_0*3'
+
+        generate(self.directory.name, cache=self.cache, cells=100, depth=5)
+        app, edited = generate(self.directory.name, cache=self.cache, edit=edit, cells=100, depth=5)
+        self.assertEqual(app.stats.counts['cache_misses'], 1)
+        self.assertIn('self._c_0_0 = self.in_0*3', edited)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+"""
+Test the financial functions, against the examples in Excel's help
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import random
+import tempfile
+import unittest
+from unittest import mock
+from benchmarks.run_benchmarks import generate, load_class
+from benchmarks.synthetic_workbook import synthetic_workbook
+from excel2py.batching import Batch, calculate_batch
+from excel2py.excel_errors import ERROR_DIV0, ERROR_NA, ERROR_NUM, ERROR_VALUE
+from excel2py.excel_functions import DATE
+from excel2py import financial_functions
+from excel2py.financial_functions import (
+    FV, IRR, NPV, PMT, PV, RATE, XIRR, XNPV, irr_many, numpy, rate_many, xirr_many)
+
+FLOWS = (-10000, 2750, 4250, 3250, 2750)
+DATES = (DATE(2008, 1, 1), DATE(2008, 3, 1), DATE(2008, 10, 30), DATE(2009, 2, 15), DATE(2009, 4, 1))
+
+
+class TestFinancialFunctions(unittest.TestCase):
+    def test_annuities(self):
+        self.assertAlmostEqual(PMT(0.08 / 12, 10, 10000), -1037.03, places=2)
+        self.assertAlmostEqual(PMT(0.06 / 12, 18 * 12, 0, 50000), -129.08, places=2)
+        self.assertAlmostEqual(PV(0.08 / 12, 12 * 20, 500), -59777.15, places=2)
+        self.assertAlmostEqual(FV(0.06 / 12, 10, -200, -500, 1), 2581.40, places=2)
+        self.assertAlmostEqual(FV(0, 10, -200, -500), 2500.0)
+        self.assertAlmostEqual(PMT(0, 10, 1000), -100.0)
+        self.assertIs(PMT(0.1, 0, 1000), ERROR_NUM)
+
+    def test_npv(self):
+        self.assertAlmostEqual(NPV(0.1, -10000, 3000, 4200, 6800), 1188.44, places=2)
+        # A range is a tuple of rows: text and empty cells are skipped
+        self.assertAlmostEqual(NPV(0.08, ((8000,), (9200,), ('text',), (None,), (10000,), (12000,), (14500,)))
+                               - 40000, 1922.06, places=2)
+        self.assertAlmostEqual(XNPV(0.09, FLOWS, DATES), 2086.65, places=2)
+        self.assertIs(NPV(-1, 100), ERROR_DIV0)
+        self.assertIs(XNPV(0.09, FLOWS, DATES[:4]), ERROR_NUM)
+        self.assertIs(XNPV(0.09, FLOWS, DATES[::-1]), ERROR_NUM)
+
+    def test_solvers(self):
+        flows = ((-70000,), (12000,), (15000,), (18000,), (21000,), (26000,))
+        self.assertAlmostEqual(IRR(flows[:5]), -0.021245, places=6)
+        self.assertAlmostEqual(IRR(flows), 0.086631, places=6)
+        self.assertAlmostEqual(IRR(flows[:3], -0.1), -0.443507, places=6)
+        self.assertAlmostEqual(XIRR(FLOWS, DATES), 0.373363, places=6)
+        self.assertAlmostEqual(RATE(4 * 12, -200, 8000), 0.007701, places=6)
+        self.assertAlmostEqual(RATE(10, -100, 1000), 0.0, places=9)
+
+    def test_errors(self):
+        self.assertIs(IRR((100, 200)), ERROR_NUM)  # no change of sign
+        self.assertIs(XIRR(FLOWS, DATES[:3]), ERROR_NUM)
+        self.assertIs(RATE(10, 0, 100), ERROR_NUM)  # doesn't converge
+        self.assertIs(NPV(0.1, 100, ERROR_NA), ERROR_NA)
+        self.assertIs(IRR(((-100,), (ERROR_DIV0,))), ERROR_DIV0)
+        self.assertIs(PV('rate', 10, 100), ERROR_VALUE)
+
+    def test_many(self):
+        series = [((-100.0 * (1 + i),) + (30.0,) * 5,) for i in range(5)]
+        self.assertEqual(irr_many(series), [IRR(*args) for args in series])
+        first, second, third = xirr_many([(FLOWS, DATES), (FLOWS, DATES, 0.5), ((1, 2), DATES[:2])])
+        self.assertEqual(first, XIRR(FLOWS, DATES))
+        self.assertAlmostEqual(second, first)
+        self.assertIs(third, ERROR_NUM)
+        self.assertEqual(rate_many([(48, -200, 8000), (10, -100, 1000, 0, 1)]),
+                         [RATE(48, -200, 8000), RATE(10, -100, 1000, 0, 1)])
+
+    def test_bisection(self):
+        # Newton's method from the guess overshoots below -1: the range from 0.5 to 1 holds the IRR
+        flows = (-100,) + (0,) * 20 + (1e6,)
+        self.assertAlmostEqual(IRR(flows), 0.550516, places=6)
+        with mock.patch.object(financial_functions, 'numpy', None):
+            self.assertAlmostEqual(IRR(flows), 0.550516, places=6)
+
+    @unittest.skipIf(numpy is None, "needs NumPy")
+    def test_arrays(self):
+        # 600 monthly cash flows, for which Newton's method from 0.1 doesn't converge
+        flows = numpy.random.default_rng(0).uniform(5, 15, (2000, 600))
+        flows[:, 0] = -5000
+        flows[-1] = 1  # no change of sign
+        rates = irr_many(flows)
+        self.assertIs(rates[-1], ERROR_NUM)
+        self.assertEqual(rates[:5], irr_many([(tuple(row),) for row in flows[:5].tolist()]))
+        for rate, row in zip(rates[:-1:100], flows[:-1:100]):
+            self.assertAlmostEqual(NPV(rate, *row[1:]) / row[0], -1, places=6)
+        days = numpy.array([39448, 39508, 39751, 39859, 39904])
+        self.assertEqual(xirr_many(numpy.array([FLOWS] * 3), days), [XIRR(FLOWS, DATES)] * 3)
+        self.assertEqual(rate_many(numpy.array([[48, -200, 8000], [10, 0, 100]])),
+                         [RATE(48, -200, 8000), ERROR_NUM])
+
+    def test_without_numpy(self):
+        generator = random.Random(1)
+        calls = [((-150,) + tuple(generator.uniform(5, 15) for _ in range(29)),) for _ in range(20)]
+        calls += [((-100,) + (0,) * 20 + (1e6,),), ((1, 2),)]
+        with mock.patch.object(financial_functions, 'numpy', None):
+            rates = irr_many(calls)
+        for rate, expected in zip(rates, irr_many(calls)):
+            if rate is ERROR_NUM:
+                self.assertIs(expected, ERROR_NUM)
+            else:
+                self.assertAlmostEqual(rate, expected, places=9)
+
+
+class TestGenerated(unittest.TestCase):
+    def test_batch(self):
+        book, settings = synthetic_workbook(cells=40, depth=4, outputs=3)
+        sheet = book.Sheets['Results']
+        for row, flow in enumerate((-500.0, 100.0, 150.0, 200.0, 250.0), 1):
+            sheet.set(f"$E${row}", flow)
+            sheet.set(f"$F${row}", None, f"=E{row}+in_0")
+        sheet.set("$G$1", None, "=IRR(F1:F5)")
+        book.add_name('irr', 'Results', "$G$1")
+        settings['outputs']['Results!$G$1'] = 'irr'
+        with tempfile.TemporaryDirectory() as directory:
+            cfg, _, _ = generate(directory, book, settings)
+            calc_class = load_class(cfg)
+        rows = [{'in_0': i * 5.0, 'in_1': 2.0, 'in_2': 3.0, 'in_3': 4.0} for i in range(20)]
+        batch = Batch()
+        results = calculate_batch(calc_class, rows, batch=batch)
+        self.assertEqual(batch.round_trips, 1)
+        for row, result in zip(rows, results):
+            flows = tuple(flow + row['in_0'] for flow in (-500.0, 100.0, 150.0, 200.0, 250.0))
+            self.assertAlmostEqual(result.irr, IRR(flows))
+
+
+if __name__ == '__main__':
+    unittest.main()
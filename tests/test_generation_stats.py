@@ -0,0 +1,63 @@
+"""
+Tests for GenerationStats
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+from contextlib import redirect_stderr, redirect_stdout
+import io
+import json
+import tracemalloc
+import unittest
+from excel2py.config import config
+from excel2py.generation_stats import GenerationStats
+
+
+class TestGenerationStats(unittest.TestCase):
+    def test_phases_accumulate(self):
+        stats = GenerationStats()
+        for i in range(3):
+            with stats.phase('parse'):
+                pass
+        self.assertEqual(stats.phases['parse']['calls'], 3)
+        self.assertIsNone(stats.phases['parse']['peak_bytes'])
+
+    def test_nested_peak_memory(self):
+        stats = GenerationStats(trace_memory=True)
+        self.addCleanup(tracemalloc.stop)
+        with stats.phase('outer'):
+            with stats.phase('inner'):
+                big = [0] * 100000
+                del big
+        inner = stats.phases['inner']['peak_bytes']
+        self.assertGreater(inner, 100000 * 8 - 1)
+        self.assertGreaterEqual(stats.phases['outer']['peak_bytes'], inner)
+
+    def test_json(self):
+        stats = GenerationStats()
+        with stats.phase('write'):
+            pass
+        stats.count('names', 7)
+        result = json.loads(stats.to_json())
+        self.assertEqual(result['counts'], {'names': 7})
+        self.assertIn('wall_seconds', result['phases']['write'])
+
+
+class TestProfileOption(unittest.TestCase):
+    def test_needs_a_file(self):
+        cfg = config(__doc__, ['--profile', 'stats.json', 'book.xlsx'])
+        self.assertEqual((cfg.profile, cfg.spreadsheet), ('stats.json', 'book.xlsx'))
+        with self.assertRaises(SystemExit), redirect_stderr(io.StringIO()):
+            config(__doc__, ['book.xlsx', '--profile'])
+
+    def test_stderr(self):
+        stats = GenerationStats()
+        stats.count('names', 7)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            stats.write('-')
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertEqual(json.loads(stderr.getvalue())['counts'], {'names': 7})
+
+
+if __name__ == "__main__":
+    unittest.main()
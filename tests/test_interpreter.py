@@ -0,0 +1,83 @@
+"""
+Test the serialized model interpreter
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import json
+import math
+import unittest
+from excel2py.excel_errors import ERROR_NA
+from excel2py.interpreter import compile_expression, model_data, Model
+
+
+class TestCompileExpression(unittest.TestCase):
+    def test_instructions(self):
+        self.assertEqual(
+            compile_expression("IF(self.a>1,-self.a,self.b*2)\n"),
+            [['load', 'a'], ['const', 1], ['binary', 'gt'],
+             ['load', 'a'], ['unary', 'neg'],
+             ['load', 'b'], ['const', 2], ['binary', 'mul'],
+             ['call', 'IF', 3]])
+
+    def test_literal_tuple(self):
+        self.assertEqual(compile_expression("((1.0, 'a'), (None, True))"),
+                         [['const', ((1.0, 'a'), (None, True))]])
+
+    def test_error(self):
+        instructions = compile_expression("IF(self.a>0,self.a,ERROR_NA)")
+        self.assertEqual(instructions[-2:], [['error', '#N/A'], ['call', 'IF', 3]])
+        model = Model(model_data('GenTest', ['a'], ['b'], {}, {'b': 'IF(self.a>0,self.a,ERROR_NA)+1'}))
+        self.assertEqual(model.calculate(a=1), (2,))
+        self.assertIs(model.calculate(a=-1).b, ERROR_NA)
+
+    def test_unsupported(self):
+        for text in ("self.a if self.b else 1", "[self.a]", "self.a[0]", "f(x=1)", "1 < self.a < 3"):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    compile_expression(text)
+
+
+class TestModel(unittest.TestCase):
+    def model(self, namespace=None):
+        data = model_data(
+            'GenTest', ['x'], ['total', 'label'],
+            {'rate': '0.5', 'table': '(1.0, 2.0, 3.0)'},
+            {
+                'scaled': 'self.x*self.rate',
+                'total': 'ROUND(self.scaled+SUM(self.table),2)',
+                'label': 'IF(self.total>10,"big","small")',
+                'unused': 'helpers.floor(self.x)',
+            })
+        # A round trip through JSON, as when loaded from a file
+        return Model(json.loads(json.dumps(data)), namespace)
+
+    def test_calculate(self):
+        model = self.model({'helpers': math})
+        self.assertEqual(model.calculate(x=20.0), (16.0, 'big'))
+        self.assertEqual(model.calculate(x=1.0)._fields, ('total', 'label'))
+        self.assertEqual(model.calculate(['label'], x=1.0), ('small',))
+
+    def test_unknown_function(self):
+        with self.assertRaises(NameError):
+            self.model()
+
+    def test_unsafe_builtins(self):
+        for function in ('eval', 'exec', 'open', '__import__'):
+            data = model_data('GenTest', ['x'], ['y'], {}, {'y': f'{function}(self.x)'})
+            with self.subTest(function=function), self.assertRaises(NameError):
+                Model(data)
+        data = model_data('GenTest', ['x'], ['y'], {}, {'y': 'round(abs(self.x), 1)'})
+        self.assertEqual(Model(data).calculate(x=-1.25), (1.2,))
+
+    def test_bad_arguments(self):
+        model = self.model({'helpers': math})
+        with self.assertRaises(TypeError):
+            model.calculate()
+        with self.assertRaises(TypeError):
+            model.calculate(x=1.0, y=2.0)
+        with self.assertRaises(TypeError):
+            model.calculate(['scaled'], x=1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+"""
+Test caching toolkit function results
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import unittest
+from excel2py.ex_datetime import ex_datetime
+from excel2py.memoise import cacheable, cache_stats, clear_caches, format_cache_stats
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCacheable(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.clock = Clock()
+
+        @cacheable(maxsize=3, ttl=10, name='test.tk_factor', clock=self.clock)
+        def tk_factor(name, date):
+            self.calls.append((name, date))
+            return len(name) + date.year
+
+        self.tk_factor = tk_factor
+        self.addCleanup(tk_factor.cache.clear)
+
+    def test_hits(self):
+        date = ex_datetime(2020, 1, 1)
+        self.assertEqual(self.tk_factor('mortality', date), 2029)
+        self.assertEqual(self.tk_factor('mortality', ex_datetime(2020, 1, 1)), 2029)
+        self.assertEqual(len(self.calls), 1)
+        stats = self.tk_factor.cache.stats()
+        self.assertEqual((stats.hits, stats.misses, stats.size), (1, 1, 1))
+        self.assertEqual(self.tk_factor.__name__, 'tk_factor')
+
+    def test_lru_eviction(self):
+        date = ex_datetime(2020, 1, 1)
+        for name in ('a', 'b', 'c'):
+            self.tk_factor(name, date)
+        self.tk_factor('a', date)  # 'b' is now the least recently used
+        self.tk_factor('d', date)
+        self.tk_factor('a', date)
+        self.tk_factor('b', date)
+        self.assertEqual([name for name, _ in self.calls], ['a', 'b', 'c', 'd', 'b'])
+        self.assertEqual(self.tk_factor.cache.stats().evictions, 2)
+
+    def test_ttl(self):
+        date = ex_datetime(2020, 1, 1)
+        self.tk_factor('a', date)
+        self.clock.now = 9.9
+        self.tk_factor('a', date)
+        self.clock.now = 10.0
+        self.tk_factor('a', date)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.tk_factor.cache.stats().expirations, 1)
+
+    def test_ranges(self):
+        @cacheable(name='test.tk_total')
+        def tk_total(values):
+            self.calls.append(values)
+            return sum(values)
+        self.addCleanup(tk_total.cache.clear)
+
+        self.assertEqual(tk_total([1, 2, 3]), 6)
+        self.assertEqual(tk_total((1, 2, 3)), 6)
+        self.assertEqual(tk_total({1: 2}), 1)  # unhashable: not cached
+        self.assertEqual(len(self.calls), 2)
+        stats = tk_total.cache.stats()
+        self.assertEqual((stats.hits, stats.misses, stats.uncacheable), (1, 1, 1))
+
+    def test_process_wide(self):
+        self.tk_factor('a', ex_datetime(2020, 1, 1))
+        self.assertIn('test.tk_factor', [stats.name for stats in cache_stats()])
+        self.assertIn('test.tk_factor', format_cache_stats())
+        clear_caches()
+        self.assertEqual(self.tk_factor.cache.stats().misses, 0)
+        self.tk_factor('a', ex_datetime(2020, 1, 1))
+        self.assertEqual(len(self.calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
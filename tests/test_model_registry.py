@@ -0,0 +1,103 @@
+"""
+Test loading generated models on demand
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import os
+import sys
+import tempfile
+import unittest
+from excel2py.model_registry import ModelRegistry, module_size
+from tests.test_excel_to_py import generate
+
+INPUTS = dict(in_0=1.0, in_1=2.0, in_2=3.0, in_3=4.0)
+
+CUSTOMISED = '''
+from gen_synthetic import GenSynthetic
+
+
+class Synthetic(GenSynthetic):
+    @property
+    def out_0(self):
+        return 42.0
+'''
+
+
+class TestModelRegistry(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.paths = {}
+        for version, cells in ((1, 20), (2, 200)):
+            directory = os.path.join(cls.directory.name, f"v{version}")
+            os.mkdir(directory)
+            app, _ = generate(directory, cells=cells, depth=4, outputs=2, seed=version)
+            cls.paths[version] = app.config.output
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def registry(self, **limits):
+        registry = ModelRegistry(**limits)
+        for version, path in self.paths.items():
+            registry.register('synthetic', version, path)
+        return registry
+
+    def test_load_on_demand(self):
+        registry = self.registry()
+        self.assertEqual(registry.stats().resident, 0)
+        first = registry.get('synthetic', 1)
+        self.assertIs(registry.get('synthetic', 1), first)
+        self.assertIsNot(registry.get('synthetic', 2), first)
+        stats = registry.stats()
+        self.assertEqual((stats.hits, stats.misses, stats.loads, stats.resident), (1, 2, 2, 2))
+        self.assertGreater(stats.resident_bytes, 0)
+        self.assertGreater(module_size([sys.modules[registry.get('synthetic', 2).__module__]]),
+                           module_size([sys.modules[first.__module__]]))
+        self.assertEqual(first.__name__, 'GenSynthetic')
+        self.assertEqual(registry.calculator('synthetic', 1, **INPUTS).calculate()._fields, ('out_0', 'out_1'))
+
+    def test_unregistered(self):
+        with self.assertRaises(KeyError):
+            self.registry().get('synthetic', 3)
+
+    def test_evict_least_recently_used(self):
+        registry = self.registry(max_models=1)
+        first = registry.get('synthetic', 1)
+        module = first.__module__
+        self.assertIn(module, sys.modules)
+        registry.get('synthetic', 2)
+        self.assertNotIn(module, sys.modules)
+        self.assertEqual(registry.stats().evictions, 1)
+        self.assertIsNot(registry.get('synthetic', 1), first)  # reloaded
+        self.assertEqual(registry.stats().misses, 3)
+
+    def test_memory_limit(self):
+        registry = self.registry()
+        registry.get('synthetic', 1)
+        small_size = registry.resident_bytes()
+        registry.max_bytes = small_size + 1
+        registry.get('synthetic', 2)
+        self.assertEqual(registry.stats().resident, 1)  # the most recent is always kept
+        self.assertGreater(registry.resident_bytes(), small_size)
+
+    def test_customised_class(self):
+        directory = os.path.dirname(self.paths[1])
+        path = os.path.join(directory, 'synthetic.py')
+        with open(path, 'w') as f:
+            f.write(CUSTOMISED)
+        self.addCleanup(os.remove, path)
+        sys.modules.pop('gen_synthetic', None)  # from another test
+        registry = ModelRegistry()
+        registry.register('custom', 1, path)
+        cls = registry.get('custom', 1)
+        self.assertEqual(cls.__name__, 'Synthetic')
+        self.assertIn('gen_synthetic', sys.modules)
+        self.assertEqual(cls(**INPUTS).calculate().out_0, 42.0)
+        registry.clear()
+        self.assertNotIn('gen_synthetic', sys.modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
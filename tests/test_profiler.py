@@ -0,0 +1,114 @@
+"""
+Tests for the per-cell profiler
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import itertools
+import tempfile
+import unittest
+from tests import test_excel_to_py
+from tests.test_excel_to_py import generate, load_class
+from excel2py.base_proforma_calc import BaseProformaCalc
+from excel2py.excel_functions import SUM
+from excel2py.profiler import Profiler
+
+
+class Calc(BaseProformaCalc):
+    """Hand written in the style of the generated code"""
+    outputs = ('total',)
+    cell_uses = {'total': ('a',), 'a': ()}
+    cell_addresses = {'total': 'Results!$C$5', 'a': 'Sheet1!$A$1'}
+
+    def __init__(self):
+        self._a = None
+        self._total = None
+
+    @property
+    def a(self):
+        if self._a is not None:
+            return self._a
+        self._a = SUM(1, 2)
+        return self._a
+
+    @property
+    def total(self):
+        if self._total is not None:
+            return self._total
+        self._total = self.a + self.a
+        return self._total
+
+    def calculate(self, outputs=None):
+        return self.evaluate(outputs)
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        ticks = itertools.count()
+        self.profiler = Profiler(Calc, clock=lambda: float(next(ticks)))
+
+    def test_results_unchanged(self):
+        self.assertEqual(self.profiler.cls().calculate().total, 6)
+
+    def test_original_untouched(self):
+        self.assertIsInstance(Calc.__dict__['a'].fget.__globals__['SUM'], type(SUM))
+        self.assertIs(Calc.__dict__['a'].fget.__globals__['SUM'], SUM)
+
+    def test_counts(self):
+        self.profiler.cls().calculate()
+        rows = {row.name: row for row in self.profiler.report()}
+        self.assertEqual(rows['a'].evaluations, 1)
+        self.assertEqual(rows['a'].accesses, 3)  # from evaluate(), then twice from total
+        self.assertEqual(rows['total'].evaluations, 1)
+        self.assertEqual(rows['total'].address, 'Results!$C$5')
+
+    def test_self_time(self):
+        self.profiler.cls().total
+        rows = {row.name: row for row in self.profiler.report()}
+        total = rows['total']
+        self.assertLess(total.self_time, total.cumulative)
+        self.assertEqual(total.cumulative - total.self_time, rows['a'].cumulative)
+
+    def test_functions(self):
+        self.profiler.cls().calculate()
+        functions = {row.name: row for row in self.profiler.function_report()}
+        self.assertEqual(functions['SUM'].calls, 1)
+
+    def test_reset(self):
+        self.profiler.cls().calculate()
+        self.profiler.reset()
+        self.assertEqual(self.profiler.report(), [])
+        self.profiler.cls().calculate()
+        self.assertEqual(len(self.profiler.report()), 2)
+        self.assertIn('Results!$C$5', self.profiler.format_report())
+
+
+class TestGenerated(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.inputs = dict(in_0=1000.0, in_1=2.0, in_2=3.0, in_3=4.0)
+
+    def test_split_sheets(self):
+        app, _ = generate(self.directory.name, split_sheets=True, cells=60, depth=4, outputs=3)
+        calc_class = load_class(app.config)
+        profiler = Profiler(calc_class)
+        self.assertEqual(profiler.cls(**self.inputs).calculate(), calc_class(**self.inputs).calculate())
+        names = {row.name for row in profiler.report()}
+        self.assertEqual(names, set(calc_class.evaluation_plan().cells))
+        self.assertIn('Calc!', profiler.format_report())
+
+    def test_circular(self):
+        app, _ = generate(self.directory.name, edit=test_excel_to_py.TestCircular.edit, cells=40, depth=4, outputs=3)
+        calc_class = load_class(app.config)
+        profiler = Profiler(calc_class)
+        calc = profiler.cls(**self.inputs)
+        calc.ResultsK2
+        rows = {row.name: row for row in profiler.report()}
+        iterations = calc.circular_stats[('ResultsK2', 'ResultsK3')].iterations
+        self.assertEqual(rows['_formula_ResultsK3'].evaluations, iterations)
+        self.assertEqual(rows['_formula_ResultsK3'].address, 'Results!$K$3')
+        self.assertLess(rows['ResultsK2'].self_time, rows['ResultsK2'].cumulative)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+Test the Pythonify semantics without needing the parser
+
+The methods are called with the AST fragments TatSu would pass them.
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import unittest
+from excel2py.pythonify import Pythonify, PyExpr
+from excel2py import type_inference as ti
+
+
+def group(*args):
+    """AST for a bracketed argument list, as the parser gives it"""
+    joined = []
+    for arg in args:
+        if joined:
+            joined.append(',')
+        joined.append(arg)
+    return Pythonify.group(['(', joined, ')'])
+
+
+class TestTypes(unittest.TestCase):
+    def setUp(self):
+        self.py = Pythonify(set(), {}, {'a': ti.FLOAT, 'b': ti.INT, 'd': ti.DATE})
+
+    def test_number(self):
+        self.assertEqual(Pythonify.number('2').type, ti.INT)
+        self.assertEqual(Pythonify.number('2.5').type, ti.FLOAT)
+        self.assertEqual(Pythonify.number('5%').type, ti.FLOAT)
+
+    def test_error(self):
+        self.assertEqual(Pythonify.error('#DIV/0!'), 'ERROR_DIV0')
+        self.assertIsNone(Pythonify.error('#N/A').type)
+
+    def test_name(self):
+        self.assertEqual(self.py.name('a').type, ti.FLOAT)
+        self.assertIsNone(self.py.name('unknown').type)
+        self.assertEqual(self.py.name('TRUE'), 'True')
+
+    def test_expression(self):
+        for left, op, right, expect in (
+            ('a', '+', 'b', ti.FLOAT),
+            ('b', '*', 'b', ti.INT),
+            ('b', '/', 'b', None),  # b may be zero: DIVIDE() returns #DIV/0!
+            ('a', ' == ', 'b', ti.BOOL),
+            ('d', '+', 'b', ti.DATE),
+            ('d', '-', 'd', ti.FLOAT),
+            ('a', '+', 'unknown', None),
+        ):
+            with self.subTest(left=left, op=op, right=right):
+                ast = [self.py.name(left), op, self.py.name(right)]
+                self.assertEqual(Pythonify.expression(ast).type, expect)
+
+    def test_division(self):
+        def expression(*chain):
+            # As the parser nests them, to the right
+            ast = chain[-1]
+            for i in range(len(chain) - 3, -1, -2):
+                ast = Pythonify.expression([chain[i], chain[i + 1], ast])
+            return ast
+
+        a, b, two = self.py.name('a'), self.py.name('b'), Pythonify.number('2')
+        self.assertEqual(expression(a, '/', b), 'DIVIDE(self.a,self.b)')
+        self.assertEqual(expression(a, '/', b, '/', a), 'DIVIDE(DIVIDE(self.a,self.b),self.a)')
+        self.assertEqual(expression(a, '*', b, '/', a, '-', b), 'DIVIDE(self.a*self.b,self.a)-self.b')
+        self.assertEqual(expression(a, '**', b, '/', a), 'DIVIDE(self.a**self.b,self.a)')
+        self.assertEqual(expression(a, '+', b, '/', a, '**', two), 'self.a+DIVIDE(self.b,self.a**2)')
+        halved = expression(a, '/', two, '*', b)
+        self.assertEqual(halved, 'self.a/2*self.b')
+        self.assertEqual(halved.type, ti.FLOAT)
+        self.assertEqual(expression(a, '/', Pythonify.number('0')), 'DIVIDE(self.a,0)')
+
+
+class TestSpecialise(unittest.TestCase):
+    def setUp(self):
+        self.py = Pythonify(set(), {}, {'a': ti.FLOAT, 'b': ti.INT, 's': ti.STR})
+
+    def call(self, function, *names):
+        return self.py.function([function, group(*[self.py.name(n) for n in names])])
+
+    def test_sum(self):
+        result = self.call('SUM', 'a', 'b')
+        self.assertEqual(result, '(self.a + self.b)')
+        self.assertEqual(result.type, ti.FLOAT)
+
+    def test_compound_arguments(self):
+        compound = Pythonify.expression([self.py.name('a'), '+', self.py.name('b')])
+        product = self.py.function(['PRODUCT', group(compound, self.py.name('a'))])
+        self.assertEqual(product, '((self.a+self.b) * self.a)')
+        self.assertEqual(self.py.function(['SUM', group(compound)]), '(self.a+self.b)')
+
+    def test_max(self):
+        # The builtin max() would give a result depending on the position of an Excel error
+        self.assertEqual(self.call('MAX', 'a', 'b'), 'MAX(self.a,self.b)')
+        self.assertEqual(self.call('MAX', 'a'), 'self.a')
+
+    def test_round(self):
+        result = self.py.function(['ROUND', group(self.py.name('a'), Pythonify.number('2'))])
+        self.assertEqual(result, 'round(self.a, 2)')
+        self.assertEqual(result.type, ti.FLOAT)
+
+    def test_round_float_digits(self):
+        self.assertEqual(self.call('ROUND', 'a', 'a'), 'round(self.a, int(self.a))')
+
+    def test_unknown_type_is_generic(self):
+        result = self.call('SUM', 'a', 'unknown')
+        self.assertEqual(result, 'SUM(self.a,self.unknown)')
+        self.assertIsNone(result.type)
+
+    def test_text_is_generic(self):
+        self.assertEqual(self.call('SUM', 'a', 's'), 'SUM(self.a,self.s)')
+
+    def test_range_is_generic(self):
+        self.py.sheet = 'Sheet1'
+        result = self.py.function(['SUM', group(self.py.range(['A1', ':', 'B2']))])
+        self.assertEqual(result, 'SUM(self.Sheet1A1B2)')
+
+    def test_group_type(self):
+        self.assertEqual(group(PyExpr('x', ti.INT)).type, ti.INT)
+        self.assertIsNone(group(PyExpr('x', ti.INT), PyExpr('y', ti.INT)).type)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Test the index of ranges
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import random
+import unittest
+from benchmarks.synthetic_workbook import column_letters
+from excel2py.range_index import Area, MAX_ROW, RangeIndex, parse_reference
+
+
+class TestParseReference(unittest.TestCase):
+    def test_references(self):
+        for reference, area in (
+                ("Sheet1!$A$1", Area('Sheet1', 1, 1, 1, 1)),
+                ("'Sheet 1'!B3:C5", Area('Sheet 1', 3, 2, 5, 3)),
+                ("Sheet1!$C$5:$B$3", Area('Sheet1', 3, 2, 5, 3)),
+                ("Sheet1!AA:AB", Area('Sheet1', 1, 27, MAX_ROW, 28)),
+                ("Sheet1!2:4", Area('Sheet1', 2, 1, 4, 16384)),
+        ):
+            with self.subTest(reference=reference):
+                self.assertEqual(parse_reference(reference), area)
+
+    def test_default_sheet(self):
+        self.assertEqual(parse_reference("B3", 'Calc'), Area('Calc', 3, 2, 3, 2))
+
+    def test_bad(self):
+        for reference in ("Sheet1!#REF!", "B3", "Sheet1!A1:B2:C3", "Sheet1!"):
+            with self.subTest(reference=reference):
+                with self.assertRaises(ValueError):
+                    parse_reference(reference)
+
+
+class TestRangeIndex(unittest.TestCase):
+    def test_containing(self):
+        index = RangeIndex()
+        index.add("Sheet1!$B$3:$C$5", 'total')
+        index.add("Sheet1!$C$4", 'rate')
+        index.add("Sheet1!C:C", 'column')
+        index.add("Sheet2!$B$3:$C$5", 'other')
+        self.assertEqual(index.containing("Sheet1!$C$4"), ["Sheet1!$B$3:$C$5", "Sheet1!$C$4", "Sheet1!C:C"])
+        self.assertEqual(index.containing("Sheet1!A4"), [])
+        self.assertEqual(index.containing("Sheet1!C100"), ["Sheet1!C:C"])
+        self.assertEqual(index.containing("Sheet3!C4"), [])
+        self.assertEqual(index.dependents("'Sheet1'!B5"), {'total'})
+
+    def test_add_after_query(self):
+        index = RangeIndex()
+        index.add("Sheet1!A1:A10", 'a')
+        self.assertEqual(index.dependents("Sheet1!A5"), {'a'})
+        index.add("Sheet1!A5", 'b')
+        index.add("Sheet1!A1:A10", 'c')
+        self.assertEqual(index.dependents("Sheet1!A5"), {'a', 'b', 'c'})
+        self.assertEqual(len(index), 2)
+
+    def test_same_as_scanning(self):
+        rand = random.Random(1)
+        index = RangeIndex()
+        areas = {}
+        for _ in range(2000):
+            top, left = rand.randint(1, 500), rand.randint(1, 30)
+            bottom, right = top + rand.randint(0, 40), left + rand.randint(0, 3)
+            reference = f"S!{column_letters(left)}{top}:{column_letters(right)}{bottom}"
+            areas[reference] = Area('S', top, left, bottom, right)
+            index.add(reference)
+        for _ in range(300):
+            row, column = rand.randint(1, 560), rand.randint(1, 35)
+            expected = sorted(
+                reference for reference, area in areas.items()
+                if area.top <= row <= area.bottom and area.left <= column <= area.right)
+            self.assertEqual(index.containing(f"S!{column_letters(column)}{row}"), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Test the golden-value regression runner
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import csv
+import math
+import os
+import tempfile
+import unittest
+from benchmarks.run_benchmarks import generate
+from benchmarks.synthetic_workbook import synthetic_workbook
+from excel2py.excel_errors import ERROR_NA
+from excel2py.regression import (
+    OutputReport, difference, format_report, load_model, main, model_inputs, read_scenarios,
+    run_regression, workbook_scenario, write_scenarios)
+
+
+class TestDifference(unittest.TestCase):
+    def test_difference(self):
+        for expected, actual, diff in (
+                (1.0, 1.0 + 1e-12, 0.0),
+                (1.0, 1.5, 0.5),
+                ('#N/A', ERROR_NA, 0.0),
+                ('#N/A', 1.0, math.inf),
+                (1.0, ERROR_NA, math.inf),
+                ('text', 'text', 0.0),
+                ('text', 'other', math.inf),
+        ):
+            with self.subTest(expected=expected, actual=actual):
+                self.assertEqual(difference(expected, actual, 1e-9, 1e-9), diff)
+
+
+class TestOutputReport(unittest.TestCase):
+    def test_worst(self):
+        first, second = OutputReport('x', worst_size=2), OutputReport('x', worst_size=2)
+        for i, diff in enumerate((0.0, 3.0, 1.0, 0.0)):
+            first.add(f"a{i}", 0.0, diff, diff)
+        for i, diff in enumerate((2.0, 0.5)):
+            second.add(f"b{i}", 0.0, diff, diff)
+        first.merge(second)
+        self.assertEqual((first.scenarios, first.failures, first.max_difference), (6, 4, 3.0))
+        self.assertEqual([(diff, scenario_id) for diff, scenario_id, _, _ in first.worst],
+                         [(3.0, 'a1'), (2.0, 'b0')])
+
+
+class TestRunRegression(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.book, settings = synthetic_workbook(cells=60, depth=4, outputs=3)
+        self.config, _, _ = generate(self.directory, self.book, settings)
+        calc_class = load_model(self.config.output)
+        self.scenarios = []
+        for i in range(300):
+            inputs = {'in_0': 1.0 + i, 'in_1': i / 7, 'in_2': 3.0, 'in_3': 40.0 - i / 3}
+            expected = calc_class(**inputs).calculate()._asdict()
+            self.scenarios.append({'id': f"s{i}", 'inputs': inputs, 'expected': expected})
+        self.scenarios[17]['expected']['out_1'] += 1.0
+        self.path = os.path.join(self.directory, 'scenarios.jsonl')
+        write_scenarios(self.path, self.scenarios)
+
+    def check(self, reports):
+        self.assertEqual(list(reports), ['out_0', 'out_1', 'out_2'])
+        self.assertEqual([report.scenarios for report in reports.values()], [300] * 3)
+        self.assertEqual([report.failures for report in reports.values()], [0, 1, 0])
+        diff, scenario_id, _, _ = reports['out_1'].worst[0]
+        self.assertEqual(scenario_id, 's17')
+        self.assertAlmostEqual(diff, 1.0)
+
+    def test_in_process(self):
+        scenarios = read_scenarios(self.path, (), ())
+        self.check(run_regression(self.config.output, scenarios, processes=1, chunk_size=64))
+
+    def test_pool(self):
+        scenarios = read_scenarios(self.path, (), ())
+        progress = []
+        reports = run_regression(self.config.output, scenarios, processes=2, chunk_size=50,
+                                 progress=progress.append)
+        self.check(reports)
+        self.assertEqual(len(progress), 6)
+        self.assertIn("s17: expected", format_report(reports))
+
+    def test_csv(self):
+        path = os.path.join(self.directory, 'scenarios.csv')
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'in_0', 'in_1', 'in_2', 'in_3', 'out_0', 'out_1', 'out_2'])
+            for scenario in self.scenarios:
+                writer.writerow([scenario['id']] + list(scenario['inputs'].values())
+                                + list(scenario['expected'].values()))
+        calc_class = load_model(self.config.output)
+        scenarios = read_scenarios(path, model_inputs(calc_class), calc_class.outputs)
+        self.check(run_regression(self.config.output, scenarios, processes=1))
+
+    def test_main(self):
+        self.assertEqual(main([self.config.output, self.path, '--processes', '1']), 1)
+
+    def test_workbook_scenario(self):
+        address = next(address for address, name in self.config.outputs.items() if name == 'out_0')
+        sheet, cell = address.split('!')
+        self.book.Sheets[sheet].set(cell, 12.5, self.book.Sheets[sheet].Range(cell).Formula)
+        scenario = workbook_scenario(self.book, self.config.inputs, self.config.outputs, 'cached')
+        self.assertEqual(scenario['id'], 'cached')
+        self.assertEqual(set(scenario['inputs']), {'in_0', 'in_1', 'in_2', 'in_3'})
+        self.assertEqual(scenario['expected']['out_0'], 12.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
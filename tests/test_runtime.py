@@ -0,0 +1,51 @@
+"""
+Test the runtime package imported by generated code
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import os
+import subprocess
+import sys
+import unittest
+import excel2py.runtime
+from excel2py.runtime.registry import LazyFunction, register
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestRuntime(unittest.TestCase):
+    def test_exports(self):
+        functions = excel2py.runtime.functions()
+        for name in ('BaseProformaCalc', 'ex_datetime', 'VLOOKUP', 'ERROR_NA'):
+            self.assertIn(name, functions)
+        self.assertNotIn('register', functions)
+
+    def test_import_is_slim(self):
+        code = (
+            "import sys\n"
+            "import excel2py.runtime\n"
+            "heavy = ('tatsu', 'asyncio', 'difflib', 'win32com', 'excel2py.excel_to_py')\n"
+            "print(' '.join(name for name in heavy if name in sys.modules))\n"
+        )
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        result = subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True)
+        self.assertEqual(result.stdout.strip(), '')
+
+    def test_register(self):
+        function = register('TEST_MEDIAN', 'statistics:median')
+        self.addCleanup(excel2py.runtime.__all__.remove, 'TEST_MEDIAN')
+        self.addCleanup(delattr, excel2py.runtime, 'TEST_MEDIAN')
+        self.assertIsInstance(function, LazyFunction)
+        self.assertIs(excel2py.runtime.TEST_MEDIAN, function)
+        self.assertIn('TEST_MEDIAN', excel2py.runtime.functions())
+        self.assertFalse(function.loaded)
+        self.assertEqual(function([3, 1, 2]), 2)
+        self.assertTrue(function.loaded)
+
+    def test_attribute_defaults_to_name(self):
+        self.assertEqual(LazyFunction('sqrt', 'math')(9), 3.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+Test the .npy sidecar tables
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+from excel2py.excel_functions import VLOOKUP
+from excel2py.sidecar import MAGIC, MappedTable, SidecarTable, is_numeric_table, read_table, write_table
+
+TABLE = ((0.0, 1.5, -2.0), (1.0, 2.5, 3.25), (2, 3.5, 1e300))
+
+
+class TestSidecar(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'table.npy')
+
+    def test_round_trip(self):
+        write_table(self.path, TABLE)
+        with open(self.path, 'rb') as f:
+            start = f.read(10)
+        self.assertEqual(start[:6], MAGIC)
+        self.assertEqual((10 + int.from_bytes(start[8:10], 'little')) % 64, 0)
+        table = read_table(self.path)
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table, TABLE)
+        self.assertEqual(table[-1], (2.0, 3.5, 1e300))
+        self.assertEqual(table[1:], TABLE[1:])
+        self.assertEqual(VLOOKUP(1.5, table, 2), 2.5)
+        with self.assertRaises(IndexError):
+            table[3]
+
+    def test_hash(self):
+        write_table(self.path, TABLE)
+        table = read_table(self.path)
+        expected = tuple(tuple(float(item) for item in row) for row in TABLE)
+        self.assertEqual(hash(table), hash(expected))
+        # Found once: the table isn't read again
+        with mock.patch.object(MappedTable, '__getitem__', side_effect=AssertionError):
+            self.assertEqual(hash(table), hash(expected))
+
+    def test_not_npy(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a table')
+        with self.assertRaises(ValueError):
+            read_table(self.path)
+
+    def test_is_numeric_table(self):
+        self.assertTrue(is_numeric_table(TABLE))
+        for value in (1.0, (), ((1.0, 'a'),), ((1.0,), (1.0, 2.0)), ((True,),)):
+            with self.subTest(value=value):
+                self.assertFalse(is_numeric_table(value))
+
+    def test_class_attribute(self):
+        write_table(self.path, TABLE)
+        module_path = os.path.join(self.directory.name, 'calc_with_table.py')
+        with open(module_path, 'w') as f:
+            f.write("from excel2py.sidecar import SidecarTable\n\n\n"
+                    "class Calc:\n    table = SidecarTable('table.npy')\n")
+        spec = importlib.util.spec_from_file_location('calc_with_table', module_path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        self.addCleanup(sys.modules.pop, spec.name)
+        spec.loader.exec_module(module)
+        self.assertIsInstance(module.Calc.__dict__['table'], SidecarTable)
+        self.assertEqual(module.Calc().table, TABLE)
+        # The file is mapped once, then the table replaces the stand-in
+        self.assertIs(module.Calc.table, module.Calc.__dict__['table'])
+
+
+if __name__ == '__main__':
+    unittest.main()
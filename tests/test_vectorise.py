@@ -0,0 +1,82 @@
+"""
+Test finding blocks of copied formulae and recurrences
+
+By Michael Grazebrook of Joined Up Finance Ltd
+"""
+import unittest
+from excel2py.vectorise import block_formula, recurrence_formula, relative_form
+
+
+def column(formula, rows, first_row=1):
+    """Formulae for one column, as Range.Formula"""
+    return tuple((formula.format(row=row, before=row - 1),) for row in range(first_row, first_row + rows))
+
+
+def constants(reference):
+    """Range.HasFormula of every widened range: all constants"""
+    return False
+
+
+class TestRelativeForm(unittest.TestCase):
+    def test_forms(self):
+        self.assertEqual(relative_form("=A2*$B$1", 2, 3), "=R[0]C[-2]*$B$1")
+        self.assertEqual(relative_form("=$A2+A$1", 5, 1), "=R[-3]$A+$1C[0]")
+        self.assertEqual(relative_form('=IF(A2="B2",1,0)', 2, 2), '=IF(R[0]C[-1]="B2",1,0)')
+        self.assertIsNone(relative_form("=SUM(A1:A3)", 3, 2))
+        self.assertEqual(relative_form("=SUM($A$1:$A$3)", 3, 2), "=SUM($A$1:$A$3)")
+
+
+class TestBlockFormula(unittest.TestCase):
+    def test_column(self):
+        block = block_formula('Calc', "$C$2:$C$5", column("=A{row}*$B$1+Data!D{row}", 4, 2), constants)
+        self.assertEqual(block.formula, "=Calc!A2:A5*$B$1+Data!D2:D5")
+        self.assertEqual((block.height, block.width), (4, 1))
+
+    def test_same_cell_throughout(self):
+        block = block_formula('Calc', "$C$2:$C$5", column("=A{row}*B$1", 4, 2), constants)
+        self.assertEqual(block.formula, "=Calc!A2:A5*B$1")
+        self.assertEqual([ref.reference for ref in block.refs], ["Calc!A2:A5"])
+
+    def test_not_copies(self):
+        formulae = column("=A{row}*2", 3, 2) + (("=A5*3",),)
+        self.assertIsNone(block_formula('Calc', "$C$2:$C$5", formulae, constants))
+
+    def test_refers_to_itself(self):
+        self.assertIsNone(block_formula('Calc', "$C$2:$C$5", column("=C{before}+1", 4, 2), constants))
+
+    def test_mixed_range(self):
+        # Constants and formulae: the range's values would be Excel's last calculated ones
+        formulae = column("=A{row}*2", 4, 2)
+        self.assertIsNone(block_formula('Calc', "$C$2:$C$5", formulae, lambda reference: None))
+        self.assertIsNotNone(block_formula('Calc', "$C$2:$C$5", formulae, lambda reference: True))
+
+
+class TestRecurrenceFormula(unittest.TestCase):
+    def test_running_total(self):
+        formulae = (("=A1",),) + column("=C{before}+A{row}", 4, 2)
+        recurrence = recurrence_formula('Calc', "$C$1:$C$5", formulae, constants)
+        self.assertEqual(recurrence.first, ["A1"])
+        self.assertEqual(recurrence.steps, ["recurrence_prev_0+Calc!A2:A5"])
+
+    def test_one_step(self):
+        recurrence = recurrence_formula('Calc', "$C$1:$C$2", (("=A1",), ("=C1+A2",)), constants)
+        self.assertEqual(recurrence.steps, ["recurrence_prev_0+A2"])
+        self.assertEqual(recurrence.refs, [])
+
+    def test_mixed_range(self):
+        formulae = (("=A1",),) + column("=C{before}+A{row}", 4, 2)
+        self.assertIsNone(recurrence_formula('Calc', "$C$1:$C$5", formulae, lambda reference: None))
+
+    def test_not_recurrences(self):
+        for address, formulae in (
+                ("$C$2:$C$5", column("=A{row}*2", 4, 2)),  # no use of the row before
+                ("$C$1:$C$5", (("=C3",),) + column("=C{before}+1", 4, 2)),  # first row uses a later one
+                ("$C$1:$C$5", (("=1",),) + column("=C{row}+1", 4, 2)),  # refers to itself
+                ("$C$1:$C$5", (("=1",),) + column("=SUM($C$1:$C$5)", 4, 2)),
+        ):
+            with self.subTest(formulae=formulae[:2]):
+                self.assertIsNone(recurrence_formula('Calc', address, formulae, constants))
+
+
+if __name__ == '__main__':
+    unittest.main()